@@ -134,6 +134,13 @@ INSTALLED_APPS.extend([
     'task_management',  # enable task management system
 ])
 
+MIDDLEWARE_CLASSES.extend([
+    # request scoped identity map of tasks
+    'task_management.middleware.IdentityMapMiddleware',
+    # buffered action log, see TASK_ACTION_LOG_BUFFERED
+    'task_management.middleware.ActionLogMiddleware',
+])
+
 # email address from which you are sending
 EMAIL_FROM = 'test@test.com'
 
@@ -153,16 +160,90 @@ BROKER_URL = "redis://localhost:6379/0"
 
 CELERY_APP_NAME = 'task_management'
 
+from datetime import timedelta
 from celery.schedules import crontab
 CELERYBEAT_SCHEDULE = {
     'send_deadline_notifications': {
         'task': 'send_deadline_notifications',
         'schedule': crontab(minute='0', hour='12'),
     },
+    'archive_action_log': {
+        'task': 'archive_action_log',
+        'schedule': crontab(minute='0', hour='3'),
+    },
+    'delete_expired_uploads': {
+        'task': 'delete_expired_uploads',
+        'schedule': crontab(minute='30'),
+    },
 }
 # The number of days for which it is necessary to remind about the task
 TASK_DEADLINE_INTERVAL = 7
 
+# Send emails about task changes in digest: one email per recipient by
+# send_email_digests periodic task every TASK_EMAIL_DIGEST_INTERVAL
+# minutes. Messages with urgent verbs are sent immediately.
+TASK_EMAIL_DIGEST = False
+TASK_EMAIL_DIGEST_INTERVAL = 15
+TASK_EMAIL_DIGEST_URGENT_VERBS = (
+    'assigned you task',
+    'reminds about task',
+)
+
+# Timeout in seconds for caching of task owners chain used by permission
+# checks, 0 - cache only within request
+TASK_PERMISSIONS_CACHE_TIMEOUT = 0
+
+# Timeout in seconds for caching of unread notifications count. Use shared
+# cache backend (e.g. memcached) if you run several server processes.
+TASK_NOTIFICATIONS_CACHE_TIMEOUT = 60
+
+# Publish/subscribe backend for notifications stream. RedisPubSub delivers
+# notifications created by celery tasks and other server processes.
+# LocalPubSub works within one process only, e.g. for development server.
+# Every open stream holds a server worker and database connection.
+TASK_NOTIFICATIONS_PUBSUB = 'task_management.pubsub.RedisPubSub'
+TASK_NOTIFICATIONS_REDIS_URL = BROKER_URL
+# Seconds before notifications stream is closed, between keep alive pings
+# and before client reconnects
+TASK_NOTIFICATIONS_STREAM_TIMEOUT = 55
+TASK_NOTIFICATIONS_STREAM_PING = 15
+TASK_NOTIFICATIONS_STREAM_RETRY = 3
+
+# Save action log entries of request by one query at the end of request
+# transaction. Views of POST requests are executed in transaction.
+TASK_ACTION_LOG_BUFFERED = False
+
+# Action log entries older than retention window are moved from database
+# to compressed segment files in archive directory
+TASK_ACTION_LOG_RETENTION_DAYS = 365
+TASK_ACTION_LOG_ARCHIVE_DIR = os.path.join(
+    os.path.dirname(BASE_DIR), 'archive', 'action_log'
+)
+
+# Attachment files are sent by front-end server if it is set:
+# 'X-Sendfile' (apache, lighttpd) or 'X-Accel-Redirect' (nginx). For nginx
+# TASK_ATTACHMENT_ACCEL_PREFIX is internal location of MEDIA_ROOT.
+TASK_ATTACHMENT_SENDFILE = None
+TASK_ATTACHMENT_ACCEL_PREFIX = '/protected/'
+
+# Chunked upload of attachments: chunk size and max file size in bytes,
+# directory of received data, hours after which unfinished uploads are
+# deleted
+TASK_ATTACHMENT_CHUNK_SIZE = 5 * 1024 * 1024
+TASK_ATTACHMENT_MAX_SIZE = 1024 * 1024 * 1024
+TASK_ATTACHMENT_UPLOAD_DIR = os.path.join(MEDIA_ROOT, 'task_attachment',
+                                          'uploads')
+TASK_ATTACHMENT_UPLOAD_EXPIRE = 24
+
+# Cache of rendered task list of every user, TASK_LIST_CACHE is alias of
+# CACHES backend. Timeout in seconds, 0 - lists are not cached. Lists are
+# invalidated in the cache of the process which changed tasks, so with
+# several server processes use shared backend which evicts old entries
+# (memcached, redis with maxmemory-policy allkeys-lru): with per process
+# LocMemCache other processes serve old lists until timeout.
+TASK_LIST_CACHE = 'default'
+TASK_LIST_CACHE_TIMEOUT = 0
+
 # TASK MANAGEMENT SYSTEM CONFIG BLOCK - END
 
 
@@ -172,6 +253,13 @@ except ImportError:
     pass
 
 
+if TASK_EMAIL_DIGEST:
+    CELERYBEAT_SCHEDULE['send_email_digests'] = {
+        'task': 'send_email_digests',
+        'schedule': timedelta(minutes=TASK_EMAIL_DIGEST_INTERVAL),
+    }
+
+
 if DEBUG:
     INTERNAL_IPS = ('127.0.0.1', )
     DISABLE_PANELS = []
@@ -4,11 +4,14 @@ from django.contrib import admin
 from django.views.generic import RedirectView
 from django.views.static import serve
 
-from task_management.views import live_unread_notification_list
+from task_management.views import live_unread_notification_list, \
+    mark_all_as_read, live_notification_delta, live_notification_stream
 
 urlpatterns = [
     url(r'^admin/', admin.site.urls),
-    url(r'^media/(?P<path>.*)$', serve,
+    # attachments are downloaded with permission check, see
+    # task_management:attachment
+    url(r'^media/(?!task_attachment/)(?P<path>.*)$', serve,
         {'document_root': settings.MEDIA_ROOT}),
     url(r'^$', RedirectView.as_view(pattern_name='task_management:list'),
         name='index'),
@@ -16,9 +19,15 @@ urlpatterns = [
     url(r'^task_management/', include('task_management.urls',
                                       namespace='task_management')),
 
-    # override notifications unread list
+    # override notifications unread list and mark all as read
     url(r'^inbox/notifications/api/unread_list/$',
         live_unread_notification_list, name='live_unread_notification_list'),
+    url(r'^inbox/notifications/mark-all-as-read/$', mark_all_as_read,
+        name='mark_all_as_read'),
+    url(r'^inbox/notifications/api/delta/$', live_notification_delta,
+        name='live_notification_delta'),
+    url(r'^inbox/notifications/api/stream/$', live_notification_stream,
+        name='live_notification_stream'),
     url('^inbox/notifications/',
         include('notifications.urls', namespace='notifications')),
 ]
@@ -0,0 +1,43 @@
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+
+_local = threading.local()
+
+
+class ActionLogBuffer(object):
+    """ Collects TaskActionLog entries for saving them by one query """
+    def __init__(self):
+        self.entries = []
+
+    def append(self, entry):
+        self.entries.append(entry)
+
+    def flush(self):
+        if self.entries:
+            type(self.entries[0]).objects.bulk_create(self.entries)
+            self.entries = []
+
+
+def get_action_log_buffer():
+    """ Get buffer of current thread
+    :return: ActionLogBuffer object or None if logging is not buffered
+    """
+    return getattr(_local, 'buffer', None)
+
+
+@contextmanager
+def buffered_action_log():
+    """ Save TaskActionLog entries created in block by one query.
+    Entries are saved at the end of the block in the same transaction as
+    logged changes, so they are committed together.
+    """
+    with transaction.atomic():
+        previous_buffer = get_action_log_buffer()
+        _local.buffer = ActionLogBuffer()
+        try:
+            yield _local.buffer
+            _local.buffer.flush()
+        finally:
+            _local.buffer = previous_buffer
@@ -0,0 +1,198 @@
+import datetime
+import gzip
+import json
+import os
+from itertools import groupby
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models.query import prefetch_related_objects
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from task_management.models import TaskActionLog
+
+FIELDS = ('id', 'actor_id', 'action', 'content_type_id', 'object_id',
+          'time_create')
+
+
+class ActionLogArchive(object):
+    """ Archive of old TaskActionLog entries.
+
+    Entries are stored in segment files by month of creation
+    (YYYY-MM.jsonl.gz). Every archival run appends one gzip member with
+    JSON line per entry to the segment, so written data is never changed.
+    Sidecar index YYYY-MM.index.json keeps offset, id range and time range
+    of every member, readers decompress only members which can contain
+    requested entries.
+    """
+    def __init__(self, directory=None):
+        self.directory = directory or settings.TASK_ACTION_LOG_ARCHIVE_DIR
+
+    def get_segment_path(self, month):
+        return os.path.join(self.directory, '{0}.jsonl.gz'.format(month))
+
+    def get_index_path(self, month):
+        return os.path.join(self.directory, '{0}.index.json'.format(month))
+
+    def get_months(self):
+        if not os.path.isdir(self.directory):
+            return []
+
+        return sorted(name[:-len('.index.json')]
+                      for name in os.listdir(self.directory)
+                      if name.endswith('.index.json'))
+
+    def get_index(self, month):
+        """ Get members of segment
+        :param month: segment name, YYYY-MM
+        :return: list of dicts with offset, length, min_id, max_id, min_time,
+        max_time and count keys
+        """
+        try:
+            with open(self.get_index_path(month)) as index_file:
+                return json.load(index_file)
+        except FileNotFoundError:
+            return []
+
+    def get_members(self):
+        """ Get members of all segments from the newest entries
+        :return: list of tuples (month, member)
+        """
+        members = [(month, member) for month in self.get_months()
+                   for member in self.get_index(month)]
+
+        return sorted(members, key=lambda item: item[1]['max_id'],
+                      reverse=True)
+
+    def get_max_id(self):
+        members = self.get_members()
+
+        return members[0][1]['max_id'] if members else None
+
+    def append(self, month, rows):
+        """ Append rows to segment of month. Index is updated after segment
+        data is synced to disk, so the index never points to lost data.
+        :param month: segment name, YYYY-MM
+        :param rows: list of dicts ordered by id
+        :return:
+        """
+        data = gzip.compress(''.join(
+            json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in rows
+        ).encode())
+
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.get_segment_path(month), 'ab') as segment:
+            offset = segment.tell()
+            segment.write(data)
+            segment.flush()
+            os.fsync(segment.fileno())
+
+        index = self.get_index(month)
+        index.append({
+            'offset': offset,
+            'length': len(data),
+            'min_id': rows[0]['id'],
+            'max_id': rows[-1]['id'],
+            'min_time': min(row['time_create'] for row in rows).isoformat(),
+            'max_time': max(row['time_create'] for row in rows).isoformat(),
+            'count': len(rows),
+        })
+        index_path = self.get_index_path(month)
+        with open(index_path + '.tmp', 'w') as index_file:
+            json.dump(index, index_file)
+            index_file.flush()
+            os.fsync(index_file.fileno())
+        os.replace(index_path + '.tmp', index_path)
+
+    def read_member(self, month, member):
+        """ Read entries of one member
+        :return: list of dicts ordered by id
+        """
+        with open(self.get_segment_path(month), 'rb') as segment:
+            segment.seek(member['offset'])
+            data = gzip.decompress(segment.read(member['length']))
+
+        rows = []
+        for line in data.decode().splitlines():
+            row = json.loads(line)
+            row['time_create'] = parse_datetime(row['time_create'])
+            rows.append(row)
+
+        return rows
+
+    def get_entries(self, before=None, limit=25, since=None, goals=None,
+                    **filters):
+        """ Get archived entries from the newest
+        :param before: return entries with id less than before
+        :param limit: max number of entries
+        :param since: datetime, skip members with older entries only
+        :param goals: set of tuples (content type id, object id), return
+        entries of these action goals only
+        :param filters: field values of entries, e.g. actor_id=1
+        :return: list of TaskActionLog objects, not saved in database
+        """
+        since = since and since.isoformat()
+        entries = []
+        for month, member in self.get_members():
+            if len(entries) >= limit:
+                break
+            if before is not None and member['min_id'] >= before:
+                continue
+            if since and member['max_time'] < since:
+                continue
+
+            for row in reversed(self.read_member(month, member)):
+                if before is not None and row['id'] >= before:
+                    continue
+                goal = (row['content_type_id'], row['object_id'])
+                if goals is not None and goal not in goals:
+                    continue
+                if all(row[name] == value for name, value in filters.items()):
+                    entries.append(TaskActionLog(**row))
+
+        entries = entries[:limit]
+        prefetch_related_objects(entries, ['actor', 'action_goal'])
+
+        return entries
+
+
+def archive_action_log(days=None, batch_size=10000, archive=None):
+    """ Move action log entries older than days to archive
+    :param days: retention window, settings.TASK_ACTION_LOG_RETENTION_DAYS
+    by default
+    :param batch_size: number of entries loaded by one query
+    :param archive: ActionLogArchive object
+    :return: number of archived entries
+    """
+    if days is None:
+        days = settings.TASK_ACTION_LOG_RETENTION_DAYS
+    archive = archive or ActionLogArchive()
+    border = timezone.now() - datetime.timedelta(days=days)
+
+    # entries archived by interrupted run
+    max_id = archive.get_max_id()
+    if max_id is not None:
+        TaskActionLog.objects.filter(id__lte=max_id,
+                                     time_create__lt=border).delete()
+
+    archived = 0
+    while True:
+        rows = list(
+            TaskActionLog.objects.filter(time_create__lt=border)
+            .order_by('id').values(*FIELDS)[:batch_size]
+        )
+        if not rows:
+            return archived
+
+        def get_month(row):
+            return row['time_create'].strftime('%Y-%m')
+
+        for month, month_rows in groupby(rows, get_month):
+            archive.append(month, list(month_rows))
+
+        with transaction.atomic():
+            TaskActionLog.objects.filter(id__lte=rows[-1]['id'],
+                                         time_create__lt=border).delete()
+        archived += len(rows)
@@ -0,0 +1,142 @@
+from django.db import models
+from django.db.models import Case, Value, When
+
+from task_management.action_log import buffered_action_log
+from task_management.helpers import send_messages
+from task_management.list_cache import invalidate_task_lists
+from task_management.models import Task, TaskAssignedUser, TaskAttachment, \
+    TaskActionLog, AttachmentBlob
+from task_management.rollup import StatusRollup
+from task_management.search import get_search_index, get_task_fields
+
+COPY_FIELDS = ('title', 'description', 'creator_id', 'status_description',
+               'criticality', 'date_due', 'parent_id')
+
+
+def get_tree_positions(task, count):
+    """ Make room for count new siblings of task after the last child of
+    task parent or for count new trees if task is root.
+    :param task: Task object
+    :param count: number of new tasks
+    :return: list of tuples (tree_id, lft, level)
+    """
+    manager = Task._tree_manager
+    if task.parent_id is None:
+        tree_id = manager._get_next_tree_id()
+
+        return [(tree_id + i, 1, 0) for i in range(count)]
+
+    parent_rght, parent_level, tree_id = Task.objects.select_for_update()\
+        .values_list('rght', 'level', 'tree_id').get(pk=task.parent_id)
+    manager._create_space(2 * count, parent_rght - 1, tree_id)
+
+    # the cached parent must be moved too, as mptt does for one insert
+    parent = getattr(task, '_parent_cache', None)
+    if parent is not None:
+        manager._post_insert_update_cached_parent_right(parent, 2 * count)
+
+    return [(tree_id, parent_rght + 2 * i, parent_level + 1)
+            for i in range(count)]
+
+
+def bulk_create_tree_nodes(model, nodes, positions):
+    """ Insert nodes at tree positions by one query and set their ids.
+    Tree position (tree_id, lft) is unique, so ids are found by it on
+    databases which do not return ids of bulk inserts.
+    :param model: MPTT model
+    :param nodes: list of unsaved objects
+    :param positions: list of tuples (tree_id, lft, level)
+    :return:
+    """
+    for node, (tree_id, lft, level) in zip(nodes, positions):
+        node.tree_id, node.lft, node.rght, node.level = \
+            tree_id, lft, lft + 1, level
+    model.objects.bulk_create(nodes)
+
+    if nodes[0].pk is None:
+        ids = {
+            (tree_id, lft): pk for tree_id, lft, pk in
+            model.objects.filter(
+                tree_id__in={tree_id for tree_id, _, _ in positions},
+                lft__in={lft for _, lft, _ in positions}
+            ).values_list('tree_id', 'lft', 'id')
+        }
+        for node in nodes:
+            node.pk = ids[(node.tree_id, node.lft)]
+
+
+def create_task_copies(task, owners, actor, attachments=()):
+    """ Create copy of task for every owner by fixed number of queries.
+    Every copy ends up as task assigned by its own save: sibling of task,
+    pending acceptance by owner, with the same attachments, logged and
+    announced to owner.
+    :param task: saved Task object
+    :param owners: list of User objects
+    :param actor: User object who assigns tasks
+    :param attachments: saved TaskAttachment objects of task to share
+    :return: list of created tasks
+    """
+    if not owners:
+        return []
+
+    with buffered_action_log():
+        copies = [Task(owner=owner, status=Task.STATUS_PENDING,
+                       **{name: getattr(task, name) for name in COPY_FIELDS})
+                  for owner in owners]
+        bulk_create_tree_nodes(Task, copies,
+                               get_tree_positions(task, len(copies)))
+        for copy in copies:
+            # as remember_task_status does for loaded tasks
+            copy.saved_status = copy.status
+            copy.saved_owner_id = copy.owner_id
+            copy.saved_search_fields = get_task_fields(copy)
+
+        # every copy starts its own chain of assignments
+        tree_id = TaskAssignedUser._tree_manager._get_next_tree_id()
+        assignments = [TaskAssignedUser(user=copy.owner, task=copy)
+                       for copy in copies]
+        bulk_create_tree_nodes(
+            TaskAssignedUser, assignments,
+            [(tree_id + i, 1, 0) for i in range(len(copies))]
+        )
+        for copy, assignment in zip(copies, assignments):
+            copy.set_current_assignment(assignment)
+        Task.objects.filter(pk__in=[copy.pk for copy in copies]).update(
+            current_assignment=Case(
+                *[When(pk=copy.pk, then=Value(copy.current_assignment_id))
+                  for copy in copies],
+                output_field=models.IntegerField()
+            )
+        )
+
+        # stored files are shared
+        copy_attachments = [
+            TaskAttachment(task=copy, attachment=attachment.attachment.name,
+                           original_name=attachment.original_name)
+            for copy in copies for attachment in attachments
+        ]
+        TaskAttachment.objects.bulk_create(copy_attachments)
+        AttachmentBlob.add_references(
+            [attachment.attachment.name for attachment in copy_attachments]
+        )
+
+        get_search_index().update(copies)
+        invalidate_task_lists(copies)
+
+        # copies are siblings, parent is recalculated once
+        rollup = StatusRollup()
+        rollup.add(copies[0], created=True)
+        rollup.run()
+
+        messages = []
+        for copy in copies:
+            if attachments:
+                TaskActionLog.log(actor, 'add attachments to task', copy)
+                messages.append((actor, 'add attachments to task', copy,
+                                 [copy.owner, task.creator]))
+            TaskActionLog.log(actor, 'create task', copy)
+            messages.append((actor, 'assigned you task', copy, [copy.owner]))
+
+        send_messages(messages)
+
+    return copies
@@ -0,0 +1,67 @@
+from collections import defaultdict
+
+from task_management.action_log import buffered_action_log
+from task_management.helpers import send_coalesced_messages
+from task_management.models import TaskAssignedUser, TaskActionLog
+from task_management.rollup import deferred_rollup
+
+ACTION_ACCEPT = 'accept'
+ACTION_REJECT = 'reject'
+ACTION_STATUS = 'status'
+
+
+def get_owners_chains(tasks):
+    """ Load owners chains of tasks with users by one query
+    :param tasks: list of Task objects
+    :return: dict task id -> list of TaskAssignedUser objects ordered by
+    assign time
+    """
+    chains = defaultdict(list)
+    for assignment in TaskAssignedUser.objects.filter(task__in=tasks)\
+            .select_related('user').order_by('task_id', 'time_assign'):
+        chains[assignment.task_id].append(assignment)
+
+    return chains
+
+
+def change_tasks(actor, tasks, action, chains, status=None,
+                 description=None):
+    """ Accept, reject or change status of tasks in one transaction.
+    Every task is saved as by its own view, but ancestors of all tasks are
+    recalculated once at the end, action log is saved by one query and
+    every recipient gets one message about all its tasks.
+    :param actor: User object who changes tasks
+    :param tasks: list of Task objects with loaded current assignments
+    :param action: ACTION_ACCEPT, ACTION_REJECT or ACTION_STATUS
+    :param chains: owners chains of tasks, see get_owners_chains
+    :param status: new status for ACTION_STATUS
+    :param description: reason of ACTION_REJECT
+    :return:
+    """
+    messages = []
+    with buffered_action_log(), deferred_rollup():
+        for task in tasks:
+            if action == ACTION_STATUS:
+                task.status = status
+                task.save()
+                TaskActionLog.log(actor, 'update task', task)
+                verb = 'change status of task to {0}'.format(
+                    task.get_status_display()
+                )
+            else:
+                # change_assign_status saves task with new status
+                assignment = task.current_assignment
+                assignment.assign_accept = action == ACTION_ACCEPT
+                if action == ACTION_REJECT:
+                    assignment.assign_description = description
+                assignment.save()
+                verb = '{0} task'.format(action)
+                # as AcceptTaskView and RejectTaskView log them
+                TaskActionLog.log(actor, verb, assignment
+                                  if action == ACTION_REJECT else task)
+
+            recipients = {assignment.user for assignment in chains[task.id]}
+            recipients.add(task.creator)
+            messages.append((verb, task, recipients))
+
+        send_coalesced_messages(actor, messages)
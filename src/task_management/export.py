@@ -0,0 +1,148 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from task_management.models import Task, TaskComment, TaskAssignedUser, \
+    TaskActionLog
+
+TREE_FIELDS = ('parent_id', 'lft', 'rght', 'tree_id', 'level')
+
+
+class Export(object):
+    """ Description of exported table: exported fields and lookups of
+    filters. Filter lookup None means that table cannot be filtered by it.
+    """
+    def __init__(self, model, fields, user, status, tree_id, time):
+        self.model = model
+        self.fields = fields
+        self.lookups = {'user': user, 'status': status, 'tree_id': tree_id,
+                        'time': time}
+
+    def get_queryset(self, user=None, status=None, tree_id=None, since=None,
+                     until=None):
+        """ Get filtered queryset
+        :param user: User object
+        :param status: task status
+        :param tree_id: id of task tree
+        :param since: datetime, rows created at or after
+        :param until: datetime, rows created before
+        :return: QuerySet
+        """
+        queryset = self.model._default_manager.all()
+        if user is not None and self.lookups['user']:
+            condition = Q()
+            for lookup in self.lookups['user']:
+                condition |= Q(**{lookup: user})
+            queryset = queryset.filter(condition)
+        if status is not None and self.lookups['status']:
+            queryset = queryset.filter(**{self.lookups['status']: status})
+        if tree_id is not None and self.lookups['tree_id']:
+            queryset = queryset.filter(**{self.lookups['tree_id']: tree_id})
+        if since is not None:
+            queryset = queryset.filter(
+                **{self.lookups['time'] + '__gte': since}
+            )
+        if until is not None:
+            queryset = queryset.filter(
+                **{self.lookups['time'] + '__lt': until}
+            )
+
+        return queryset
+
+
+EXPORTS = {
+    'task': Export(
+        Task,
+        ('id', 'title', 'description', 'creator_id', 'owner_id', 'status',
+         'status_description', 'criticality', 'date_due', 'time_create',
+         'time_update') + TREE_FIELDS,
+        user=('creator', 'owner'), status='status', tree_id='tree_id',
+        time='time_create'
+    ),
+    'comment': Export(
+        TaskComment,
+        ('id', 'task_id', 'author_id', 'message', 'time_create',
+         'time_update'),
+        user=('author', ), status='task__status', tree_id='task__tree_id',
+        time='time_create'
+    ),
+    'assigned_user': Export(
+        TaskAssignedUser,
+        ('id', 'task_id', 'user_id', 'time_assign', 'assign_accept',
+         'assign_description') + TREE_FIELDS,
+        user=('user', ), status='task__status', tree_id='task__tree_id',
+        time='time_assign'
+    ),
+    'action_log': Export(
+        TaskActionLog,
+        ('id', 'actor_id', 'action', 'content_type_id', 'object_id',
+         'time_create'),
+        user=('actor', ), status=None, tree_id=None, time='time_create'
+    ),
+}
+
+
+def iterate_rows(queryset, fields, chunk_size=1000):
+    """ Iterate rows by chunks in id order. Every chunk is selected by
+    id of the last row of previous chunk, so memory does not depend on
+    table size and deep chunks are not slower than the first.
+    :param queryset: QuerySet
+    :param fields: names of fields
+    :param chunk_size: number of rows selected by one query
+    :return: generator of tuples
+    """
+    queryset = queryset.order_by('id')
+    last_id = None
+    while True:
+        chunk = queryset
+        if last_id is not None:
+            chunk = chunk.filter(id__gt=last_id)
+
+        count = 0
+        for row in chunk.values_list(*fields)[:chunk_size].iterator():
+            count += 1
+            last_id = row[0]
+            yield row
+
+        if count < chunk_size:
+            return
+
+
+class Echo(object):
+    """ File-like object which returns written value """
+    def write(self, value):
+        return value
+
+
+def to_csv(fields, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def to_jsonl(fields, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(fields, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+FORMATS = {
+    'csv': (to_csv, 'text/csv'),
+    'jsonl': (to_jsonl, 'application/x-ndjson'),
+}
+
+
+def export(name, export_format, **filters):
+    """ Export table
+    :param name: key of EXPORTS
+    :param export_format: key of FORMATS
+    :param filters: filters of Export.get_queryset
+    :return: generator of strings
+    """
+    table = EXPORTS[name]
+    serialize = FORMATS[export_format][0]
+    rows = iterate_rows(table.get_queryset(**filters), table.fields)
+
+    return serialize(table.fields, rows)
@@ -0,0 +1,404 @@
+import datetime
+import json
+import os
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from task_management.list_cache import invalidate_task_lists
+from task_management.models import Task, TaskAssignedUser, TaskComment, \
+    TaskAttachment, AttachmentBlob
+from task_management.rollup import rollup_statuses
+from task_management.search import get_search_index
+
+
+class ForestEncoder(DjangoJSONEncoder):
+    """ Keeps microseconds of times, so imported times are equal """
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+
+        return super(ForestEncoder, self).default(o)
+
+
+def iterate_forest(queryset, chunk_size=1000):
+    """ Iterate tasks by chunks in tree order, so parent comes before its
+    children. Every chunk is selected after the last task of previous
+    chunk by (tree_id, lft) index.
+    :param queryset: Task queryset
+    :param chunk_size: number of tasks selected by one query
+    :return: generator of lists of Task objects
+    """
+    queryset = queryset.select_related('creator', 'owner')\
+        .order_by('tree_id', 'lft')
+    last = None
+    while True:
+        chunk = queryset
+        if last is not None:
+            chunk = chunk.filter(
+                Q(tree_id__gt=last.tree_id) |
+                Q(tree_id=last.tree_id, lft__gt=last.lft)
+            )
+
+        tasks = list(chunk[:chunk_size])
+        if tasks:
+            yield tasks
+        if len(tasks) < chunk_size:
+            return
+        last = tasks[-1]
+
+
+def export_forest(queryset=None, chunk_size=1000):
+    """ Export task trees to JSON lines, one task per line with its owners
+    chain, comments and attachments. Parent comes before its children,
+    task which parent is not exported becomes root. Users are referenced
+    by username, attachments by storage name, files are not exported.
+    :param queryset: Task queryset, all tasks by default
+    :param chunk_size: number of tasks loaded by one query
+    :return: generator of strings
+    """
+    if queryset is None:
+        queryset = Task.objects.all()
+
+    exported = set()
+    for tasks in iterate_forest(queryset, chunk_size):
+        assignments = defaultdict(list)
+        for assignment in TaskAssignedUser.objects.filter(task__in=tasks)\
+                .select_related('user').order_by('task_id', 'lft'):
+            assignments[assignment.task_id].append({
+                'user': assignment.user.username,
+                'accept': assignment.assign_accept,
+                'description': assignment.assign_description,
+                'time_assign': assignment.time_assign,
+            })
+
+        comments = defaultdict(list)
+        for comment in TaskComment.objects.filter(task__in=tasks)\
+                .select_related('author').order_by('id'):
+            comments[comment.task_id].append({
+                'author': comment.author.username,
+                'message': comment.message,
+                'time_create': comment.time_create,
+                'time_update': comment.time_update,
+            })
+
+        attachments = defaultdict(list)
+        for attachment in TaskAttachment.objects.filter(task__in=tasks)\
+                .order_by('id'):
+            attachments[attachment.task_id].append({
+                'name': attachment.attachment.name,
+                'original_name': attachment.file_name(),
+            })
+
+        for task in tasks:
+            exported.add(task.id)
+            yield json.dumps({
+                'id': task.id,
+                'parent': task.parent_id
+                if task.parent_id in exported else None,
+                'title': task.title,
+                'description': task.description,
+                'creator': task.creator.username,
+                'owner': task.owner.username if task.owner else None,
+                'status': task.status,
+                'status_description': task.status_description,
+                'criticality': task.criticality,
+                'date_due': task.date_due,
+                'time_create': task.time_create,
+                'time_update': task.time_update,
+                'assignments': assignments[task.id],
+                'comments': comments[task.id],
+                'attachments': attachments[task.id],
+            }, cls=ForestEncoder) + '\n'
+
+
+def parse_time(value):
+    """ Parse exported time, current time if it is not set """
+    if not value:
+        return timezone.now()
+
+    value = parse_datetime(value)
+    if settings.USE_TZ and timezone.is_naive(value):
+        value = timezone.make_aware(value)
+
+    return value
+
+
+def lock_tables(models):
+    """ Lock tables of models against inserts of other transactions until
+    the end of current transaction. PostgreSQL locks the tables, SQLite
+    locks the whole database by the first write of transaction. Other
+    databases are not supported: rows with the same ids could be inserted
+    concurrently.
+    :param models: list of model classes
+    :return:
+    """
+    tables = [connection.ops.quote_name(model._meta.db_table)
+              for model in models]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # reads of tables are not blocked
+            cursor.execute('LOCK TABLE {0} IN EXCLUSIVE MODE'.format(
+                ', '.join(tables)))
+        elif connection.vendor == 'sqlite':
+            for table in tables:
+                cursor.execute('UPDATE {0} SET id = id WHERE 1 = 0'.format(
+                    table))
+        else:
+            raise ValueError('Import is not supported by {0} database'
+                             .format(connection.vendor))
+
+
+def insert_raw(model, objs):
+    """ Insert objects as bulk_create does, but values of auto_now and
+    auto_now_add fields are inserted as they are, as loaddata does. Fields
+    of model are not changed, so saves of other threads are not affected.
+    :param model: model class
+    :param objs: list of model objects, all with primary keys or without
+    :return:
+    """
+    if not objs:
+        return
+
+    fields = [field for field in model._meta.concrete_fields
+              if objs[0].pk is not None or field != model._meta.pk]
+    batch_size = max(connection.ops.bulk_batch_size(fields, objs), 1)
+    for start in range(0, len(objs), batch_size):
+        model._base_manager._insert(objs[start:start + batch_size],
+                                    fields=fields, raw=True)
+
+
+class ForestImport(object):
+    """ Import of task trees exported by export_forest.
+
+    File is read twice. The first pass checks references and computes
+    tree fields of every task and rolled up statuses of parents in memory.
+    The second pass inserts tasks, owners chains, comments and attachments
+    by one query per model in batches, with primary keys allocated after
+    existing rows, so parent and assignment links are known before insert.
+    Exported times are inserted as they are. Signals
+    are not sent: search index, attachment references and task list
+    caches are updated per batch, no notifications are sent.
+    """
+    def __init__(self, path, batch_size=1000):
+        self.path = path
+        self.batch_size = batch_size
+        self.users = {}  # username -> user id
+        self.parents = []  # position of parent task in file or None
+        self.statuses = []
+        self.tree_fields = []  # tuples (tree number, lft, rght, level)
+        self.counts = dict.fromkeys(
+            ('tasks', 'assignments', 'comments', 'attachments'), 0)
+
+    def read_records(self):
+        with open(self.path) as data:
+            for line in data:
+                if line.strip():
+                    yield json.loads(line)
+
+    def scan(self):
+        """ Check file and compute tree fields and statuses
+        :return:
+        """
+        positions = {}  # exported task id -> position
+        usernames = set()
+        for position, record in enumerate(self.read_records()):
+            parent = record.get('parent')
+            if record['id'] in positions:
+                raise ValueError('Task {0} is repeated'.format(record['id']))
+            if parent is not None and parent not in positions:
+                raise ValueError('Parent {0} of task {1} must precede it'
+                                 .format(parent, record['id']))
+
+            positions[record['id']] = position
+            self.parents.append(None if parent is None
+                                else positions[parent])
+            self.statuses.append(record.get('status', Task.STATUS_DRAFT))
+            usernames.add(record['creator'])
+            usernames.add(record.get('owner'))
+            usernames.update(assignment['user']
+                             for assignment in record.get('assignments', []))
+            usernames.update(comment['author']
+                             for comment in record.get('comments', []))
+
+        usernames.discard(None)
+        self.users = dict(User.objects.filter(username__in=usernames)
+                          .values_list('username', 'id'))
+        missing = usernames - set(self.users)
+        if missing:
+            raise ValueError('Unknown users: {0}'.format(
+                ', '.join(sorted(missing))))
+
+        self.tree_fields = self.get_tree_fields(self.parents)
+        rollup_statuses(self.parents, self.statuses)
+
+    @staticmethod
+    def get_tree_fields(parents):
+        """ Number trees in depth first order, as MPTT does
+        :param parents: list of parent positions, parent precedes child
+        :return: list of tuples (tree number, lft, rght, level)
+        """
+        children = [[] for _ in parents]
+        roots = []
+        for position, parent in enumerate(parents):
+            if parent is None:
+                roots.append(position)
+            else:
+                children[parent].append(position)
+
+        fields = [None] * len(parents)
+        for tree_number, root in enumerate(roots):
+            counter = 1
+            lfts = {root: counter}
+            stack = [(root, iter(children[root]))]
+            while stack:
+                node, node_children = stack[-1]
+                child = next(node_children, None)
+                counter += 1
+                if child is not None:
+                    lfts[child] = counter
+                    stack.append((child, iter(children[child])))
+                else:
+                    stack.pop()
+                    fields[node] = (tree_number, lfts.pop(node), counter,
+                                    len(stack))
+
+        return fields
+
+    def run(self):
+        """ Import file in one transaction
+        :return: dict with numbers of imported objects
+        """
+        self.scan()
+
+        with transaction.atomic():
+            # ids and tree ids from max of tables must stay free until
+            # commit
+            lock_tables([Task, TaskAssignedUser])
+            self.task_id = (Task.objects.aggregate(Max('id'))['id__max']
+                            or 0) + 1
+            self.tree_id = Task._tree_manager._get_next_tree_id()
+            self.assignment_id = (TaskAssignedUser.objects.aggregate(
+                Max('id'))['id__max'] or 0) + 1
+            self.assignment_tree_id = \
+                TaskAssignedUser._tree_manager._get_next_tree_id()
+
+            records = self.read_records()
+            position = 0
+            while True:
+                batch = list(islice(records, self.batch_size))
+                if not batch:
+                    break
+                self.save_batch(batch, position)
+                position += len(batch)
+
+            # sequences must continue after explicit primary keys
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(
+                        no_style(), [Task, TaskAssignedUser]):
+                    cursor.execute(sql)
+
+            invalidate_task_lists(user_ids=self.users.values())
+
+        return self.counts
+
+    def save_batch(self, records, start):
+        """ Insert batch of tasks with their related rows
+        :param records: list of dicts from file
+        :param start: position of the first task in file
+        :return:
+        """
+        tasks = []
+        assignments = []
+        comments = []
+        attachments = []
+        for position, record in enumerate(records, start):
+            parent = self.parents[position]
+            tree_number, lft, rght, level = self.tree_fields[position]
+            task = Task(
+                id=self.task_id + position,
+                parent_id=None if parent is None else self.task_id + parent,
+                title=record['title'],
+                description=record.get('description', ''),
+                creator_id=self.users[record['creator']],
+                owner_id=self.users.get(record.get('owner')),
+                status=self.statuses[position],
+                status_description=record.get('status_description', ''),
+                criticality=record.get('criticality',
+                                       Task.CRITICALITY_MEDIUM),
+                date_due=parse_date(record['date_due'])
+                if record.get('date_due') else None,
+                time_create=parse_time(record.get('time_create')),
+                time_update=parse_time(record.get('time_update')),
+                tree_id=self.tree_id + tree_number, lft=lft, rght=rght,
+                level=level,
+            )
+            tasks.append(task)
+
+            # owners chain is one branch of its own tree
+            chain = record.get('assignments', [])
+            assignment = None
+            for chain_level, item in enumerate(chain):
+                assignment = TaskAssignedUser(
+                    id=self.assignment_id,
+                    task_id=task.id,
+                    user_id=self.users[item['user']],
+                    parent_id=assignment.id if assignment else None,
+                    assign_accept=item.get('accept'),
+                    assign_description=item.get('description'),
+                    time_assign=parse_time(item.get('time_assign')),
+                    tree_id=self.assignment_tree_id, lft=chain_level + 1,
+                    rght=2 * len(chain) - chain_level, level=chain_level,
+                )
+                assignments.append(assignment)
+                self.assignment_id += 1
+            if chain:
+                task.set_current_assignment(assignment)
+                self.assignment_tree_id += 1
+
+            comments.extend(
+                TaskComment(task_id=task.id,
+                            author_id=self.users[item['author']],
+                            message=item['message'],
+                            time_create=parse_time(item.get('time_create')),
+                            time_update=parse_time(item.get('time_update')))
+                for item in record.get('comments', [])
+            )
+            attachments.extend(
+                TaskAttachment(task_id=task.id, attachment=item['name'],
+                               original_name=item.get('original_name') or
+                               os.path.basename(item['name']))
+                for item in record.get('attachments', [])
+            )
+
+        # exported times are kept
+        insert_raw(Task, tasks)
+        insert_raw(TaskAssignedUser, assignments)
+        insert_raw(TaskComment, comments)
+        TaskAttachment.objects.bulk_create(attachments)
+        AttachmentBlob.add_references([attachment.attachment.name
+                                       for attachment in attachments])
+        get_search_index().update(tasks)
+
+        self.counts['tasks'] += len(tasks)
+        self.counts['assignments'] += len(assignments)
+        self.counts['comments'] += len(comments)
+        self.counts['attachments'] += len(attachments)
+
+
+def import_forest(path, batch_size=1000):
+    """ Import task trees from file of export_forest
+    :param path: file path
+    :param batch_size: number of tasks inserted by one query
+    :return: dict with numbers of imported tasks, assignments, comments
+    and attachments
+    """
+    return ForestImport(path, batch_size).run()
@@ -1,10 +1,14 @@
 from django import forms
+from django.conf import settings
 from django.contrib.auth.models import User
 
+from task_management.assign import create_task_copies
+from task_management.batch import ACTION_ACCEPT, ACTION_REJECT, \
+    ACTION_STATUS
 from task_management.fields import MultiFileField
 from task_management.helpers import send_message
 from task_management.models import Task, TaskAttachment, TaskComment, \
-    TaskAssignedUser, TaskActionLog
+    TaskAssignedUser, TaskActionLog, AttachmentUpload
 
 
 class TaskForm(forms.ModelForm):
@@ -57,15 +61,19 @@ class TaskForm(forms.ModelForm):
     def _save_attachment(self, task):
         """ Save attachment files
         :param task: Task object
-        :return:
+        :return: list of created TaskAttachment objects
         """""
-        for each in self.cleaned_data['attachments']:
+        attachments = [
             TaskAttachment.objects.create(attachment=each, task=task)
+            for each in self.cleaned_data['attachments']
+        ]
 
-        if self.cleaned_data['attachments']:
+        if attachments:
             TaskActionLog.log(self.user, 'add attachments to task', task)
             send_message(self.user, 'add attachments to task', task)
 
+        return attachments
+
     def _delete_attachment(self, task):
         """ Delete checked attachment files
         :param task: Task object
@@ -74,23 +82,15 @@ class TaskForm(forms.ModelForm):
         for each in self.cleaned_data.get('delete_attachment', []):
             each.delete()
 
-    def _save_multi_assign(self, assigned_to, task):
+    def _save_multi_assign(self, assigned_to, task, attachments=()):
         """ Create separate task for every assigned user except first.
-        :param assigned_to:
-        :param task:
-        :return:
+        Copies are created in bulk, see create_task_copies.
+        :param assigned_to: list of User objects
+        :param task: saved Task object
+        :param attachments: attachments of task to share with copies
+        :return: list of created tasks
         """
-        for owner in assigned_to:
-            task_duplicate = task
-            task_duplicate.pk = None
-            task_duplicate.owner = owner
-            task_duplicate.save()
-            self._save_attachment(task_duplicate)
-
-            TaskActionLog.log(self.user, 'create task', task_duplicate)
-            if task_duplicate.owner:
-                send_message(self.user, 'assigned you task', task_duplicate,
-                             [task_duplicate.owner])
+        return create_task_copies(task, assigned_to, self.user, attachments)
 
     def save(self, commit=True):
         """ Save task form to object
@@ -115,10 +115,10 @@ class TaskForm(forms.ModelForm):
         if need_send_message:
             send_message(self.user, 'assigned you task', task, [task.owner])
 
-        self._save_attachment(task)
+        attachments = self._save_attachment(task)
         self._delete_attachment(task)
 
-        self._save_multi_assign(assigned_to, task)
+        self._save_multi_assign(assigned_to, task, attachments)
 
         return task
 
@@ -170,3 +170,120 @@ class ReassignTaskForm(forms.ModelForm):
             queryset=User.objects.all().exclude(id__in=owners_chain_id),
             required=True, label='Re-assign to'
         )
+
+
+class ExportFilterForm(forms.Form):
+    """ Form for filters of data export """
+    user = forms.ModelChoiceField(queryset=User.objects.all(), required=False)
+    status = forms.TypedChoiceField(choices=Task.STATUS_CHOICES, coerce=int,
+                                    empty_value=None, required=False)
+    tree_id = forms.IntegerField(required=False)
+    since = forms.DateTimeField(required=False)
+    until = forms.DateTimeField(required=False)
+
+
+class TaskFilterForm(forms.Form):
+    """ Form for filters and sorting of task list. Every filter and sort
+    order is served by an index of Task table.
+    """
+    SORT_CHOICES = (
+        ('status', 'Status'),
+        ('-status', 'Status, descending'),
+        ('criticality', 'Criticality'),
+        ('-criticality', 'Criticality, descending'),
+        ('date_due', 'Due date'),
+        ('-date_due', 'Due date, descending'),
+        ('time_update', 'Time of update'),
+        ('-time_update', 'Time of update, descending'),
+    )
+
+    status = forms.TypedChoiceField(choices=Task.STATUS_CHOICES, coerce=int,
+                                    empty_value=None, required=False)
+    criticality = forms.TypedChoiceField(choices=Task.CRITICALITY_CHOICES,
+                                         coerce=int, empty_value=None,
+                                         required=False)
+    owner = forms.ModelChoiceField(queryset=User.objects.all(),
+                                   required=False)
+    creator = forms.ModelChoiceField(queryset=User.objects.all(),
+                                     required=False)
+    due_since = forms.DateField(required=False)
+    due_until = forms.DateField(required=False)
+    updated_since = forms.DateTimeField(required=False)
+    sort = forms.ChoiceField(choices=SORT_CHOICES, required=False)
+
+    def has_filters(self):
+        return any(value not in (None, '')
+                   for value in self.cleaned_data.values())
+
+    def filter_queryset(self, queryset):
+        """ Apply filters and sorting of valid form
+        :param queryset: Task queryset
+        :return: Task queryset
+        """
+        data = self.cleaned_data
+        for name in ('status', 'criticality', 'owner', 'creator'):
+            if data[name] is not None:
+                queryset = queryset.filter(**{name: data[name]})
+        if data['due_since'] is not None:
+            queryset = queryset.filter(date_due__gte=data['due_since'])
+        if data['due_until'] is not None:
+            queryset = queryset.filter(date_due__lte=data['due_until'])
+        if data['updated_since'] is not None:
+            queryset = queryset.filter(time_update__gte=data['updated_since'])
+
+        if data['sort']:
+            # id makes order stable for pagination
+            id_order = '-id' if data['sort'].startswith('-') else 'id'
+
+            return queryset.order_by(data['sort'], id_order)
+
+        return queryset.order_by('tree_id', 'lft')
+
+
+class TaskBatchForm(forms.Form):
+    """ Form for accept, reject or status change of several tasks """
+    ACTION_CHOICES = (
+        (ACTION_ACCEPT, 'Accept'),
+        (ACTION_REJECT, 'Reject'),
+        (ACTION_STATUS, 'Change status'),
+    )
+
+    action = forms.ChoiceField(choices=ACTION_CHOICES)
+    tasks = forms.ModelMultipleChoiceField(
+        queryset=Task.objects.select_related('creator', 'current_assignment')
+        .order_by('tree_id', 'lft')
+    )
+    status = forms.TypedChoiceField(
+        choices=[i for i in Task.STATUS_CHOICES
+                 if Task.is_status_can_change(i[0])],
+        coerce=int, empty_value=None, required=False
+    )
+    assign_description = forms.CharField(widget=forms.Textarea,
+                                         required=False)
+
+    def clean(self):
+        cleaned_data = super(TaskBatchForm, self).clean()
+        if cleaned_data.get('action') == ACTION_STATUS and \
+                cleaned_data.get('status') is None:
+            self.add_error('status', 'Status is required to change status')
+
+        return cleaned_data
+
+
+class AttachmentUploadForm(forms.ModelForm):
+    """ Form for start chunked upload of attachment """
+    class Meta:
+        model = AttachmentUpload
+        fields = ['file_name', 'size']
+
+    def clean_size(self):
+        size = self.cleaned_data['size']
+        if size < 0:
+            raise forms.ValidationError('File size cannot be negative')
+        if size > settings.TASK_ATTACHMENT_MAX_SIZE:
+            raise forms.ValidationError(
+                'File size must be at most {0} bytes'.format(
+                    settings.TASK_ATTACHMENT_MAX_SIZE)
+            )
+
+        return size
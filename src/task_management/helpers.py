@@ -1,11 +1,24 @@
 import datetime
-from django.core.mail import send_mail
+import logging
+from collections import OrderedDict
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.mail import send_mail, send_mass_mail
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
 from conf.app_celery import app
 
-from notifications.signals import notify
+from notifications.models import Notification
 
-from task_management.models import Task
+from task_management import archive, upload
+from task_management.models import Task, TaskDigestMessage, \
+    TaskAssignedUser
+from task_management.pubsub import publish_notifications
+
+logger = logging.getLogger(__name__)
 
 
 def send_message(actor, verb, task, recipients=()):
@@ -16,23 +29,144 @@ def send_message(actor, verb, task, recipients=()):
     :param recipients: recipients list
     :return:
     """
-    if not recipients:
-        recipients = get_recipients_by_task(task)
+    send_messages([(actor, verb, task, recipients)])
 
-    # actor not receive messages about self activities
-    recipients = [user for user in recipients if user != actor]
 
-    email_msg = "{actor} {verb} <a href='{url}'>{task}</a>".format(
-        actor=actor, verb=verb, url=task.get_absolute_url(),
-        task=task.title
-    )
+def send_messages(messages):
+    """ Send messages to notification and email. Notifications of all
+    messages are created by one query and emails are sent by one delay task.
+    :param messages: list of tuples (actor, verb, task, recipients), see
+    send_message
+    :return: number of recipients
+    """
+    notifications = []
+    emails = []
+    digest_messages = []
+    timestamp = timezone.now()
+    for actor, verb, task, recipients in messages:
+        if not recipients:
+            recipients = get_recipients_by_task(task)
+
+        # actor not receive messages about self activities
+        recipients = [user for user in recipients if user != actor]
+
+        email_msg = "{actor} {verb} <a href='{url}'>{task}</a>".format(
+            actor=actor, verb=verb, url=task.get_absolute_url(),
+            task=task.title
+        )
+
+        for recipient in recipients:
+            notifications.append(Notification(
+                recipient=recipient,
+                actor_content_type=ContentType.objects.get_for_model(actor),
+                actor_object_id=actor.pk,
+                verb=verb,
+                target_content_type=ContentType.objects.get_for_model(task),
+                target_object_id=task.pk,
+                timestamp=timestamp,
+            ))
+            if is_digest_verb(verb):
+                digest_messages.append(TaskDigestMessage(
+                    recipient=recipient.email, message=email_msg
+                ))
+            else:
+                emails.append((recipient.email, email_msg))
+
+    if notifications:
+        # send notifications
+        Notification.objects.bulk_create(notifications)
+        recipient_ids = {notification.recipient_id
+                         for notification in notifications}
+        clear_unread_notifications_state(recipient_ids)
+        # stream reads notifications, so publish them after commit
+        transaction.on_commit(lambda: publish_notifications(recipient_ids))
+
+        # send mails via delay task
+        if emails:
+            send_emails.delay(emails)
+
+        # mails for digest are sent by send_email_digests periodic task
+        if digest_messages:
+            TaskDigestMessage.objects.bulk_create(digest_messages)
+
+        # one insert, publish and delay task instead of one per message
+        logger.debug('Sent %d notifications to %d recipients, saved %d '
+                     'inserts, %d publishes and %d email tasks',
+                     len(notifications), len(recipient_ids),
+                     len(notifications) - 1 + max(len(digest_messages) - 1, 0),
+                     len(notifications) - 1, max(len(emails) - 1, 0))
+
+    return len(notifications)
+
+
+def send_coalesced_messages(actor, messages):
+    """ Send one message per recipient about several tasks. Recipient of
+    one task gets the usual message, recipient of several tasks gets one
+    message with their number and link to the first task.
+    :param actor: the object that performed the activities
+    :param messages: list of tuples (verb, task, recipients)
+    :return: number of recipients
+    """
+    recipient_tasks = OrderedDict()  # recipient -> list of (verb, task)
+    for verb, task, recipients in messages:
+        for recipient in recipients:
+            recipient_tasks.setdefault(recipient, []).append((verb, task))
+
+    coalesced = []
+    for recipient, tasks in recipient_tasks.items():
+        verb, task = tasks[0]
+        if len(tasks) > 1:
+            verb = 'updated {0} tasks, including'.format(len(tasks))
+        coalesced.append((actor, verb, task, [recipient]))
 
-    for recipient in recipients:
-        # send notification
-        notify.send(actor, recipient=recipient, verb=verb, target=task)
+    return send_messages(coalesced)
 
-        # send mail via delay task
-        send_email.delay(recipient.email, email_msg)
+
+def get_unread_notifications_cache_key(user_id):
+    return 'task_management:unread_notifications:{0}'.format(user_id)
+
+
+def get_unread_notifications_state(user):
+    """ Get unread notifications count and version of user inbox. State is
+    cached until any notification of user changes. Version is derived from
+    unread notifications, so it is the same after cache expiration if
+    inbox is not changed.
+    :param user: User object
+    :return: dict with count and version keys
+    """
+    cache_key = get_unread_notifications_cache_key(user.pk)
+    state = cache.get(cache_key)
+    if state is None:
+        unread = user.notifications.unread().order_by().aggregate(
+            count=Count('id'), max_id=Max('id'), id_sum=Sum('id')
+        )
+        state = {
+            'count': unread['count'],
+            # ids sum changes when notification is read, deleted or added
+            'version': '{count}.{max_id}.{id_sum}'.format(**unread),
+        }
+        cache.set(cache_key, state,
+                  settings.TASK_NOTIFICATIONS_CACHE_TIMEOUT)
+
+    return state
+
+
+def clear_unread_notifications_state(user_ids):
+    """ Clear cached unread notifications state of users
+    :param user_ids: list of user ids
+    :return:
+    """
+    cache.delete_many([get_unread_notifications_cache_key(user_id)
+                       for user_id in user_ids])
+
+
+def is_digest_verb(verb):
+    """ Check whether email is sent in digest or immediately
+    :param verb: message verb
+    :return: boolean
+    """
+    return settings.TASK_EMAIL_DIGEST and \
+        verb not in settings.TASK_EMAIL_DIGEST_URGENT_VERBS
 
 
 def get_recipients_by_task(task):
@@ -46,11 +180,113 @@ def get_recipients_by_task(task):
     return list(owners_chain)
 
 
+class RawSubquery(RawSQL):
+    """ Raw SQL subquery for __in lookup. Lookup adds parentheses itself,
+    in parentheses of RawSQL compound select would become scalar value.
+    """
+    def as_sql(self, compiler, connection):
+        return self.sql, self.params
+
+
+def get_visible_tasks(user, queryset=None):
+    """ Get tasks which user can view: user is creator or task owner.
+
+    Ids of visible tasks are selected by UNION of tasks found by creator
+    index and tasks found by user assignments, so every task is returned
+    once without join and DISTINCT. Django 1.9 querysets have no union(),
+    so the subquery is raw SQL.
+    :param user: User object
+    :param queryset: Task queryset for filtering, all tasks by default
+    :return: Task queryset
+    """
+    if queryset is None:
+        queryset = Task.objects.all()
+
+    visible_ids = RawSubquery(
+        'SELECT task_id FROM {assignment} WHERE user_id = %s '
+        'UNION SELECT id FROM {task} WHERE creator_id = %s'.format(
+            assignment=TaskAssignedUser._meta.db_table,
+            task=Task._meta.db_table,
+        ),
+        (user.pk, user.pk)
+    )
+
+    return queryset.filter(id__in=visible_ids)
+
+
+def get_visible_children_count(tasks, user):
+    """ Count visible direct children for every task by one query.
+    :param tasks: list of task objects
+    :param user: User object
+    :return: dict task id -> number of visible children
+    """
+    children = get_visible_tasks(user).filter(
+        parent__in=[task.id for task in tasks if not task.is_leaf_node()]
+    ).order_by().values('parent').annotate(count=Count('id'))
+
+    return {row['parent']: row['count'] for row in children}
+
+
 @app.task(name='send_email')
 def send_email(recipient, message):
     send_mail('New notification', message, settings.EMAIL_FROM, [recipient])
 
 
+@app.task(name='send_emails')
+def send_emails(emails):
+    """ Send emails by one connection
+    :param emails: list of tuples (recipient email, message)
+    :return:
+    """
+    send_mass_mail([
+        ('New notification', message, settings.EMAIL_FROM, [recipient])
+        for recipient, message in emails
+    ])
+
+
+@app.task(name='send_email_digests')
+def send_email_digests():
+    """ Send buffered messages to every recipient by one email
+    :return:
+    """
+    digest_messages = list(TaskDigestMessage.objects.all())
+    if not digest_messages:
+        return
+
+    digests = OrderedDict()
+    for each in digest_messages:
+        digests.setdefault(each.recipient, []).append(each.message)
+
+    send_mass_mail([
+        ('New notifications', '\n'.join(messages), settings.EMAIL_FROM,
+         [recipient])
+        for recipient, messages in digests.items()
+    ])
+
+    TaskDigestMessage.objects.filter(
+        id__in=[each.id for each in digest_messages]
+    ).delete()
+
+
+@app.task(name='archive_action_log')
+def archive_action_log():
+    """ Move old action log entries to archive, see
+    TASK_ACTION_LOG_RETENTION_DAYS
+    :return:
+    """
+    archived = archive.archive_action_log()
+    logger.info('archived %s action log entries', archived)
+
+
+@app.task(name='delete_expired_uploads')
+def delete_expired_uploads():
+    """ Delete unfinished chunked uploads, see TASK_ATTACHMENT_UPLOAD_EXPIRE
+    :return:
+    """
+    deleted = upload.delete_expired_uploads()
+    logger.info('deleted %s expired uploads', deleted)
+
+
 @app.task(name='send_deadline_notifications')
 def send_deadline_notifications():
     """ Send reminders about coming deadlines
@@ -62,5 +298,5 @@ def send_deadline_notifications():
     )
     tasks = Task.objects.filter(date_due=deadline_interval_date,
                                 status__lt=Task.STATUS_COMPLETE)
-    for task in tasks:
-        send_message(task.creator, 'reminds about task', task)
+    send_messages([(task.creator, 'reminds about task', task, ())
+                   for task in tasks.select_related('creator')])
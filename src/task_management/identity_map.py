@@ -0,0 +1,128 @@
+import threading
+
+from django.http import Http404
+
+_local = threading.local()
+
+
+class IdentityMap(object):
+    """ Request scoped map of loaded objects: one object per database row.
+    Repeated lookups of the same row are served from memory.
+    """
+    def __init__(self):
+        self.objects = {}  # (model, pk) -> object
+        self.lookups = {}  # (model, lookup items) -> pk
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_lookup_key(model, lookup):
+        return model, tuple(sorted(lookup.items()))
+
+    @staticmethod
+    def is_match(obj, lookup):
+        return all(getattr(obj, name) == value
+                   for name, value in lookup.items())
+
+    def get(self, model, **lookup):
+        """ Get object from map or from database
+        :param model: model class
+        :param lookup: field values, as for model.objects.get()
+        :return: model object
+        """
+        if 'pk' in lookup:
+            lookup['pk'] = int(lookup['pk'])
+            pk = lookup['pk']
+        else:
+            pk = self.lookups.get(self.get_lookup_key(model, lookup))
+
+        obj = self.objects.get((model, pk))
+        if obj is not None and self.is_match(obj, lookup):
+            self.hits += 1
+            return obj
+
+        self.misses += 1
+        obj = model.objects.get(**lookup)
+        self.add(obj)
+        if 'pk' not in lookup:
+            self.lookups[self.get_lookup_key(model, lookup)] = obj.pk
+
+        return obj
+
+    def add(self, obj):
+        self.objects[(type(obj), obj.pk)] = obj
+
+    def remove(self, obj):
+        self.objects.pop((type(obj), obj.pk), None)
+
+    def get_stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+def activate():
+    """ Create identity map for current thread """
+    _local.identity_map = IdentityMap()
+
+    return _local.identity_map
+
+
+def deactivate():
+    """ Remove identity map of current thread
+    :return: removed identity map or None
+    """
+    return _local.__dict__.pop('identity_map', None)
+
+
+def get_identity_map():
+    return getattr(_local, 'identity_map', None)
+
+
+def get_object(model, **lookup):
+    """ Get object via identity map of current request. Without active
+    identity map object is fetched from database.
+    :param model: model class
+    :param lookup: field values, as for model.objects.get()
+    :return: model object
+    """
+    identity_map = get_identity_map()
+    if identity_map is None:
+        return model.objects.get(**lookup)
+
+    return identity_map.get(model, **lookup)
+
+
+def get_object_or_404(model, **lookup):
+    """ Get object via identity map of current request, as
+    django.shortcuts.get_object_or_404 does
+    :param model: model class
+    :param lookup: field values, as for model.objects.get()
+    :return: model object
+    """
+    try:
+        return get_object(model, **lookup)
+    except model.DoesNotExist:
+        raise Http404('No {0} matches the given query.'.format(
+            model._meta.object_name))
+
+
+def get_loaded_object(model, pk):
+    """ Get object from identity map of current request without fetching
+    :return: model object or None
+    """
+    identity_map = get_identity_map()
+    if identity_map is None:
+        return None
+
+    return identity_map.objects.get((model, pk))
+
+
+def add_object(obj):
+    identity_map = get_identity_map()
+    if identity_map is not None:
+        identity_map.add(obj)
+
+
+def remove_object(obj):
+    identity_map = get_identity_map()
+    if identity_map is not None:
+        identity_map.remove(obj)
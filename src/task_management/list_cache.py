@@ -0,0 +1,107 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from task_management.models import TaskAssignedUser
+
+
+def get_list_cache():
+    return caches[settings.TASK_LIST_CACHE]
+
+
+def get_version_cache_key(user_id):
+    return 'task_management:task_list_version:{0}'.format(user_id)
+
+
+def get_body_cache_key(user_id, version, query):
+    """ Key of rendered task list of user
+    :param user_id: id of User
+    :param version: version of task list of user
+    :param query: QueryDict of list parameters: page, filters, expand
+    :return: cache key
+    """
+    digest = hashlib.md5(query.urlencode().encode()).hexdigest()
+
+    return 'task_management:task_list:{0}:{1}:{2}'.format(user_id, version,
+                                                          digest)
+
+
+def get_task_list_version(user_id):
+    """ Get version of task list of user. Version is changed when any task
+    which user can view is changed, so cached lists of old version are
+    never read and are evicted by cache backend.
+    :param user_id: id of User
+    :return: version string
+    """
+    cache = get_list_cache()
+    cache_key = get_version_cache_key(user_id)
+    version = cache.get(cache_key)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.set(cache_key, version, settings.TASK_LIST_CACHE_TIMEOUT)
+
+    return version
+
+
+def get_cached_task_list(user_id, query, render):
+    """ Get rendered task list from cache or render and cache it
+    :param user_id: id of User
+    :param query: QueryDict of list parameters
+    :param render: function without arguments which returns rendered list
+    :return: string
+    """
+    if not settings.TASK_LIST_CACHE_TIMEOUT:
+        return render()
+
+    cache = get_list_cache()
+    cache_key = get_body_cache_key(user_id, get_task_list_version(user_id),
+                                   query)
+    body = cache.get(cache_key)
+    if body is None:
+        body = render()
+        cache.set(cache_key, body, settings.TASK_LIST_CACHE_TIMEOUT)
+
+    return body
+
+
+def clear_task_list_versions(user_ids, task_ids=()):
+    """ Change versions of task lists of users and of users in owners
+    chains of tasks
+    :param user_ids: list of user ids
+    :param task_ids: list of task ids
+    :return:
+    """
+    user_ids = set(user_ids)
+    if task_ids:
+        user_ids.update(
+            TaskAssignedUser.objects.filter(task_id__in=task_ids)
+            .values_list('user_id', flat=True)
+        )
+
+    get_list_cache().delete_many([get_version_cache_key(user_id)
+                                  for user_id in user_ids
+                                  if user_id is not None])
+
+
+def invalidate_task_lists(tasks=(), user_ids=()):
+    """ Change versions of task lists of users who can view tasks: creators,
+    owners and users in owners chains. Versions are changed after commit,
+    otherwise concurrent request could cache old list with new version.
+    :param tasks: list of Task objects
+    :param user_ids: list of other affected user ids
+    :return:
+    """
+    if not settings.TASK_LIST_CACHE_TIMEOUT:
+        return
+
+    user_ids = set(user_ids)
+    for task in tasks:
+        user_ids.update((task.creator_id, task.owner_id))
+    task_ids = [task.pk for task in tasks]
+
+    transaction.on_commit(
+        lambda: clear_task_list_versions(user_ids, task_ids)
+    )
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from task_management.archive import archive_action_log
+
+
+class Command(BaseCommand):
+    help = 'Move old action log entries to compressed archive segments'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help='Retention window, TASK_ACTION_LOG_RETENTION_DAYS by default'
+        )
+
+    def handle(self, *args, **options):
+        archived = archive_action_log(options['days'])
+        self.stdout.write('Archived {0} action log entries'.format(archived))
@@ -0,0 +1,49 @@
+import os
+import re
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from task_management.models import TaskAttachment, AttachmentBlob
+from task_management.storage import attachment_storage
+
+DIGEST_NAME = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{64}$')
+
+
+class Command(BaseCommand):
+    help = 'Move attachment files to content addressed storage, identical ' \
+           'files are stored once'
+
+    def handle(self, *args, **options):
+        names = list(TaskAttachment.objects.order_by().values('attachment')
+                     .annotate(count=Count('id')))
+        moved, missing = 0, 0
+        for row in names:
+            name = row['attachment']
+            if DIGEST_NAME.search(name):
+                continue
+            if not attachment_storage.exists(name):
+                missing += 1
+                self.stderr.write('Missing file {0}'.format(name))
+                continue
+
+            with attachment_storage.open(name) as content:
+                new_name = attachment_storage.save(
+                    os.path.join('task_attachment', os.path.basename(name)),
+                    content
+                )
+
+            with transaction.atomic():
+                TaskAttachment.objects.filter(attachment=name,
+                                              original_name='')\
+                    .update(original_name=os.path.basename(name))
+                count = TaskAttachment.objects.filter(attachment=name)\
+                    .update(attachment=new_name)
+                AttachmentBlob.objects.filter(name=name).delete()
+                AttachmentBlob.add_references([new_name] * count)
+            attachment_storage.delete(name)
+            moved += 1
+
+        self.stdout.write('Moved {0} files, {1} missing files'.format(
+            moved, missing))
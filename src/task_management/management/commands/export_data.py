@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from task_management.export import export, EXPORTS, FORMATS
+from task_management.forms import ExportFilterForm
+
+
+class Command(BaseCommand):
+    help = 'Stream tasks, comments, assignments or action log to CSV/JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(EXPORTS))
+        parser.add_argument('--format', default='csv', choices=sorted(FORMATS))
+        parser.add_argument('--output', help='File path, stdout by default')
+        parser.add_argument('--user', help='User id')
+        parser.add_argument('--status')
+        parser.add_argument('--tree-id')
+        parser.add_argument('--since', help='YYYY-MM-DD [HH:MM]')
+        parser.add_argument('--until', help='YYYY-MM-DD [HH:MM]')
+
+    def handle(self, *args, **options):
+        form = ExportFilterForm({
+            name: options[name] for name in
+            ('user', 'status', 'tree_id', 'since', 'until')
+            if options[name] is not None
+        })
+        if not form.is_valid():
+            raise CommandError(form.errors.as_text())
+
+        chunks = export(options['name'], options['format'],
+                        **form.cleaned_data)
+        if options['output']:
+            with open(options['output'], 'w', newline='') as output:
+                output.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from task_management.forest import export_forest
+from task_management.models import Task
+
+
+class Command(BaseCommand):
+    help = 'Stream task trees with owners chains, comments and attachment ' \
+           'references to JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tree-id', type=int, action='append',
+                            help='Export only this tree, can be repeated')
+        parser.add_argument('--output', help='File path, stdout by default')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        tasks = Task.objects.all()
+        if options['tree_id']:
+            tasks = tasks.filter(tree_id__in=options['tree_id'])
+
+        chunks = export_forest(tasks, options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from task_management.forest import import_forest
+
+
+class Command(BaseCommand):
+    help = 'Import task trees from JSONL file of export_tasks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            counts = import_forest(options['path'], options['batch_size'])
+        except (IOError, ValueError, KeyError) as error:
+            raise CommandError('Cannot import {0}: {1!r}'.format(
+                options['path'], error))
+
+        self.stdout.write(
+            'Imported {tasks} tasks, {assignments} assignments, '
+            '{comments} comments, {attachments} attachments'.format(
+                **counts)
+        )
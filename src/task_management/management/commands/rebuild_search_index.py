@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from task_management.models import Task
+from task_management.search import get_search_index
+
+
+class Command(BaseCommand):
+    help = 'Index all tasks and comments for full text search again'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        index = get_search_index()
+        count = 0
+        last_id = 0
+        with transaction.atomic():
+            index.clear()
+            while True:
+                tasks = list(Task.objects.filter(id__gt=last_id)
+                             .order_by('id')[:options['chunk_size']])
+                if not tasks:
+                    break
+
+                index.update(tasks)
+                count += len(tasks)
+                last_id = tasks[-1].id
+
+        self.stdout.write('Indexed {0} tasks'.format(count))
@@ -0,0 +1,62 @@
+import logging
+
+from django.conf import settings
+
+from task_management import identity_map
+from task_management.action_log import buffered_action_log
+
+logger = logging.getLogger(__name__)
+
+
+class IdentityMapMiddleware(object):
+    """ Activate identity map of Task and TaskAssignedUser objects for every
+    request. Statistic of identity map is logged, saved to
+    request.identity_map_stats and in DEBUG mode sent in X-Identity-Map
+    header.
+    """
+    def process_request(self, request):
+        identity_map.activate()
+
+    def process_response(self, request, response):
+        current_map = identity_map.deactivate()
+        if current_map is None:
+            return response
+
+        stats = current_map.get_stats()
+        request.identity_map_stats = stats
+        logger.debug('Identity map %s: %d fetches saved, %d fetched',
+                     request.path, stats['hits'], stats['misses'])
+        if settings.DEBUG:
+            response['X-Identity-Map'] = 'hits={hits}; misses={misses}'\
+                .format(**stats)
+
+        return response
+
+
+class ActionLogMiddleware(object):
+    """ Wrap views of not safe requests in transaction, TaskActionLog entries
+    of request are saved by one query before commit. Transaction is
+    committed by process_response and rolled back by process_exception, so
+    the middleware must be the last one: its process_exception is called
+    first.
+    """
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.TASK_ACTION_LOG_BUFFERED or \
+                request.method in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
+            return None
+
+        request.action_log_block = buffered_action_log()
+        request.action_log_block.__enter__()
+
+    def process_exception(self, request, exception):
+        block = request.__dict__.pop('action_log_block', None)
+        if block is not None:
+            block.__exit__(type(exception), exception,
+                           exception.__traceback__)
+
+    def process_response(self, request, response):
+        block = request.__dict__.pop('action_log_block', None)
+        if block is not None:
+            block.__exit__(None, None, None)
+
+        return response
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 19:46
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('task_management', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskDigestMessage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipient', models.EmailField(max_length=254, verbose_name='Recipient email')),
+                ('message', models.TextField(verbose_name='Message')),
+                ('time_create', models.DateTimeField(auto_now_add=True, verbose_name='Time of create')),
+            ],
+            options={
+                'ordering': ('id',),
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 19:55
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('task_management', '0002_taskdigestmessage'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='taskactionlog',
+            index_together=set([('actor', 'id'), ('content_type', 'object_id', 'id')]),
+        ),
+    ]
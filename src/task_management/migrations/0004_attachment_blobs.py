@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 20:01
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import task_management.storage
+
+
+def count_references(apps, schema_editor):
+    """ Count references of existing attachments to stored files, names of
+    attachments are kept as they are, see dedupe_attachments command
+    """
+    TaskAttachment = apps.get_model('task_management', 'TaskAttachment')
+    AttachmentBlob = apps.get_model('task_management', 'AttachmentBlob')
+    AttachmentBlob.objects.bulk_create([
+        AttachmentBlob(name=row['attachment'], ref_count=row['count'])
+        for row in TaskAttachment.objects.order_by().values('attachment')
+        .annotate(count=models.Count('id'))
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('task_management', '0003_action_log_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttachmentBlob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Storage name')),
+                ('ref_count', models.PositiveIntegerField(default=0, verbose_name='Number of references')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='taskattachment',
+            name='original_name',
+            field=models.CharField(blank=True, max_length=255, verbose_name='File name'),
+        ),
+        migrations.AlterField(
+            model_name='taskattachment',
+            name='attachment',
+            field=models.FileField(max_length=255, storage=task_management.storage.ContentAddressedStorage(), upload_to='task_attachment', verbose_name='Attachment'),
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
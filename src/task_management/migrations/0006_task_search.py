@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 20:11
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+FTS_TABLE = 'task_management_task_fts'
+
+
+def create_fts_table(apps, schema_editor):
+    """ SQLite FTS5 index of tasks, see task_management.search """
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE {0} USING fts5(title, description, '
+            'status_description, comments)'.format(FTS_TABLE)
+        )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE {0}'.format(FTS_TABLE))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('task_management', '0005_attachmentupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskSearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64, verbose_name='Term')),
+                ('weight', models.PositiveIntegerField(verbose_name='Weight')),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='task_management.Task')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='tasksearchterm',
+            index_together=set([('term', 'task')]),
+        ),
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
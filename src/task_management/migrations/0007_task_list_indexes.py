@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 20:15
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('task_management', '0006_task_search'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='task',
+            name='date_due',
+            field=models.DateField(blank=True, db_index=True, null=True, verbose_name='Due date'),
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='time_update',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Time of update'),
+        ),
+        migrations.AlterIndexTogether(
+            name='task',
+            index_together=set([('status', 'date_due'), ('criticality', 'date_due'), ('creator', 'status'), ('tree_id', 'lft'), ('owner', 'status')]),
+        ),
+    ]
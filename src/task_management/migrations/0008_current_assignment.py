@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 20:25
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def set_current_assignments(apps, schema_editor):
+    """ Store the last assignment of every owners chain on task """
+    Task = apps.get_model('task_management', 'Task')
+    TaskAssignedUser = apps.get_model('task_management', 'TaskAssignedUser')
+    assignments = TaskAssignedUser._default_manager\
+        .order_by('task_id', 'time_assign', 'id')\
+        .values_list('task_id', 'id', 'assign_accept')
+    current = {}
+    for task_id, assignment_id, assign_accept in assignments.iterator():
+        current[task_id] = (assignment_id, assign_accept)
+
+    for task_id, (assignment_id, assign_accept) in current.items():
+        Task._default_manager.filter(pk=task_id).update(
+            current_assignment=assignment_id, assign_accept=assign_accept
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('task_management', '0007_task_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='assign_accept',
+            field=models.NullBooleanField(editable=False, verbose_name='Owner accepted task'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='current_assignment',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='task_management.TaskAssignedUser', verbose_name='Current assignment'),
+        ),
+        migrations.AlterIndexTogether(
+            name='task',
+            index_together=set([('creator', 'status'), ('owner', 'status'), ('tree_id', 'lft'), ('owner', 'assign_accept', 'current_assignment'), ('status', 'date_due'), ('criticality', 'date_due')]),
+        ),
+        migrations.RunPython(set_current_assignments,
+                             migrations.RunPython.noop),
+    ]
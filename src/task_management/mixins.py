@@ -1,99 +1,75 @@
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.http import HttpResponseForbidden
 
+from task_management import identity_map
 from task_management.models import Task
+from task_management.permissions import get_task_permissions
 
 
-class TaskChangePermitMixin(LoginRequiredMixin):
-    """ Mixin which verifies that the current user can edit task. """
+class TaskPermitMixin(LoginRequiredMixin):
+    """ Base mixin which verifies that the current user has permission for
+    task. Permission is attribute name of TaskPermissions object.
+    """
+    permission = None
+    task = None
 
-    def dispatch(self, request, *args, **kwargs):
-        # only creator and owner accepted task can update task
-        task = self.get_object()
-        user = request.user
-        if (user == task.creator or user in task.get_owners_chain(True)) \
-                and task.status != Task.STATUS_APPROVE:
-            return super(TaskChangePermitMixin, self).dispatch(
-                request, *args, **kwargs
-            )
+    def get_object(self, queryset=None):
+        if queryset is None and self.model is Task:
+            # the same task object for mixin and view
+            return identity_map.get_object_or_404(Task,
+                                                  pk=self.kwargs['pk'])
 
-        return HttpResponseForbidden()
+        return super(TaskPermitMixin, self).get_object(queryset)
 
+    def get_task(self):
+        if not self.task:
+            self.task = self.get_object()
 
-class TaskViewPermitMixin(LoginRequiredMixin):
-    """ Mixin which verifies that the current user can view task. """
+        return self.task
 
     def dispatch(self, request, *args, **kwargs):
-        # only creator and contributors can view task
-        task = self.get_object()
-        if request.user == task.creator or request.user in task.owners.all():
-            return super(TaskViewPermitMixin, self).dispatch(
+        permissions = get_task_permissions(request, self.get_task())
+        if getattr(permissions, self.permission):
+            return super(TaskPermitMixin, self).dispatch(
                 request, *args, **kwargs
             )
 
         return HttpResponseForbidden()
 
 
-class TaskDeletePermitMixin(LoginRequiredMixin):
-    """ Mixin which verifies that the current user can delete task. """
+class TaskChangePermitMixin(TaskPermitMixin):
+    """ Mixin which verifies that the current user can edit task. """
+    permission = 'change'
 
-    def dispatch(self, request, *args, **kwargs):
-        # only task creator can delete task
-        task = self.get_object()
-        if request.user == task.creator:
-            return super(TaskDeletePermitMixin, self).dispatch(
-                request, *args, **kwargs
-            )
 
-        return HttpResponseForbidden()
+class TaskViewPermitMixin(TaskPermitMixin):
+    """ Mixin which verifies that the current user can view task. """
+    permission = 'view'
+
+
+class TaskDeletePermitMixin(TaskPermitMixin):
+    """ Mixin which verifies that the current user can delete task. """
+    permission = 'delete'
 
 
-class TaskAcceptPermitMixin(LoginRequiredMixin):
+class TaskAcceptPermitMixin(TaskPermitMixin):
     """ Mixin which verifies that the current user can accept/reject task. """
-    task = None
+    permission = 'accept'
 
     def get_task(self):
         if not self.task:
-            self.task = Task.objects.get(pk=self.kwargs['pk'])
+            self.task = identity_map.get_object_or_404(Task,
+                                                       pk=self.kwargs['pk'])
 
         return self.task
 
-    def dispatch(self, request, *args, **kwargs):
-        # only task owner can accept/reject task
-        task = self.get_task()
-        if request.user == task.owner and task.owner_accept_task() is None:
-            return super(TaskAcceptPermitMixin, self).dispatch(
-                request, *args, **kwargs
-            )
-
-        return HttpResponseForbidden()
-
 
-class TaskApprovePermitMixin(LoginRequiredMixin):
+class TaskApprovePermitMixin(TaskPermitMixin):
     """ Mixin which verifies that the current user can approve/decline task.
     """
+    permission = 'approve'
 
-    def dispatch(self, request, *args, **kwargs):
-        # only task owner can approve/decline task if status = 'complete'
-        task = self.get_object()
-        if request.user == task.creator and task.status == task.STATUS_COMPLETE:
-            return super(TaskApprovePermitMixin, self).dispatch(
-                request, *args, **kwargs
-            )
-
-        return HttpResponseForbidden()
 
-
-class TaskReassignPermitMixin(LoginRequiredMixin):
+class TaskReassignPermitMixin(TaskPermitMixin):
     """ Mixin which verifies that the current user can re-assign task. """
-
-    def dispatch(self, request, *args, **kwargs):
-        # only owner which accepted task can re-assign task
-        task = self.get_object()
-        if request.user == task.owner and task.owner_accept_task() \
-                and task.status != task.STATUS_APPROVE:
-            return super(TaskReassignPermitMixin, self).dispatch(
-                request, *args, **kwargs
-            )
-
-        return HttpResponseForbidden()
+    permission = 'reassign'
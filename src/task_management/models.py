@@ -1,12 +1,19 @@
 import os
+import uuid
+from collections import Counter
 
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.core.urlresolvers import reverse
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from mptt.models import MPTTModel, TreeForeignKey, TreeManyToManyField
 
+from task_management.action_log import get_action_log_buffer
+from task_management.storage import attachment_storage
+
 
 def attachment_upload_dir(instance, filename):
     return 'task_attachment/{0}/{1}'.format(instance.task.id, filename)
@@ -60,19 +67,49 @@ class Task(MPTTModel):
     criticality = models.SmallIntegerField('Criticality',
                                            choices=CRITICALITY_CHOICES,
                                            default=CRITICALITY_MEDIUM)
-    date_due = models.DateField('Due date', blank=True, null=True)
+    date_due = models.DateField('Due date', blank=True, null=True,
+                                db_index=True)
     time_create = models.DateTimeField('Time of create', auto_now_add=True)
-    time_update = models.DateTimeField('Time of update', auto_now=True)
+    time_update = models.DateTimeField('Time of update', auto_now=True,
+                                       db_index=True)
+    # the last assignment of owners chain and its state, kept by signals of
+    # TaskAssignedUser
+    current_assignment = models.ForeignKey(
+        'TaskAssignedUser', verbose_name='Current assignment',
+        related_name='+', blank=True, null=True, editable=False,
+        on_delete=models.SET_NULL
+    )
+    assign_accept = models.NullBooleanField('Owner accepted task',
+                                            editable=False)
+
+    class Meta:
+        # filters and sorting of task list
+        index_together = [
+            ('owner', 'status'),
+            ('creator', 'status'),
+            ('status', 'date_due'),
+            ('criticality', 'date_due'),
+            ('tree_id', 'lft'),
+            # tasks awaiting acceptance of owner
+            ('owner', 'assign_accept', 'current_assignment'),
+        ]
 
     def get_absolute_url(self):
         return reverse('task_management:detail', kwargs={'pk': self.pk})
 
     def owner_accept_task(self):
         """ Owner is accepted task
-        :return: boolean
+        :return: boolean or None if owner has not answered yet
         """
-        return TaskAssignedUser.objects.filter(task=self).order_by(
-            'time_assign').last().assign_accept
+        return self.assign_accept
+
+    def set_current_assignment(self, assignment):
+        """ Set the last assignment of owners chain
+        :param assignment: TaskAssignedUser object or None
+        :return:
+        """
+        self.current_assignment = assignment
+        self.assign_accept = assignment.assign_accept if assignment else None
 
     def get_owners_chain(self, assign_accept=None):
         """ Get chain of assignment users
@@ -124,19 +161,101 @@ class TaskAssignedUser(MPTTModel):
 
 
 class TaskAttachment(models.Model):
-    """ Task attachments model """
+    """ Task attachments model. Files are stored by content, identical
+    files of attachments are stored once, see AttachmentBlob.
+    """
     task = models.ForeignKey(Task, related_name='attachments',
                              verbose_name='Attachment task')
-    attachment = models.FileField('Attachment',
-                                  upload_to=attachment_upload_dir)
+    attachment = models.FileField('Attachment', upload_to='task_attachment',
+                                  storage=attachment_storage, max_length=255)
+    original_name = models.CharField('File name', max_length=255,
+                                     blank=True)
 
     def file_name(self):
-        return os.path.basename(self.attachment.name)
+        return self.original_name or os.path.basename(self.attachment.name)
+
+    def get_absolute_url(self):
+        return reverse('task_management:attachment', kwargs={'pk': self.pk})
+
+    def save(self, *args, **kwargs):
+        if not self.original_name:
+            # name of upload before it is replaced by storage name
+            self.original_name = os.path.basename(self.attachment.name)
+
+        super(TaskAttachment, self).save(*args, **kwargs)
 
     def __str__(self):
         return self.file_name()
 
 
+class AttachmentBlob(models.Model):
+    """ Stored file of attachments with number of attachments referencing
+    it. The file is deleted with the last reference.
+    """
+    name = models.CharField('Storage name', max_length=255, unique=True)
+    ref_count = models.PositiveIntegerField('Number of references',
+                                            default=0)
+
+    @staticmethod
+    def add_references(names):
+        """ Count new references of files
+        :param names: list of storage names, name is repeated for every
+        reference
+        :return:
+        """
+        counts = Counter(names)
+        existing = set(AttachmentBlob.objects.filter(name__in=counts)
+                       .values_list('name', flat=True))
+        missing = [AttachmentBlob(name=name) for name in counts
+                   if name not in existing]
+        if missing:
+            try:
+                with transaction.atomic():
+                    AttachmentBlob.objects.bulk_create(missing)
+            except IntegrityError:
+                # blob of the same file is created by concurrent transaction
+                for blob in missing:
+                    AttachmentBlob.objects.get_or_create(name=blob.name)
+        for name, count in counts.items():
+            AttachmentBlob.objects.filter(name=name).update(
+                ref_count=F('ref_count') + count
+            )
+
+    @staticmethod
+    def remove_reference(name):
+        """ Uncount reference of file, delete file with the last reference
+        after commit. File without blob is never deleted.
+        :param name: storage name
+        :return:
+        """
+        with transaction.atomic():
+            blob = AttachmentBlob.objects.select_for_update()\
+                .filter(name=name).first()
+            if blob is None:
+                return
+
+            if blob.ref_count <= 1:
+                blob.delete()
+                transaction.on_commit(
+                    lambda: AttachmentBlob.delete_unreferenced(name)
+                )
+            else:
+                blob.ref_count = F('ref_count') - 1
+                blob.save(update_fields=['ref_count'])
+
+    @staticmethod
+    def delete_unreferenced(name):
+        """ Delete file unless the same content was attached again after its
+        last reference was removed
+        :param name: storage name
+        :return:
+        """
+        with transaction.atomic():
+            if not AttachmentBlob.objects.select_for_update()\
+                    .filter(name=name).exists():
+                attachment_storage.delete(name)
+
+
 class TaskComment(models.Model):
     """ Task comments model """
     task = models.ForeignKey(Task, related_name='comments',
@@ -171,9 +290,64 @@ class TaskActionLog(models.Model):
         :param action_goal: object of the action
         :return:
         """
-        return TaskActionLog.objects.create(actor=actor, action=action,
-                                            action_goal=action_goal)
+        log_entry = TaskActionLog(actor=actor, action=action,
+                                  action_goal=action_goal)
+        action_log_buffer = get_action_log_buffer()
+        if action_log_buffer is None:
+            log_entry.save()
+        else:
+            # saved at the end of transaction
+            action_log_buffer.append(log_entry)
+
+        return log_entry
 
     class Meta:
         ordering = ('-id', )
+        # history of object and actor in keyset order
+        index_together = [
+            ('content_type', 'object_id', 'id'),
+            ('actor', 'id'),
+        ]
+
+
+class TaskDigestMessage(models.Model):
+    """ Email message waiting for sending in recipient digest """
+    recipient = models.EmailField('Recipient email')
+    message = models.TextField('Message')
+    time_create = models.DateTimeField('Time of create', auto_now_add=True)
+
+    class Meta:
+        ordering = ('id', )
+
+
+class AttachmentUpload(models.Model):
+    """ Chunked upload of task attachment in progress. Received chunks are
+    appended to part file, see task_management.upload.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4,
+                          editable=False)
+    task = models.ForeignKey(Task, on_delete=models.CASCADE,
+                             related_name='uploads')
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    file_name = models.CharField('File name', max_length=255)
+    size = models.BigIntegerField('File size')
+    received = models.BigIntegerField('Received bytes', default=0)
+    time_update = models.DateTimeField('Time of update', auto_now=True)
 
+    def get_path(self):
+        return os.path.join(settings.TASK_ATTACHMENT_UPLOAD_DIR,
+                            '{0}.part'.format(self.id))
+
+
+class TaskSearchTerm(models.Model):
+    """ Word of task in inverted search index, used on databases without
+    SQLite FTS5, see task_management.search
+    """
+    TERM_LENGTH = 64
+
+    task = models.ForeignKey(Task, on_delete=models.CASCADE)
+    term = models.CharField('Term', max_length=TERM_LENGTH)
+    weight = models.PositiveIntegerField('Weight')
+
+    class Meta:
+        index_together = [('term', 'task')]
@@ -0,0 +1,89 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from task_management.models import Task, TaskAssignedUser
+
+
+def get_owners_chain_cache_key(task_id):
+    return 'task_management:owners_chain:{0}'.format(task_id)
+
+
+def get_owners_chain_states(task):
+    """ Get chain of assignment states by one query. The chain is cached
+    between requests if settings.TASK_PERMISSIONS_CACHE_TIMEOUT is set.
+    :param task: Task object
+    :return: list of tuples (user id, assign accept) ordered by assign time
+    """
+    timeout = settings.TASK_PERMISSIONS_CACHE_TIMEOUT
+    cache_key = get_owners_chain_cache_key(task.pk)
+    if timeout:
+        chain = cache.get(cache_key)
+        if chain is not None:
+            return chain
+
+    chain = list(
+        TaskAssignedUser.objects.filter(task=task).order_by('time_assign')
+        .values_list('user_id', 'assign_accept')
+    )
+    if timeout:
+        cache.set(cache_key, chain, timeout)
+
+    return chain
+
+
+def clear_owners_chain_cache(task_id):
+    cache.delete(get_owners_chain_cache_key(task_id))
+
+
+class TaskPermissions(object):
+    """ What user can do with task """
+    def __init__(self, user, task, owners_chain):
+        """
+        :param user: User object
+        :param task: Task object
+        :param owners_chain: list of tuples (user id, assign accept)
+        """
+        is_creator = user.id == task.creator_id
+        is_owner = task.owner_id is not None and user.id == task.owner_id
+        owner_accept = owners_chain[-1][1] if owners_chain else None
+        approved = task.status == Task.STATUS_APPROVE
+
+        # only creator and contributors can view task
+        self.view = is_creator or any(
+            user_id == user.id for user_id, _ in owners_chain
+        )
+        # only creator and owner accepted task can update task
+        self.change = not approved and (is_creator or any(
+            user_id == user.id and accept
+            for user_id, accept in owners_chain
+        ))
+        # only task creator can delete task
+        self.delete = is_creator
+        # only task owner can accept/reject task
+        self.accept = is_owner and owner_accept is None
+        # only task creator can approve/decline task if status = 'complete'
+        self.approve = is_creator and task.status == Task.STATUS_COMPLETE
+        # only owner which accepted task can re-assign task
+        self.reassign = is_owner and bool(owner_accept) and not approved
+
+
+def get_task_permissions(request, task, owners_chain=None):
+    """ Get permissions of request user for task. Permissions are
+    calculated once per request for every task.
+    :param request: HttpRequest object
+    :param task: Task object
+    :param owners_chain: list of tuples (user id, assign accept) ordered by
+    assign time, loaded by get_owners_chain_states if it is not passed
+    :return: TaskPermissions object
+    """
+    if not hasattr(request, 'task_permissions'):
+        request.task_permissions = {}
+
+    if task.pk not in request.task_permissions:
+        if owners_chain is None:
+            owners_chain = get_owners_chain_states(task)
+        request.task_permissions[task.pk] = TaskPermissions(
+            request.user, task, owners_chain
+        )
+
+    return request.task_permissions[task.pk]
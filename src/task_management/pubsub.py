@@ -0,0 +1,131 @@
+import queue
+import threading
+from collections import defaultdict
+
+import redis
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+_pubsub = None
+
+
+class LocalSubscription(object):
+    """ Subscription to channel of LocalPubSub """
+    def __init__(self, pubsub, channel):
+        self.pubsub = pubsub
+        self.channel = channel
+        self.queue = queue.Queue()
+
+    def get(self, timeout=None):
+        """ Wait for message
+        :param timeout: seconds to wait
+        :return: message or None if timeout expired
+        """
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.pubsub.unsubscribe(self)
+
+
+class LocalPubSub(object):
+    """ Publish/subscribe within one process """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = defaultdict(set)
+
+    def publish(self, channels, message):
+        """ Send message to all subscribers of channels
+        :param channels: list of channel names
+        :param message: message string
+        :return:
+        """
+        with self.lock:
+            subscriptions = [subscription for channel in channels
+                             for subscription in self.subscriptions[channel]]
+
+        for subscription in subscriptions:
+            subscription.queue.put(message)
+
+    def subscribe(self, channel):
+        subscription = LocalSubscription(self, channel)
+        with self.lock:
+            self.subscriptions[channel].add(subscription)
+
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions[subscription.channel].discard(subscription)
+            if not self.subscriptions[subscription.channel]:
+                del self.subscriptions[subscription.channel]
+
+
+class RedisSubscription(object):
+    """ Subscription to channel of RedisPubSub """
+    def __init__(self, pubsub, channel):
+        self.pubsub = pubsub
+        self.pubsub.subscribe(channel)
+
+    def get(self, timeout=None):
+        message = self.pubsub.get_message(ignore_subscribe_messages=True,
+                                          timeout=timeout or 0)
+        if message:
+            return message['data']
+
+    def close(self):
+        self.pubsub.close()
+
+
+class RedisPubSub(object):
+    """ Publish/subscribe between processes via redis """
+    def __init__(self):
+        self.redis = redis.StrictRedis.from_url(
+            settings.TASK_NOTIFICATIONS_REDIS_URL
+        )
+
+    def publish(self, channels, message):
+        pipeline = self.redis.pipeline()
+        for channel in channels:
+            pipeline.publish(channel, message)
+        pipeline.execute()
+
+    def subscribe(self, channel):
+        return RedisSubscription(self.redis.pubsub(), channel)
+
+
+def get_pubsub():
+    """ Get publish/subscribe backend configured by
+    settings.TASK_NOTIFICATIONS_PUBSUB
+    """
+    global _pubsub
+    if _pubsub is None:
+        _pubsub = import_string(settings.TASK_NOTIFICATIONS_PUBSUB)()
+
+    return _pubsub
+
+
+@receiver(setting_changed)
+def reset_pubsub(setting, **kwargs):
+    """ Backend is created again after change of its setting in tests """
+    global _pubsub
+    if setting == 'TASK_NOTIFICATIONS_PUBSUB':
+        _pubsub = None
+
+
+def get_notifications_channel(user_id):
+    return 'task_management:notifications:{0}'.format(user_id)
+
+
+def publish_notifications(user_ids):
+    """ Notify subscribers about new notifications of users
+    :param user_ids: list of user ids
+    :return:
+    """
+    get_pubsub().publish(
+        [get_notifications_channel(user_id) for user_id in user_ids], 'new'
+    )
@@ -0,0 +1,221 @@
+import threading
+from contextlib import contextmanager
+
+from django.db import models, transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.utils import timezone
+
+from task_management import identity_map
+from task_management.helpers import send_message
+from task_management.list_cache import invalidate_task_lists
+from task_management.models import Task
+
+_local = threading.local()
+
+
+def get_rollup_status(status_sum, count):
+    """ Calculate parent task status by average child task status.
+    :param status_sum: sum of children statuses
+    :param count: number of children
+    :return: tuple (status, complete), complete is True if all children
+    are approved
+    """
+    status_avg = int(status_sum / count)
+    complete = False
+
+    if status_avg < Task.STATUS_WORKING:
+        # the parent task status cannot be less STATUS_WORKING
+        status_avg = Task.STATUS_WORKING
+    if status_avg == Task.STATUS_COMPLETE:
+        # the parent task status equal COMPLETE if all parent task have APPROVE
+        # status
+        status_avg = Task.STATUS_ALMOST_DONE
+    if status_avg > Task.STATUS_COMPLETE:
+        # the parent task status cannot be greater STATUS_COMPLETE
+        status_avg = Task.STATUS_COMPLETE
+        complete = True
+
+    return status_avg, complete
+
+
+def rollup_statuses(parents, statuses):
+    """ Recalculate statuses of all parent tasks of forest by one pass in
+    memory, from the deepest tasks to roots.
+    :param parents: list of parent positions in list or None for roots,
+    parent position is less than child position
+    :param statuses: list of task statuses, parent statuses are changed
+    :return:
+    """
+    sums = [0] * len(statuses)
+    counts = [0] * len(statuses)
+    # children follow parent, so all children of task are recalculated
+    # before it
+    for i in reversed(range(len(statuses))):
+        if counts[i]:
+            statuses[i] = get_rollup_status(sums[i], counts[i])[0]
+        parent = parents[i]
+        if parent is not None:
+            sums[parent] += statuses[i]
+            counts[parent] += 1
+
+
+class StatusRollup(object):
+    """ Recalculate statuses of ancestors of changed tasks.
+
+    Ancestors of all changed tasks are loaded by one query, sums and counts
+    of their children statuses by one aggregate query. Then ancestors are
+    recalculated in memory from the deepest level, every ancestor once,
+    and saved by one update.
+    """
+    def __init__(self):
+        self.tasks = []
+
+    def add(self, task, old_status=None, created=False):
+        """ Add saved task if its parent status must be recalculated
+        :param task: Task object after save
+        :param old_status: task status before save
+        :param created: True if task is new
+        :return:
+        """
+        if task.parent_id and (created or old_status is not None and
+                               int(old_status) != int(task.status)):
+            self.tasks.append(task)
+
+    def get_ancestors(self):
+        """ Load ancestors of all changed tasks by one query
+        :return: list of tasks ordered from the deepest level
+        """
+        condition = Q()
+        for task in self.tasks:
+            condition |= Q(tree_id=task.tree_id, lft__lt=task.lft,
+                           rght__gt=task.rght)
+
+        return list(
+            Task.objects.filter(condition).order_by('-level')
+        )
+
+    @staticmethod
+    def get_children_statuses(tasks):
+        """ Sum and count children statuses by one query
+        :param tasks: list of parent tasks
+        :return: dict task id -> [status sum, children count]
+        """
+        children = Task.objects.filter(parent__in=tasks).order_by()\
+            .values('parent').annotate(status_sum=Sum('status'),
+                                       count=Count('id'))
+
+        return {row['parent']: [row['status_sum'], row['count']]
+                for row in children}
+
+    def run(self):
+        """ Recalculate and save ancestors statuses
+        :return: list of recalculated tasks
+        """
+        if not self.tasks:
+            return []
+
+        # parent id -> child which status was changed
+        changed_children = {task.parent_id: task for task in self.tasks}
+        recalculated = []
+        notifications = []
+        with transaction.atomic(savepoint=False):
+            ancestors = self.get_ancestors()
+            statuses = self.get_children_statuses(ancestors)
+            for task in ancestors:
+                child = changed_children.get(task.id)
+                if not child:
+                    continue
+
+                status_sum, count = statuses[task.id]
+                status, complete = get_rollup_status(status_sum, count)
+                if complete:
+                    notifications.append((child.owner, task))
+                if status != task.status and task.parent_id:
+                    statuses[task.parent_id][0] += status - task.status
+                    changed_children[task.parent_id] = task
+
+                task.status = status
+                recalculated.append(task)
+
+            self.save(recalculated)
+            self.update_loaded(recalculated)
+
+        for actor, task in notifications:
+            send_message(
+                actor,
+                'change status of task to {0}'.format(
+                    task.get_status_display()
+                ),
+                task
+            )
+
+        self.tasks = []
+
+        return recalculated
+
+    @staticmethod
+    def save(tasks):
+        """ Save statuses of tasks by one query.
+
+        post_save is not sent for the tasks, as it is for parent.save():
+        their parents are recalculated by the rollup itself, task lists are
+        invalidated here, and searched fields, owner and owners chain are
+        not changed, so search index and assignment receivers have nothing
+        to do. Loaded objects of the rows are updated by update_loaded.
+        :param tasks: list of tasks
+        :return:
+        """
+        if not tasks:
+            return
+
+        time_update = timezone.now()
+        Task.objects.filter(pk__in=[task.pk for task in tasks]).update(
+            status=Case(
+                *[When(pk=task.pk, then=Value(task.status)) for task in tasks],
+                default=F('status'), output_field=models.SmallIntegerField()
+            ),
+            time_update=time_update,
+        )
+        for task in tasks:
+            task.saved_status = task.status
+            task.time_update = time_update
+        invalidate_task_lists(tasks)
+
+    def update_loaded(self, tasks):
+        """ Set saved statuses to objects of the same rows loaded by request:
+        objects of identity map and cached parents of changed tasks. Later
+        save of such object does not write old status back.
+        :param tasks: list of saved tasks
+        :return:
+        """
+        saved = {task.pk: task for task in tasks}
+        loaded = [identity_map.get_loaded_object(Task, pk) for pk in saved]
+        loaded += [getattr(task, '_parent_cache', None) for task in self.tasks]
+        for obj in loaded:
+            task = saved.get(getattr(obj, 'pk', None))
+            if task is not None and obj is not task:
+                obj.status = obj.saved_status = task.status
+                obj.time_update = task.time_update
+
+
+def get_deferred_rollup():
+    """ Get rollup of current thread
+    :return: StatusRollup object or None if rollup is not deferred
+    """
+    return getattr(_local, 'rollup', None)
+
+
+@contextmanager
+def deferred_rollup():
+    """ Recalculate ancestors of all tasks saved in block by one rollup at
+    the end of the block, in the same transaction. Ancestors shared by
+    several saved tasks are recalculated once.
+    """
+    with transaction.atomic():
+        previous_rollup = get_deferred_rollup()
+        _local.rollup = StatusRollup()
+        try:
+            yield _local.rollup
+            _local.rollup.run()
+        finally:
+            _local.rollup = previous_rollup
@@ -0,0 +1,167 @@
+import re
+from collections import defaultdict, Counter
+
+from django.db import connection
+from django.db.models import Count, Sum
+
+from task_management.models import Task, TaskComment, TaskSearchTerm
+
+# indexed fields of task, comments are indexed as the last field
+FIELDS = ('title', 'description', 'status_description')
+# rank weights of fields and comments
+WEIGHTS = (10, 1, 2, 1)
+
+WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def get_words(text):
+    return [word.lower() for word in WORD.findall(text or '')]
+
+
+def get_task_fields(task):
+    return tuple(getattr(task, name) for name in FIELDS)
+
+
+def get_documents(tasks):
+    """ Get indexed texts of tasks, comments are loaded by one query
+    :param tasks: list of Task objects
+    :return: list of tuples (task id, title, description,
+    status description, comments)
+    """
+    comments = defaultdict(list)
+    for task_id, message in TaskComment.objects.filter(task__in=tasks)\
+            .order_by('id').values_list('task_id', 'message'):
+        comments[task_id].append(message)
+
+    return [
+        (task.id, ) + tuple(value or '' for value in get_task_fields(task)) +
+        ('\n'.join(comments[task.id]), )
+        for task in tasks
+    ]
+
+
+class SqliteSearchIndex(object):
+    """ Search index in SQLite FTS5 virtual table, rowid is task id """
+    table = 'task_management_task_fts'
+    batch_size = 150
+
+    def update(self, tasks):
+        """ Index tasks again
+        :param tasks: list of Task objects
+        :return:
+        """
+        if not tasks:
+            return
+
+        documents = get_documents(tasks)
+        with connection.cursor() as cursor:
+            self.delete([task.id for task in tasks], cursor)
+            # rows are inserted by one query per batch, batch size keeps
+            # number of parameters below SQLite limit
+            for i in range(0, len(documents), self.batch_size):
+                batch = documents[i:i + self.batch_size]
+                cursor.execute(
+                    'INSERT INTO {0} (rowid, title, description, '
+                    'status_description, comments) VALUES {1}'.format(
+                        self.table,
+                        ', '.join(['(%s, %s, %s, %s, %s)'] * len(batch))
+                    ),
+                    [value for document in batch for value in document]
+                )
+
+    def delete(self, task_ids, cursor=None):
+        if not task_ids:
+            return
+
+        sql = 'DELETE FROM {0} WHERE rowid IN ({1})'.format(
+            self.table, ', '.join(['%s'] * len(task_ids)))
+        if cursor:
+            cursor.execute(sql, task_ids)
+        else:
+            with connection.cursor() as cursor:
+                cursor.execute(sql, task_ids)
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM {0}'.format(self.table))
+
+    def search(self, words, tasks, limit):
+        """ Find tasks which contain all words or words with these prefixes
+        :param words: list of words
+        :param tasks: Task queryset of allowed tasks
+        :param limit: max number of tasks
+        :return: list of task ids, the most relevant first
+        """
+        match = ' '.join('"{0}"*'.format(word) for word in words)
+        tasks_sql, tasks_params = tasks.values('id').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT rowid FROM {0} WHERE {0} MATCH %s AND rowid IN ({1}) '
+                'ORDER BY bm25({0}, {2}) LIMIT %s'.format(
+                    self.table, tasks_sql,
+                    ', '.join(str(float(weight)) for weight in WEIGHTS)
+                ),
+                (match, ) + tuple(tasks_params) + (limit, )
+            )
+
+            return [row[0] for row in cursor.fetchall()]
+
+
+class TermSearchIndex(object):
+    """ Inverted index in TaskSearchTerm table for databases without
+    SQLite FTS5. Rank is sum of weights of matched words in fields.
+    """
+    def update(self, tasks):
+        terms = []
+        for document in get_documents(tasks):
+            weights = Counter()
+            for text, weight in zip(document[1:], WEIGHTS):
+                for word in get_words(text):
+                    weights[word[:TaskSearchTerm.TERM_LENGTH]] += weight
+            terms.extend(
+                TaskSearchTerm(task_id=document[0], term=term, weight=weight)
+                for term, weight in weights.items()
+            )
+
+        self.delete([task.id for task in tasks])
+        TaskSearchTerm.objects.bulk_create(terms)
+
+    def delete(self, task_ids):
+        TaskSearchTerm.objects.filter(task_id__in=task_ids).delete()
+
+    def clear(self):
+        TaskSearchTerm.objects.all().delete()
+
+    def search(self, words, tasks, limit):
+        words = {word[:TaskSearchTerm.TERM_LENGTH] for word in words}
+        rows = TaskSearchTerm.objects\
+            .filter(term__in=words, task__in=tasks.values('id'))\
+            .values('task').annotate(matched=Count('term'),
+                                     rank=Sum('weight'))\
+            .filter(matched=len(words)).order_by('-rank')[:limit]
+
+        return [row['task'] for row in rows]
+
+
+def get_search_index():
+    if connection.vendor == 'sqlite':
+        return SqliteSearchIndex()
+
+    return TermSearchIndex()
+
+
+def search_tasks(query, tasks, limit=50):
+    """ Full text search of tasks
+    :param query: search string
+    :param tasks: Task queryset of tasks which can be found
+    :param limit: max number of tasks
+    :return: list of Task objects, the most relevant first
+    """
+    words = get_words(query)
+    if not words:
+        return []
+
+    task_ids = get_search_index().search(words, tasks, limit)
+    found = Task.objects.select_related('owner').in_bulk(task_ids)
+
+    return [found[task_id] for task_id in task_ids if task_id in found]
@@ -1,30 +1,95 @@
-from functools import reduce
 from django.dispatch import receiver
-from django.db.models.signals import post_save, pre_save, pre_delete
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, pre_delete, \
+    post_delete
+
+from notifications.models import Notification
+
+from task_management import identity_map
+from task_management.helpers import clear_unread_notifications_state
+from task_management.list_cache import invalidate_task_lists
+from task_management.models import Task, TaskAssignedUser, \
+    TaskAttachment, AttachmentBlob, TaskComment
+from task_management.permissions import clear_owners_chain_cache
+from task_management.pubsub import publish_notifications
+from task_management.rollup import StatusRollup, get_deferred_rollup
+from task_management.search import get_search_index, get_task_fields
+
+
+@receiver(post_init, sender=Task)
+def remember_task_status(sender, instance, **kwargs):
+    """ Remember saved task status, owner and searched fields, so their
+    changes can be found without fetching task again
+    """
+    instance.saved_status = instance.status if instance.pk else None
+    instance.saved_owner_id = instance.owner_id if instance.pk else None
+    # indexed fields, index is not updated if they are not changed
+    instance.saved_search_fields = get_task_fields(instance) \
+        if instance.pk else None
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_save, sender=TaskAssignedUser)
+def add_to_identity_map(sender, instance, **kwargs):
+    """ Saved object is actual state of row for identity map """
+    # mptt updates cached tree fields after post_save, the object can be
+    # saved again by other receivers before it
+    instance._mptt_meta.update_mptt_cached_fields(instance)
+    identity_map.add_object(instance)
 
-from task_management.models import Task, TaskAssignedUser, TaskAttachment
-from task_management.helpers import send_message
+
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=TaskAssignedUser)
+def remove_from_identity_map(sender, instance, **kwargs):
+    identity_map.remove_object(instance)
+
+
+@receiver(post_save, sender=Task)
+def recalculate_parent_task_status(sender, instance, created, **kwargs):
+    """ Signal recalculate status for all parents of task by one pass,
+    inside deferred_rollup block parents are recalculated at its end
+    """
+    deferred = get_deferred_rollup()
+    rollup = deferred or StatusRollup()
+    rollup.add(instance, instance.saved_status, created)
+    if deferred is None:
+        rollup.run()
+
+    instance.saved_status = instance.status
 
 
 @receiver(post_save, sender=Task)
 def add_user_to_assign_chain(sender, instance, **kwargs):
-    """ Add user to task owner chain if owner changes """
-    if instance.owner:
-        owner_chain_last_el = TaskAssignedUser.objects.filter(task=instance)\
-            .order_by('time_assign').last()
+    """ Add user to task owner chain if owner changes. The last assignment
+    is fetched only if owner is changed since task was loaded.
+    """
+    owner_changed = instance.owner_id != instance.saved_owner_id
+    instance.saved_owner_id = instance.owner_id
+    if not instance.owner_id or \
+            instance.current_assignment_id and not owner_changed:
+        return
+
+    owner_chain_last_el = identity_map.get_object(
+        TaskAssignedUser, pk=instance.current_assignment_id
+    ) if instance.current_assignment_id else None
 
-        if not owner_chain_last_el:
-            TaskAssignedUser.objects.create(user=instance.owner, task=instance)
+    if owner_chain_last_el and \
+            owner_chain_last_el.user_id == instance.owner_id:
+        return
 
-        if owner_chain_last_el and owner_chain_last_el.user != instance.owner:
-            TaskAssignedUser.objects.create(user=instance.owner, task=instance,
-                                            parent=owner_chain_last_el)
+    assignment = TaskAssignedUser.objects.create(
+        user_id=instance.owner_id, task=instance, parent=owner_chain_last_el
+    )
+    # task object of the receivers can be other object without identity map
+    instance.set_current_assignment(assignment)
 
 
 @receiver(post_save, sender=TaskAssignedUser)
-def change_assign_status(sender, instance, **kwargs):
+def change_assign_status(sender, instance, created, **kwargs):
     """ Change task status if user accept or reject assign """
-    task = Task.objects.get(pk=instance.task.pk)
+    task = identity_map.get_object(Task, pk=instance.task_id)
+    if created or task.current_assignment_id == instance.pk:
+        task.set_current_assignment(instance)
 
     if instance.assign_accept is None:
         task.status = Task.STATUS_PENDING
@@ -39,54 +104,90 @@ def change_assign_status(sender, instance, **kwargs):
     task.save()
 
 
-@receiver(pre_save, sender=Task)
-def recalculate_parent_task_status(sender, instance, **kwargs):
-    """ Signal recalculate status for parent task.
+@receiver(post_delete, sender=TaskAssignedUser)
+def clear_current_assignment(sender, instance, **kwargs):
+    """ Current assignment of task row is cleared by database, loaded task
+    object is cleared too, so it is not saved with deleted assignment
+    """
+    task = identity_map.get_loaded_object(Task, instance.task_id)
+    if task is not None and task.current_assignment_id == instance.pk:
+        task.set_current_assignment(None)
+
+
+@receiver(post_save, sender=TaskAssignedUser)
+@receiver(post_delete, sender=TaskAssignedUser)
+def invalidate_owners_chain_cache(sender, instance, **kwargs):
+    """ Clear cached owners chain used for permission checks """
+    clear_owners_chain_cache(instance.task_id)
+
+
+@receiver(post_save, sender=Notification)
+@receiver(post_delete, sender=Notification)
+def invalidate_unread_notifications_state(sender, instance, **kwargs):
+    """ Clear cached unread notifications count of recipient """
+    clear_unread_notifications_state([instance.recipient_id])
 
-    It will cause recursion for all parents.
+
+@receiver(post_save, sender=Notification)
+def publish_notification(sender, instance, created, **kwargs):
+    """ Send new notification to notifications stream after commit, so
+    stream does not read uncommitted or rolled back notification
     """
-    if instance.parent:
-        if instance.id:
-            task = Task.objects.get(id=instance.id)
-            if task.status != instance.status:
-                # task status changes
-                recalculate_status(instance.parent, instance)
-        else:
-            recalculate_status(instance.parent, instance)
-
-
-def recalculate_status(parent_task, current_task):
-    """ Calculate parent task status by average child task status. """
-    children = parent_task.get_children()
-    children_status = [int(i.status) for i in children
-                       if i.id != current_task.id]
-    children_status.append(int(current_task.status))
-    status_sum = reduce(lambda x, y: x + y, children_status)
-    status_avg = int(status_sum / len(children_status))
-
-    if status_avg < Task.STATUS_WORKING:
-        # the parent task status cannot be less STATUS_WORKING
-        status_avg = Task.STATUS_WORKING
-    if status_avg == Task.STATUS_COMPLETE:
-        # the parent task status equal COMPLETE if all parent task have APPROVE
-        # status
-        status_avg = Task.STATUS_ALMOST_DONE
-    if status_avg > Task.STATUS_COMPLETE:
-        # the parent task status cannot be greater STATUS_COMPLETE
-        status_avg = Task.STATUS_COMPLETE
-        send_message(
-            current_task.owner,
-            'change status of task to {0}'.format(
-                dict(Task.STATUS_CHOICES)[status_avg]
-            ),
-            parent_task
-        )
-
-    parent_task.status = status_avg
-    parent_task.save()
+    if created:
+        recipient_ids = [instance.recipient_id]
+        transaction.on_commit(lambda: publish_notifications(recipient_ids))
+
+
+@receiver(post_save, sender=TaskAttachment)
+def add_attachment_reference(sender, instance, created, **kwargs):
+    """ Count reference of attachment to stored file """
+    if created:
+        AttachmentBlob.add_references([instance.attachment.name])
 
 
 @receiver(pre_delete, sender=TaskAttachment)
 def attachment_delete(sender, instance, **kwargs):
-    """ Delete attachment from file system """
-    instance.attachment.delete(False)
+    """ Delete attachment from file system if it is the last reference to
+    the stored file
+    """
+    AttachmentBlob.remove_reference(instance.attachment.name)
+
+
+@receiver(post_save, sender=Task)
+def update_search_index(sender, instance, **kwargs):
+    search_fields = get_task_fields(instance)
+    if search_fields != instance.saved_search_fields:
+        get_search_index().update([instance])
+        instance.saved_search_fields = search_fields
+
+
+@receiver(post_delete, sender=Task)
+def delete_from_search_index(sender, instance, **kwargs):
+    get_search_index().delete([instance.id])
+
+
+@receiver(post_save, sender=TaskComment)
+@receiver(post_delete, sender=TaskComment)
+def update_comment_search_index(sender, instance, **kwargs):
+    """ Comments are indexed with task """
+    try:
+        task = identity_map.get_object(Task, pk=instance.task_id)
+    except Task.DoesNotExist:
+        # comment is deleted with task
+        return
+
+    get_search_index().update([task])
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def invalidate_task_list_cache(sender, instance, **kwargs):
+    """ Change versions of cached task lists which contain the task """
+    invalidate_task_lists([instance])
+
+
+@receiver(post_save, sender=TaskAssignedUser)
+@receiver(post_delete, sender=TaskAssignedUser)
+def invalidate_assigned_task_list_cache(sender, instance, **kwargs):
+    """ Change version of cached task list of assigned user """
+    invalidate_task_lists(user_ids=[instance.user_id])
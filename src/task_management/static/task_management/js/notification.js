@@ -1,3 +1,128 @@
+// Replacement of notifications/notify.js: new notifications are received
+// from server stream, if stream is not available notifications delta is
+// polled with backoff.
+var notify_badge_id;
+var notify_menu_id;
+var notify_api_url;
+var notify_fetch_count;
+var notify_unread_url;
+var notify_mark_all_unread_url;
+var notify_refresh_period = 15000;
+var notify_stream_url;
+var notify_delta_url;
+var notify_max_refresh_period = 120000;
+var registered_functions = [];
+
+var notify_cursor = 0;
+var notify_unread_list = [];
+var notify_poll_delay;
+
+function register_notifier(func) {
+    registered_functions.push(func);
+}
+
+function call_notifiers(data) {
+    for (var i=0; i < registered_functions.length; i++) {
+        registered_functions[i](data);
+    }
+}
+
+function fill_notification_badge(data) {
+    var badge = document.getElementById(notify_badge_id);
+    if (badge) {
+        badge.innerHTML = data.unread_count;
+    }
+}
+
+function fetch_notifications(callback) {
+    // load the last unread notifications
+    var r = new XMLHttpRequest();
+    r.open("GET", notify_api_url + '?max=' + notify_fetch_count, true);
+    r.onreadystatechange = function () {
+        if (r.readyState != 4) {
+            return;
+        }
+        if (r.status == 200) {
+            var data = JSON.parse(r.responseText);
+            notify_unread_list = data.unread_list;
+            for (var i=0; i < notify_unread_list.length; i++) {
+                notify_cursor = Math.max(notify_cursor, notify_unread_list[i].id);
+            }
+            call_notifiers(data);
+        }
+        if (callback) {
+            callback();
+        }
+    };
+    r.send();
+}
+
+function apply_notifications_delta(delta) {
+    notify_cursor = delta.cursor;
+    notify_unread_list = delta.notifications.reverse()
+        .concat(notify_unread_list).slice(0, notify_fetch_count);
+    call_notifiers({
+        unread_count: delta.unread_count,
+        unread_list: notify_unread_list
+    });
+}
+
+function listen_notifications() {
+    if (!window.EventSource) {
+        poll_notifications_delta();
+        return;
+    }
+
+    var failures = 0;
+    var source = new EventSource(notify_stream_url + '?cursor=' + notify_cursor);
+    source.onopen = function () {
+        failures = 0;
+    };
+    source.onmessage = function (e) {
+        apply_notifications_delta(JSON.parse(e.data));
+    };
+    source.onerror = function () {
+        // browser reconnects after stream timeout, but if server is not
+        // available switch to polling
+        failures++;
+        if (failures >= 3) {
+            source.close();
+            notify_poll_delay = notify_refresh_period;
+            setTimeout(poll_notifications_delta, notify_poll_delay);
+        }
+    };
+}
+
+function poll_notifications_delta() {
+    var r = new XMLHttpRequest();
+    r.open("GET", notify_delta_url + '?cursor=' + notify_cursor, true);
+    r.onreadystatechange = function () {
+        if (r.readyState != 4) {
+            return;
+        }
+        var delta = r.status == 200 ? JSON.parse(r.responseText) : null;
+        if (delta) {
+            apply_notifications_delta(delta);
+        }
+        if (delta && delta.notifications.length) {
+            notify_poll_delay = notify_refresh_period;
+        } else {
+            // nothing new or error: poll less often
+            notify_poll_delay = Math.min(notify_poll_delay * 2,
+                                         notify_max_refresh_period);
+        }
+        setTimeout(poll_notifications_delta, notify_poll_delay);
+    };
+    r.send();
+}
+
+window.addEventListener('load', function () {
+    notify_poll_delay = notify_refresh_period;
+    if (registered_functions.length > 0) {
+        fetch_notifications(listen_notifications);
+    }
+});
+
 function ajax_get(url, callback){
     var r = new XMLHttpRequest();
     r.open("GET", url, true);
@@ -38,6 +163,7 @@ function task_fill_notification_list(data) {
 
 function mark_all_as_read() {
     ajax_get(notify_mark_all_unread_url, function () {
+        notify_unread_list = [];
         var menu = document.getElementById(notify_menu_id);
         if (menu){
             menu.innerHTML = "";
@@ -50,6 +176,10 @@ function mark_all_as_read() {
 function mark_as_read(self, slug) {
     var mark_as_read_url = '/inbox/notifications/mark-as-read/' + slug + '/';
     ajax_get(mark_as_read_url, function () {
+        notify_unread_list = notify_unread_list.filter(function (item) {
+            return item.slug != slug;
+        });
+
         var li = self.parentElement;
         var menu = li.parentElement;
         menu.removeChild(li);
@@ -62,4 +192,3 @@ function mark_as_read(self, slug) {
 
     return false;
 }
-
@@ -0,0 +1,20 @@
+function toggle_task_children(link, url) {
+    // load direct children of task on first click, then show/hide them
+    var children = link.nextElementSibling;
+    if (children.getAttribute('data-loaded')) {
+        children.style.display = children.style.display == 'none' ? '' : 'none';
+        return false;
+    }
+
+    var r = new XMLHttpRequest();
+    r.open("GET", url, true);
+    r.onreadystatechange = function () {
+        if (r.readyState == 4 && r.status == 200) {
+            children.innerHTML = r.responseText;
+            children.setAttribute('data-loaded', '1');
+        }
+    };
+    r.send();
+
+    return false;
+}
@@ -0,0 +1,69 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import LazyObject, empty
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """ File system storage which names files by SHA-256 digest of content:
+    <upload dir>/<2 digest chars>/<digest>. Identical uploads are stored
+    once. Content is hashed while it is written to temporary file, which
+    is renamed to digest name when upload is complete.
+    """
+    def get_available_name(self, name, max_length=None):
+        # name is replaced by digest in _save
+        return name
+
+    def get_digest_name(self, directory, digest):
+        return os.path.join(directory, digest[:2], digest)
+
+    def _save(self, name, content):
+        directory = os.path.dirname(name)
+        tmp_directory = self.path(os.path.join(directory, 'tmp'))
+        os.makedirs(tmp_directory, exist_ok=True)
+
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_directory)
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    tmp_file.write(chunk)
+
+            name = self.get_digest_name(directory, digest.hexdigest())
+            path = self.path(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(tmp_path, self.file_permissions_mode)
+            # existing file is replaced too: it can be deleted after commit
+            # of removal of its last reference
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return name
+
+
+class AttachmentStorage(LazyObject):
+    """ Storage of attachments, created on first use from current settings
+    """
+    def _setup(self):
+        self._wrapped = ContentAddressedStorage()
+
+
+attachment_storage = AttachmentStorage()
+
+
+@receiver(setting_changed)
+def reset_attachment_storage(setting, **kwargs):
+    """ Storage location depends on settings, as default_storage does """
+    if setting in ('MEDIA_ROOT', 'MEDIA_URL', 'FILE_UPLOAD_PERMISSIONS'):
+        attachment_storage._wrapped = empty
@@ -1,3 +1,1945 @@
-from django.test import TestCase
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import patch
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command, CommandError
+from django.core.urlresolvers import reverse
+from django.db import IntegrityError, connection, reset_queries, \
+    transaction
+from django.db.models import Max, Q
+from django.http import HttpResponse
+from django.test import TestCase, TransactionTestCase, RequestFactory, \
+    override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from notifications.models import Notification
+
+from task_management.action_log import buffered_action_log
+from task_management.archive import ActionLogArchive, archive_action_log
+from task_management.assign import create_task_copies
+from task_management.export import iterate_rows
+from task_management.upload import delete_expired_uploads
+from task_management.forms import TaskForm, TaskFilterForm
+from task_management import identity_map
+from task_management.helpers import send_message, send_email_digests, \
+    get_visible_tasks
+from task_management.middleware import ActionLogMiddleware
+from task_management.models import Task, TaskAssignedUser, \
+    TaskDigestMessage, TaskActionLog, TaskComment, TaskAttachment, \
+    AttachmentBlob, AttachmentUpload
+from task_management.permissions import TaskPermissions, \
+    get_owners_chain_states
+from task_management.rollup import StatusRollup
+from task_management.search import search_tasks, TermSearchIndex
+from task_management.views import TaskListView, TaskInboxView
+
+# benchmarks are slow, run them with TASK_MANAGEMENT_BENCHMARK=1
+BENCHMARK = os.environ.get('TASK_MANAGEMENT_BENCHMARK')
+
+
+def bulk_create_forest(creator, tree_count, tree_size):
+    """ Create task trees without signals and MPTT bookkeeping.
+    Every tree is a chain of tree_size tasks, each task is parent of the
+    next one.
+    :param creator: User object
+    :param tree_count: number of trees
+    :param tree_size: number of tasks in one tree
+    :return:
+    """
+    first_tree_id = (Task.objects.aggregate(Max('tree_id'))['tree_id__max']
+                     or 0) + 1
+    tree_ids = range(first_tree_id, first_tree_id + tree_count)
+    tasks = []
+    for tree_id in tree_ids:
+        for level in range(tree_size):
+            tasks.append(Task(
+                title='task {0}.{1}'.format(tree_id, level), description='',
+                status_description='', creator=creator, tree_id=tree_id,
+                level=level, lft=level + 1, rght=2 * tree_size - level,
+            ))
+    Task.objects.bulk_create(tasks)
+
+    # link parents by tree order
+    for tree_id in tree_ids:
+        ids = list(Task.objects.filter(tree_id=tree_id)
+                   .order_by('lft').values_list('id', flat=True))
+        for parent_id, task_id in zip(ids, ids[1:]):
+            Task.objects.filter(id=task_id).update(parent_id=parent_id)
+
+
+class TaskListTreesTest(TestCase):
+    """ TaskListView.get_trees tests """
+    def setUp(self):
+        self.user = User.objects.create(username='creator')
+
+    def test_trees(self):
+        bulk_create_forest(self.user, 3, 4)
+        trees = TaskListView.get_trees(Task.objects.all())
+
+        self.assertEqual(len(trees), 3)
+        for tree in trees:
+            self.assertEqual([t.level for t in tree], [0, 1, 2, 3])
+
+    def test_partial_trees(self):
+        bulk_create_forest(self.user, 1, 4)
+        hidden = Task.objects.get(level=1)
+        trees = TaskListView.get_trees(Task.objects.exclude(id=hidden.id))
+
+        # task which parent is not visible begins new tree
+        self.assertEqual([[t.level for t in tree] for tree in trees],
+                         [[0], [2, 3]])
+
+
+@skipUnless(BENCHMARK, 'benchmark')
+class TaskListTreesBenchmark(TestCase):
+    """ TaskListView.get_trees scaling from 100 to 50k tasks """
+    def test_get_trees(self):
+        user = User.objects.create(username='creator')
+        created = 0
+        for count in (100, 1000, 10000, 50000):
+            bulk_create_forest(user, (count - created) // 10, 10)
+            created = count
+
+            start = time.time()
+            trees = TaskListView.get_trees(Task.objects.all())
+            print('\nget_trees: {0} tasks, {1} trees, {2:.3f}s'.format(
+                count, len(trees), time.time() - start))
+
+
+class TaskListLazyTest(TestCase):
+    """ TaskListView root tasks and TaskChildrenView tests """
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('creator', password='pass')
+        self.other = User.objects.create_user('other', password='pass')
+        self.root = Task.objects.create(title='root', creator=self.user)
+        self.child = Task.objects.create(title='child', creator=self.user,
+                                         parent=self.root)
+        self.hidden = Task.objects.create(title='hidden', creator=self.other,
+                                          parent=self.root)
+
+    def test_root_tasks(self):
+        self.client.login(username='creator', password='pass')
+        response = self.client.get(reverse('task_management:list'))
+
+        self.assertEqual(list(response.context['object_list']), [self.root])
+        self.assertEqual(response.context['object_list'][0].children_count, 1)
+
+        response = self.client.get(reverse('task_management:list'),
+                                   {'expand': 'all'})
+        self.assertEqual(response.context['task_trees'],
+                         [[self.root, self.child]])
+
+        # task which parent is not visible is a root task
+        self.client.login(username='other', password='pass')
+        response = self.client.get(reverse('task_management:list'))
+        self.assertEqual(list(response.context['object_list']), [self.hidden])
+
+    def test_children(self):
+        self.client.login(username='creator', password='pass')
+        url = reverse('task_management:children', kwargs={'pk': self.root.pk})
+        response = self.client.get(url, {'format': 'json'})
+
+        children = response.json()['children']
+        self.assertEqual([c['id'] for c in children], [self.child.id])
+        self.assertEqual(children[0]['children_count'], 0)
+
+        response = self.client.get(url)
+        self.assertContains(response, 'child')
+        self.assertNotContains(response, 'hidden')
+
+
+@skipUnless(BENCHMARK, 'benchmark')
+class StatusRollupBenchmark(TestCase):
+    """ Query count of parent status recalculation on deep and wide trees """
+    def setUp(self):
+        self.user = User.objects.create(username='creator')
+
+    def change_leaf_status(self, leaf):
+        leaf.status = Task.STATUS_HALF_DONE
+        with CaptureQueriesContext(connection) as queries:
+            leaf.save()
+
+        return len(queries)
+
+    def test_deep_tree(self):
+        task = None
+        for level in range(10):
+            task = Task.objects.create(title='task', creator=self.user,
+                                       parent=task)
+
+        print('\nrollup: deep tree (10 levels), {0} queries'.format(
+            self.change_leaf_status(task)))
+
+    def test_wide_tree(self):
+        root = Task.objects.create(title='root', creator=self.user)
+        for i in range(200):
+            leaf = Task.objects.create(title='task', creator=self.user,
+                                       parent=root)
+
+        print('\nrollup: wide tree (200 children), {0} queries'.format(
+            self.change_leaf_status(leaf)))
+
+
+class StatusRollupTest(TestCase):
+    """ Parent task status recalculation tests """
+    def setUp(self):
+        self.user = User.objects.create(username='creator')
+        self.root = Task.objects.create(title='root', creator=self.user)
+        self.task = Task.objects.create(title='task', creator=self.user,
+                                        parent=self.root)
+        self.leaf = Task.objects.create(title='leaf', creator=self.user,
+                                        parent=self.task)
+        self.sibling = Task.objects.create(title='sibling', creator=self.user,
+                                           parent=self.root)
+
+    def assertStatus(self, task, status):
+        self.assertEqual(Task.objects.get(pk=task.pk).status, status)
+
+    def test_minimum_working(self):
+        self.assertStatus(self.task, Task.STATUS_WORKING)
+        self.assertStatus(self.root, Task.STATUS_WORKING)
+
+    def test_ancestors(self):
+        self.leaf.status = Task.STATUS_ALMOST_DONE
+        with self.assertNumQueries(4):
+            # save, ancestors, children statuses, update
+            self.leaf.save()
+
+        self.assertStatus(self.task, Task.STATUS_ALMOST_DONE)
+        # (almost done + draft) / 2
+        self.assertStatus(self.root, Task.STATUS_WORKING)
+
+    def test_loaded_objects(self):
+        identity_map.activate()
+        self.addCleanup(identity_map.deactivate)
+        task = identity_map.get_object(Task, pk=self.task.pk)
+        leaf = Task.objects.select_related('parent').get(pk=self.leaf.pk)
+
+        leaf.status = Task.STATUS_ALMOST_DONE
+        leaf.save()
+        self.assertEqual(task.status, Task.STATUS_ALMOST_DONE)
+        self.assertEqual(leaf.parent.status, Task.STATUS_ALMOST_DONE)
+
+        # later save of loaded parent keeps recalculated status
+        task.title = 'renamed'
+        task.save()
+        self.assertStatus(self.task, Task.STATUS_ALMOST_DONE)
+
+    @patch('task_management.rollup.send_message')
+    def test_complete(self, send_message):
+        self.leaf.status = Task.STATUS_COMPLETE
+        self.leaf.save()
+        self.assertStatus(self.task, Task.STATUS_ALMOST_DONE)
+        self.assertFalse(send_message.called)
+
+        self.leaf.status = Task.STATUS_APPROVE
+        self.leaf.save()
+        self.assertStatus(self.task, Task.STATUS_COMPLETE)
+        send_message.assert_called_once_with(
+            None, 'change status of task to Completed', self.task
+        )
+
+
+class TaskPermissionsTest(TestCase):
+    """ TaskPermissions tests """
+    def setUp(self):
+        self.creator = User.objects.create_user('creator', password='pass')
+        self.owner = User.objects.create_user('owner', password='pass')
+        self.other = User.objects.create_user('other', password='pass')
+        self.task = Task.objects.create(title='task', creator=self.creator,
+                                        owner=self.owner)
+
+    def get_permissions(self, user):
+        task = Task.objects.get(pk=self.task.pk)
+        return TaskPermissions(user, task, get_owners_chain_states(task))
+
+    def test_pending(self):
+        permissions = self.get_permissions(self.owner)
+        self.assertTrue(permissions.view and permissions.accept)
+        self.assertFalse(permissions.change or permissions.reassign)
+
+        permissions = self.get_permissions(self.creator)
+        self.assertTrue(permissions.change and permissions.delete)
+        self.assertFalse(permissions.accept or permissions.approve)
+
+        self.assertFalse(self.get_permissions(self.other).view)
+
+    def test_accepted(self):
+        TaskAssignedUser.objects.filter(task=self.task)\
+            .update(assign_accept=True)
+
+        permissions = self.get_permissions(self.owner)
+        self.assertTrue(permissions.change and permissions.reassign)
+        self.assertFalse(permissions.accept or permissions.delete)
+
+    def test_detail_page(self):
+        self.client.login(username='owner', password='pass')
+        url = reverse('task_management:detail', kwargs={'pk': self.task.pk})
+        response = self.client.get(url)
+        self.assertContains(response, 'Accept task')
+        self.assertNotContains(response, 'Edit task')
+
+        self.client.login(username='other', password='pass')
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+
+@patch('task_management.helpers.send_emails')
+class IdentityMapTest(TestCase):
+    """ Request scoped identity map tests """
+    def setUp(self):
+        self.creator = User.objects.create_user('creator', password='pass')
+        self.owner = User.objects.create_user('owner', password='pass')
+
+    def test_create_and_accept(self, send_emails):
+        self.client.login(username='creator', password='pass')
+        self.client.post(reverse('task_management:create'), {
+            'title': 'task', 'description': 'description',
+            'criticality': Task.CRITICALITY_HIGH,
+            'assigned_to': [self.owner.pk],
+        })
+        task = Task.objects.get()
+        self.assertEqual(task.owner, self.owner)
+        self.assertEqual(task.status, Task.STATUS_PENDING)
+
+        self.client.login(username='owner', password='pass')
+        response = self.client.get(reverse('task_management:accept',
+                                           kwargs={'pk': task.pk}))
+        self.assertEqual(Task.objects.get().status, Task.STATUS_WORKING)
+        # task fetched by change_assign_status signal is served from map
+        self.assertEqual(response.wsgi_request.identity_map_stats,
+                         {'hits': 1, 'misses': 2})
+
+    def test_create_sub_task(self, send_email):
+        parent = Task.objects.create(title='parent', creator=self.creator)
+        self.client.login(username='creator', password='pass')
+        self.client.post(
+            reverse('task_management:sub_task_create', args=[parent.pk]), {
+                'title': 'task', 'description': 'description',
+                'criticality': Task.CRITICALITY_HIGH,
+                'assigned_to': [self.owner.pk],
+            }
+        )
+        # task saved again by change_assign_status keeps its tree position
+        fields = ('id', 'tree_id', 'lft', 'rght', 'level', 'parent_id')
+        tasks = list(Task.objects.order_by('id').values_list(*fields))
+        Task.objects.rebuild()
+        self.assertEqual(
+            tasks, list(Task.objects.order_by('id').values_list(*fields))
+        )
+        self.assertEqual(Task.objects.get(title='task').parent, parent)
+
+    def test_unknown_task(self, send_email):
+        self.client.login(username='creator', password='pass')
+        for name in ('detail', 'update', 'delete', 'children', 'history',
+                     'accept', 'reject', 'approve', 'decline', 'reassign',
+                     'sub_task_create'):
+            response = self.client.get(
+                reverse('task_management:' + name, args=[999])
+            )
+            self.assertEqual(response.status_code, 404, name)
+
+        response = self.client.post(
+            reverse('task_management:comment_create', args=[999]),
+            {'message': 'text'}
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+@patch('task_management.helpers.send_emails')
+class SendMessageTest(TestCase):
+    """ send_message tests """
+    def test_bulk(self, send_emails):
+        actor = User.objects.create(username='actor', email='actor@test.com')
+        users = [User.objects.create(username=name, email=name + '@test.com')
+                 for name in ('first', 'second', 'third')]
+        task = Task.objects.create(title='task', creator=actor)
+
+        with self.assertNumQueries(1), \
+                self.assertLogs('task_management.helpers', 'DEBUG') as logs:
+            send_message(actor, 'verb', task, users + [actor])
+        self.assertIn('Sent 3 notifications to 3 recipients, saved 2 '
+                      'inserts, 2 publishes and 2 email tasks', logs.output[0])
+
+        # actor not receive messages about self activities
+        self.assertEqual(
+            sorted(Notification.objects.values_list('recipient__username',
+                                                    flat=True)),
+            ['first', 'second', 'third']
+        )
+        self.assertEqual(Notification.objects.filter(
+            verb='verb', target_object_id=task.pk, actor_object_id=actor.pk
+        ).count(), 3)
+        send_emails.delay.assert_called_once_with([
+            (user.email, "actor verb <a href='{0}'>task</a>".format(
+                task.get_absolute_url()))
+            for user in users
+        ])
+
+
+@patch('task_management.helpers.send_emails')
+@override_settings(TASK_EMAIL_DIGEST=True)
+class EmailDigestTest(TestCase):
+    """ Email digest tests """
+    def test_digest(self, send_emails):
+        actor = User.objects.create(username='actor', email='actor@test.com')
+        user = User.objects.create(username='user', email='user@test.com')
+        task = Task.objects.create(title='task', creator=actor)
+
+        send_message(actor, 'change status of task', task, [user])
+        send_message(actor, 'add comment', task, [user])
+        self.assertFalse(send_emails.delay.called)
+
+        # urgent verb is sent immediately
+        send_message(actor, 'assigned you task', task, [user])
+        self.assertTrue(send_emails.delay.called)
+
+        send_email_digests()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['user@test.com'])
+        self.assertIn('change status of task', mail.outbox[0].body)
+        self.assertIn('add comment', mail.outbox[0].body)
+        self.assertFalse(TaskDigestMessage.objects.exists())
+
+
+@patch('task_management.helpers.send_emails')
+class UnreadNotificationListTest(TestCase):
+    """ live_unread_notification_list tests """
+    def setUp(self):
+        cache.clear()
+        self.actor = User.objects.create(username='actor')
+        self.user = User.objects.create_user('user', password='pass')
+        self.client.login(username='user', password='pass')
+        self.url = reverse('live_unread_notification_list')
+
+    def send_messages(self, count):
+        for i in range(count):
+            task = Task.objects.create(title='task', creator=self.actor)
+            send_message(self.actor, 'verb', task, [self.user])
+
+    def get_queries_number(self, max_number):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'max': max_number})
+
+        self.assertEqual(len(response.json()['unread_list']), max_number)
+
+        return len(queries)
+
+    def test_queries_number(self, send_emails):
+        self.send_messages(10)
+        # cache unread count
+        self.client.get(self.url)
+
+        self.assertEqual(self.get_queries_number(2),
+                         self.get_queries_number(10))
+
+    def test_etag(self, send_emails):
+        self.send_messages(1)
+        response = self.client.get(self.url)
+        self.assertEqual(response.json()['unread_count'], 1)
+
+        etag = response['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # the same version after cache expiration
+        cache.clear()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.send_messages(1)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json()['unread_count'], 2)
+
+        self.client.get(reverse('notifications:mark_all_as_read'))
+        response = self.client.get(self.url)
+        self.assertEqual(response.json()['unread_count'], 0)
+
+
+@patch('task_management.helpers.send_emails')
+@override_settings(
+    TASK_NOTIFICATIONS_STREAM_PING=0.01,
+    TASK_NOTIFICATIONS_PUBSUB='task_management.pubsub.LocalPubSub'
+)
+class NotificationStreamTest(TransactionTestCase):
+    """ Notifications delta and stream tests. Notifications are published
+    on commit, so tests are not wrapped in transaction.
+    """
+    def setUp(self):
+        self.actor = User.objects.create(username='actor')
+        self.user = User.objects.create_user('user', password='pass')
+        self.task = Task.objects.create(title='task', creator=self.actor)
+        self.client.login(username='user', password='pass')
+
+    def send_message(self):
+        send_message(self.actor, 'verb', self.task, [self.user])
+        return Notification.objects.latest('id')
+
+    def test_delta(self, send_emails):
+        first = self.send_message()
+        second = self.send_message()
+
+        response = self.client.get(reverse('live_notification_delta'),
+                                   {'cursor': first.id})
+        data = response.json()
+        self.assertEqual(data['cursor'], second.id)
+        self.assertEqual(data['unread_count'], 2)
+        self.assertEqual([n['id'] for n in data['notifications']],
+                         [second.id])
+
+    def test_stream(self, send_emails):
+        first = self.send_message()
+
+        response = self.client.get(reverse('live_notification_stream'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = (chunk.decode() for chunk in response.streaming_content
+                  if not chunk.startswith(b':'))
+        self.assertTrue(next(events).startswith('retry:'))
+
+        # notifications created before connection
+        self.assertTrue(next(events).startswith('id: {0}\n'.format(first.id)))
+
+        second = self.send_message()
+        event = next(events)
+        self.assertTrue(event.startswith('id: {0}\n'.format(second.id)))
+        data = json.loads(event.split('data: ', 1)[1])
+        self.assertEqual([n['id'] for n in data['notifications']],
+                         [second.id])
+        response.close()
+
+    def test_publish_on_commit(self, send_emails):
+        with patch('task_management.signals.publish_notifications') \
+                as publish:
+            with transaction.atomic():
+                Notification.objects.create(recipient=self.user,
+                                            actor=self.actor, verb='verb')
+                self.assertFalse(publish.called)
+            publish.assert_called_once_with([self.user.pk])
+
+            try:
+                with transaction.atomic():
+                    Notification.objects.create(recipient=self.user,
+                                                actor=self.actor, verb='verb')
+                    raise ValueError
+            except ValueError:
+                pass
+            self.assertEqual(publish.call_count, 1)
+
+
+@patch('task_management.helpers.send_emails')
+class ActionLogTest(TestCase):
+    """ Buffered TaskActionLog tests """
+    def setUp(self):
+        self.user = User.objects.create_user('user', password='pass')
+        self.task = Task.objects.create(title='task', creator=self.user)
+        ContentType.objects.get_for_model(Task)
+
+    def test_buffered(self, send_emails):
+        with buffered_action_log():
+            with self.assertNumQueries(0):
+                TaskActionLog.log(self.user, 'first', self.task)
+                TaskActionLog.log(self.user, 'second', self.task)
+            self.assertFalse(TaskActionLog.objects.exists())
+
+        self.assertEqual(
+            list(TaskActionLog.objects.order_by('id')
+                 .values_list('action', 'object_id')),
+            [('first', self.task.id), ('second', self.task.id)]
+        )
+
+    def test_rollback(self, send_emails):
+        with self.assertRaises(ValueError):
+            with buffered_action_log():
+                TaskActionLog.log(self.user, 'action', self.task)
+                raise ValueError
+
+        self.assertFalse(TaskActionLog.objects.exists())
+
+    @override_settings(TASK_ACTION_LOG_BUFFERED=True)
+    def test_middleware(self, send_emails):
+        self.client.login(username='user', password='pass')
+        response = self.client.post(
+            reverse('task_management:update', args=[self.task.id]),
+            {'title': 'new title', 'description': 'text', 'criticality': 1,
+             'status': Task.STATUS_WORKING}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            TaskActionLog.objects.get().action, 'update task'
+        )
+
+    @override_settings(TASK_ACTION_LOG_BUFFERED=True)
+    def test_middleware_exception(self, send_emails):
+        def view(request):
+            TaskActionLog.log(self.user, 'action', self.task)
+            raise ValueError
+
+        middleware = ActionLogMiddleware()
+        request = RequestFactory().post('/')
+        # view is called by handler, other middleware is not skipped
+        self.assertIsNone(middleware.process_view(request, view, (), {}))
+        with self.assertRaises(ValueError) as raised:
+            view(request)
+        self.assertIsNone(
+            middleware.process_exception(request, raised.exception)
+        )
+        middleware.process_response(request, HttpResponse())
+
+        self.assertFalse(TaskActionLog.objects.exists())
+
+
+@skipUnless(BENCHMARK, 'benchmark')
+@patch('task_management.helpers.send_emails')
+class ActionLogBenchmark(TransactionTestCase):
+    """ Latency of TaskUpdateView and TaskForm._save_multi_assign with
+    synchronous and buffered action log. Queries run in autocommit mode as
+    in production.
+    """
+    rounds = 50
+
+    def setUp(self):
+        self.user = User.objects.create_user('user', password='pass')
+        self.owners = [User.objects.create(username='owner {0}'.format(i))
+                       for i in range(20)]
+
+    def report(self, name, measure):
+        measure(False)  # warm up caches
+        for buffered in (False, True):
+            with override_settings(TASK_ACTION_LOG_BUFFERED=buffered):
+                duration, query_count = 0, 0
+                for i in range(self.rounds):
+                    reset_queries()
+                    with CaptureQueriesContext(connection) as queries:
+                        start = time.time()
+                        measure(buffered)
+                        duration += time.time() - start
+                    query_count += len(queries)
+
+            print('\n{0}: buffered={1}, {2:.2f}ms, {3} queries'.format(
+                name, buffered, duration * 1000 / self.rounds,
+                query_count // self.rounds))
+
+    def test_update_view(self, send_emails):
+        task = Task.objects.create(title='task', creator=self.user)
+        url = reverse('task_management:update', args=[task.id])
+        self.client.login(username='user', password='pass')
+
+        def measure(buffered):
+            self.client.post(url, {'title': 'title', 'description': 'text',
+                                   'criticality': 1})
+
+        self.report('TaskUpdateView', measure)
+
+    def test_save_multi_assign(self, send_emails):
+        def measure(buffered):
+            task = Task.objects.create(title='task', creator=self.user)
+            form = TaskForm(self.user, {})
+            form.cleaned_data = {'attachments': []}
+            if buffered:
+                with buffered_action_log():
+                    form._save_multi_assign(self.owners, task)
+            else:
+                form._save_multi_assign(self.owners, task)
+
+        self.report('_save_multi_assign (20 owners)', measure)
+
+
+class ActionLogListTest(TestCase):
+    """ Keyset pages of action log and history tests """
+    def setUp(self):
+        self.user = User.objects.create_user('user', password='pass')
+        self.other = User.objects.create_user('other', password='pass')
+        self.task = Task.objects.create(title='task', creator=self.user)
+        self.other_task = Task.objects.create(title='other',
+                                              creator=self.other)
+        for i in range(30):
+            TaskActionLog.log(self.user, 'update task', self.task)
+            TaskActionLog.log(self.other, 'update task', self.other_task)
+        self.client.login(username='user', password='pass')
+        ContentType.objects.get_for_model(Task)
+
+    def get_pages(self, url, query_counts):
+        """ Walk all pages
+        :param url: list url
+        :param query_counts: number of queries of every page
+        :return: list of pages, page is list of entry ids
+        """
+        pages = []
+        before = ''
+        for query_count in query_counts:
+            with self.assertNumQueries(query_count):
+                response = self.client.get(url, {'before': before})
+            pages.append([log.id for log in response.context['object_list']])
+            before = response.context['next_before']
+        self.assertIsNone(before)
+
+        return pages
+
+    def test_action_log(self):
+        # session, user, log entries, tasks
+        pages = self.get_pages(reverse('task_management:action_log'),
+                               [4, 4, 4])
+        self.assertEqual([len(page) for page in pages], [25, 25, 10])
+        ids = [log_id for page in pages for log_id in page]
+        self.assertEqual(ids, list(
+            TaskActionLog.objects.order_by('-id').values_list('id', flat=True)
+        ))
+
+    def test_task_history(self):
+        # and task with owners chain for permission check, ids of comments
+        # and owners chain to filter archive after the last page
+        pages = self.get_pages(
+            reverse('task_management:history', args=[self.task.id]), [6, 8]
+        )
+        self.assertEqual([len(page) for page in pages], [25, 5])
+        self.assertEqual(
+            set(TaskActionLog.objects.filter(id__in=pages[0] + pages[1])
+                .values_list('object_id', flat=True)),
+            {self.task.id}
+        )
+
+        response = self.client.get(
+            reverse('task_management:history', args=[self.other_task.id])
+        )
+        self.assertEqual(response.status_code, 403)
+
+    def test_actor_history(self):
+        url = reverse('task_management:actor_history', args=[self.other.id])
+        response = self.client.get(url)
+        self.assertEqual(
+            {log.actor for log in response.context['object_list']},
+            {self.other}
+        )
+        self.assertEqual(response.context['title'], 'Actions of other')
+
+    @patch('task_management.helpers.send_emails')
+    def test_task_history_goals(self, send_emails):
+        comment = TaskComment.objects.create(task=self.task, author=self.user,
+                                             message='text')
+        TaskActionLog.log(self.user, 'add comment', comment)
+        assignment = TaskAssignedUser.objects.create(task=self.task,
+                                                     user=self.other)
+        TaskActionLog.log(self.other, 'reject task', assignment)
+        other_comment = TaskComment.objects.create(
+            task=self.other_task, author=self.other, message='text'
+        )
+        TaskActionLog.log(self.other, 'add comment', other_comment)
+
+        response = self.client.get(
+            reverse('task_management:history', args=[self.task.id])
+        )
+        self.assertEqual(response.context['title'], 'History of task task')
+        self.assertEqual(
+            [(log.action, log.action_goal)
+             for log in response.context['object_list'][:3]],
+            [('reject task', assignment), ('add comment', comment),
+             ('update task', self.task)]
+        )
+
+
+class ActionLogArchiveTest(TestCase):
+    """ Archival of old action log entries tests """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings = override_settings(TASK_ACTION_LOG_ARCHIVE_DIR=self.directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.user = User.objects.create_user('user', password='pass')
+        self.task = Task.objects.create(title='task', creator=self.user)
+        self.other_task = Task.objects.create(title='other',
+                                              creator=self.user)
+        now = timezone.now()
+        for days in (150, 100, 50, 10):
+            TaskActionLog.log(self.user, 'update task', self.task)
+            TaskActionLog.log(self.user, 'update task', self.other_task)
+            TaskActionLog.objects.filter(time_create__gt=now).update(
+                time_create=now - datetime.timedelta(days=days)
+            )
+        Task.objects.update(time_create=now - datetime.timedelta(days=200))
+        self.client.login(username='user', password='pass')
+
+    def test_archive(self):
+        ids = list(TaskActionLog.objects.order_by('id')
+                   .values_list('id', flat=True))
+        self.assertEqual(archive_action_log(30, batch_size=4), 6)
+        self.assertEqual(archive_action_log(30), 0)
+
+        self.assertEqual(TaskActionLog.objects.count(), 2)
+        archive = ActionLogArchive()
+        self.assertEqual(len(archive.get_months()), 3)
+        self.assertEqual([entry.id for entry in archive.get_entries()],
+                         ids[-3::-1])
+        self.assertEqual(
+            [entry.action_goal for entry in archive.get_entries(
+                before=ids[4], object_id=self.task.id
+            )], [self.task, self.task]
+        )
+
+    def test_interrupted(self):
+        rows = list(TaskActionLog.objects.order_by('id')[:2].values(
+            'id', 'actor_id', 'action', 'content_type_id', 'object_id',
+            'time_create'))
+        ActionLogArchive().append('1970-01', rows)
+
+        # archived rows are deleted, not archived again
+        self.assertEqual(archive_action_log(30), 4)
+        self.assertEqual(len(ActionLogArchive().get_entries()), 6)
+
+    def test_views(self):
+        archive_action_log(30)
+        url = reverse('task_management:history', args=[self.task.id])
+        response = self.client.get(url)
+        self.assertEqual(len(response.context['object_list']), 4)
+
+        # only members with entries newer than task are read
+        Task.objects.update(
+            time_create=timezone.now() - datetime.timedelta(days=60)
+        )
+        with patch.object(ActionLogArchive, 'read_member', autospec=True,
+                          side_effect=ActionLogArchive.read_member) as read:
+            response = self.client.get(url)
+        self.assertEqual(read.call_count, 1)
+        self.assertEqual(len(response.context['object_list']), 2)
+
+        response = self.client.get(reverse('task_management:action_log'))
+        self.assertEqual(len(response.context['object_list']), 8)
+
+    def test_archived_task_history_goals(self):
+        comment = TaskComment.objects.create(task=self.task, author=self.user,
+                                             message='text')
+        TaskActionLog.log(self.user, 'add comment', comment)
+        archive_action_log(0)
+
+        response = self.client.get(
+            reverse('task_management:history', args=[self.task.id])
+        )
+        self.assertEqual(
+            [log.action_goal for log in response.context['object_list']],
+            [comment] + [self.task] * 4
+        )
+
+
+class ExportTest(TestCase):
+    """ Streaming export tests """
+    def setUp(self):
+        self.user = User.objects.create_user('user', password='pass',
+                                             is_staff=True)
+        self.other = User.objects.create(username='other')
+        self.root = Task.objects.create(title='root', creator=self.user)
+        self.task = Task.objects.create(title='task', creator=self.user,
+                                        parent=self.root, owner=self.other)
+        self.other_tree = Task.objects.create(title='other',
+                                              creator=self.other)
+        self.client.login(username='user', password='pass')
+
+    def get_rows(self, name, **filters):
+        response = self.client.get(
+            reverse('task_management:export', args=[name, 'jsonl']), filters
+        )
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+
+        return [json.loads(line) for line in
+                b''.join(response.streaming_content).decode().splitlines()]
+
+    def test_csv(self):
+        response = self.client.get(
+            reverse('task_management:export', args=['task', 'csv'])
+        )
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertTrue(lines[0].startswith('id,title,'))
+        self.assertTrue(lines[0].endswith(',parent_id,lft,rght,tree_id,level'))
+        self.assertEqual(len(lines), 4)
+
+    def test_filters(self):
+        rows = self.get_rows('task', tree_id=self.root.tree_id)
+        self.assertEqual([row['id'] for row in rows],
+                         [self.root.id, self.task.id])
+        self.assertEqual(rows[1]['parent_id'], self.root.id)
+
+        rows = self.get_rows('task', user=self.other.id)
+        self.assertEqual([row['id'] for row in rows],
+                         [self.task.id, self.other_tree.id])
+
+        tomorrow = timezone.now() + datetime.timedelta(days=1)
+        rows = self.get_rows('task', since=tomorrow.strftime('%Y-%m-%d'))
+        self.assertEqual(rows, [])
+
+        TaskComment.objects.create(task=self.task, author=self.user,
+                                   message='text')
+        status = Task.objects.get(pk=self.task.pk).status
+        rows = self.get_rows('comment', status=status)
+        self.assertEqual([row['message'] for row in rows], ['text'])
+        self.assertEqual(
+            self.get_rows('comment', status=Task.STATUS_APPROVE), []
+        )
+
+    def test_errors(self):
+        url = reverse('task_management:export', args=['task', 'csv'])
+        self.assertEqual(self.client.get(url, {'status': 'x'}).status_code,
+                         400)
+
+        User.objects.filter(id=self.user.id).update(is_staff=False)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_chunks(self):
+        ids = list(Task.objects.order_by('id').values_list('id', flat=True))
+        with self.assertNumQueries(2):
+            rows = list(iterate_rows(Task.objects.all(), ('id', ), 2))
+        self.assertEqual([row[0] for row in rows], ids)
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile('r') as output:
+            call_command('export_data', 'task', '--format', 'jsonl',
+                         '--tree-id', str(self.other_tree.tree_id),
+                         '--output', output.name)
+            rows = [json.loads(line) for line in output]
+
+        self.assertEqual([row['title'] for row in rows], ['other'])
+
+        output = StringIO()
+        call_command('export_data', 'task', '--tree-id',
+                     str(self.other_tree.tree_id), stdout=output)
+        lines = output.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith('id,title,'))
+        self.assertEqual(len(lines), 2)
+
+
+@patch('task_management.helpers.send_emails')
+class MultiAssignTest(TestCase):
+    """ Bulk creation of task copies for assigned users tests """
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.user = User.objects.create_user('user', password='pass')
+        self.owners = [User.objects.create(username='owner {0}'.format(i))
+                       for i in range(4)]
+        self.client.login(username='user', password='pass')
+
+    def assertTreeValid(self):
+        fields = ('id', 'tree_id', 'lft', 'rght', 'level', 'parent_id')
+        tasks = list(Task.objects.order_by('id').values_list(*fields))
+        Task.objects.rebuild()
+        self.assertEqual(
+            tasks, list(Task.objects.order_by('id').values_list(*fields))
+        )
+
+    def create_task(self, url):
+        response = self.client.post(url, {
+            'title': 'task', 'description': 'text', 'criticality': 1,
+            'assigned_to': [owner.id for owner in self.owners],
+            'attachments': SimpleUploadedFile('file.txt', b'content'),
+        })
+        self.assertEqual(response.status_code, 302)
+
+        return Task.objects.filter(title='task').order_by('id')
+
+    def assertCopies(self, tasks):
+        self.assertEqual([task.owner for task in tasks], self.owners)
+        for task in tasks:
+            self.assertEqual(task.status, Task.STATUS_PENDING)
+            self.assertEqual(task.get_owners_chain(), [task.owner])
+            self.assertEqual(
+                [attachment.attachment.read() for attachment in
+                 task.attachments.all()], [b'content']
+            )
+            self.assertTrue(TaskActionLog.objects.filter(
+                action='create task', object_id=task.id
+            ).exists())
+            self.assertTrue(Notification.objects.filter(
+                recipient=task.owner, verb='assigned you task',
+                target_object_id=task.id
+            ).exists())
+
+        self.assertEqual(AttachmentBlob.objects.get().ref_count,
+                         TaskAttachment.objects.count())
+        self.assertTreeValid()
+
+    def test_create(self, send_emails):
+        tasks = self.create_task(reverse('task_management:create'))
+        self.assertCopies(tasks)
+
+    def test_sub_task(self, send_emails):
+        parent = Task.objects.create(title='parent', creator=self.user)
+        Task.objects.create(title='sibling', creator=self.user,
+                            parent=parent)
+        tasks = self.create_task(
+            reverse('task_management:sub_task_create', args=[parent.id])
+        )
+        self.assertCopies(tasks)
+        self.assertEqual([task.parent for task in tasks], [parent] * 4)
+        self.assertEqual(Task.objects.get(pk=parent.pk).status,
+                         Task.STATUS_WORKING)
+
+    def test_shared_attachment(self, send_emails):
+        tasks = self.create_task(reverse('task_management:create'))
+        attachment = tasks[0].attachments.get()
+        attachment.delete()
+        self.assertEqual(tasks[1].attachments.get().attachment.read(),
+                         b'content')
+
+    def test_query_count(self, send_emails):
+        task = Task.objects.create(title='task', creator=self.user)
+        query_counts = []
+        for owners in (self.owners[:1], self.owners):
+            with CaptureQueriesContext(connection) as queries:
+                create_task_copies(task, owners, self.user)
+            query_counts.append(len(queries))
+
+        self.assertEqual(query_counts[0], query_counts[1])
+
+
+class AttachmentStorageTest(TransactionTestCase):
+    """ Content addressed attachment storage tests. Files are deleted on
+    commit, so tests are not wrapped in transaction.
+    """
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.user = User.objects.create(username='user')
+        self.task = Task.objects.create(title='task', creator=self.user)
+
+    def create_attachment(self, name, content):
+        return TaskAttachment.objects.create(
+            task=self.task, attachment=SimpleUploadedFile(name, content)
+        )
+
+    def test_dedupe_uploads(self):
+        first = self.create_attachment('first.txt', b'content')
+        second = self.create_attachment('second.txt', b'content')
+        other = self.create_attachment('other.txt', b'other')
+
+        self.assertEqual(first.attachment.name, second.attachment.name)
+        self.assertNotEqual(first.attachment.name, other.attachment.name)
+        self.assertEqual([first.file_name(), second.file_name()],
+                         ['first.txt', 'second.txt'])
+        self.assertEqual(
+            AttachmentBlob.objects.get(name=first.attachment.name).ref_count,
+            2
+        )
+
+        path = first.attachment.path
+        first.delete()
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(second.attachment.read(), b'content')
+
+        second.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(
+            AttachmentBlob.objects.filter(name=first.attachment.name).exists()
+        )
+
+    def test_attach_again_before_delete(self):
+        first = self.create_attachment('first.txt', b'content')
+        path = first.attachment.path
+        with transaction.atomic():
+            first.delete()
+            # the same content is attached before file delete
+            second = self.create_attachment('second.txt', b'content')
+
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(second.attachment.read(), b'content')
+
+    def test_references(self):
+        attachment = self.create_attachment('first.txt', b'content')
+        name = attachment.attachment.name
+        # blob is created by concurrent transaction
+        AttachmentBlob.objects.all().delete()
+        with patch.object(AttachmentBlob.objects, 'bulk_create',
+                          side_effect=IntegrityError):
+            AttachmentBlob.add_references([name, name])
+        self.assertEqual(AttachmentBlob.objects.get(name=name).ref_count, 2)
+
+        # file without blob is not deleted
+        AttachmentBlob.objects.all().delete()
+        attachment.delete()
+        self.assertTrue(os.path.exists(attachment.attachment.path))
+
+    def test_dedupe_command(self):
+        legacy_names = []
+        for task_id, name in ((1, 'a.txt'), (2, 'b.txt')):
+            legacy_name = 'task_attachment/{0}/{1}'.format(task_id, name)
+            os.makedirs(os.path.join(self.media_root, os.path.dirname(
+                legacy_name)), exist_ok=True)
+            with open(os.path.join(self.media_root, legacy_name), 'wb') as f:
+                f.write(b'content')
+            TaskAttachment.objects.bulk_create([
+                TaskAttachment(task=self.task, attachment=legacy_name)
+            ])
+            AttachmentBlob.add_references([legacy_name])
+            legacy_names.append(legacy_name)
+
+        call_command('dedupe_attachments', stdout=open(os.devnull, 'w'))
+
+        attachments = list(TaskAttachment.objects.order_by('id'))
+        self.assertEqual(attachments[0].attachment.name,
+                         attachments[1].attachment.name)
+        self.assertEqual([attachment.file_name() for attachment in
+                          attachments], ['a.txt', 'b.txt'])
+        self.assertEqual(attachments[0].attachment.read(), b'content')
+        self.assertEqual(AttachmentBlob.objects.get().ref_count, 2)
+        for legacy_name in legacy_names:
+            self.assertFalse(
+                os.path.exists(os.path.join(self.media_root, legacy_name))
+            )
+
+
+class AttachmentDownloadTest(TestCase):
+    """ Attachment download view tests """
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.user = User.objects.create_user('user', password='pass')
+        task = Task.objects.create(title='task', creator=self.user)
+        self.attachment = TaskAttachment.objects.create(
+            task=task,
+            attachment=SimpleUploadedFile('report.txt', b'0123456789')
+        )
+        self.url = self.attachment.get_absolute_url()
+        self.client.login(username='user', password='pass')
+
+    def get(self, **headers):
+        response = self.client.get(self.url, **headers)
+        content = b''.join(response.streaming_content) \
+            if response.streaming else response.content
+
+        return response, content
+
+    def test_download(self):
+        response, content = self.get()
+        self.assertEqual(content, b'0123456789')
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertIn('report.txt', response['Content-Disposition'])
+        self.assertEqual(response['ETag'], '"{0}"'.format(
+            os.path.basename(self.attachment.attachment.name)))
+
+        response, content = self.get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_range(self):
+        response, content = self.get(HTTP_RANGE='bytes=2-4')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(content, b'234')
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/10')
+
+        response, content = self.get(HTTP_RANGE='bytes=-3')
+        self.assertEqual(content, b'789')
+
+        response, content = self.get(HTTP_RANGE='bytes=8-')
+        self.assertEqual(content, b'89')
+
+        response, content = self.get(HTTP_RANGE='bytes=20-')
+        self.assertEqual(response.status_code, 416)
+
+        # file was changed since the first part
+        response, content = self.get(HTTP_RANGE='bytes=2-4',
+                                     HTTP_IF_RANGE='"old"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(content, b'0123456789')
+
+    @override_settings(TASK_ATTACHMENT_SENDFILE='X-Accel-Redirect')
+    def test_sendfile(self):
+        response, content = self.get()
+        self.assertEqual(content, b'')
+        self.assertEqual(response['X-Accel-Redirect'],
+                         '/protected/' + self.attachment.attachment.name)
+
+    def test_permission(self):
+        User.objects.create_user('other', password='pass')
+        self.client.login(username='other', password='pass')
+        response, content = self.get()
+        self.assertEqual(response.status_code, 403)
+
+
+@patch('task_management.helpers.send_emails')
+class ChunkedUploadTest(TestCase):
+    """ Chunked upload of attachments tests """
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(
+            MEDIA_ROOT=self.media_root,
+            TASK_ATTACHMENT_UPLOAD_DIR=os.path.join(self.media_root, 'up'),
+            TASK_ATTACHMENT_CHUNK_SIZE=4, TASK_ATTACHMENT_MAX_SIZE=20,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.user = User.objects.create_user('user', password='pass')
+        self.task = Task.objects.create(title='task', creator=self.user)
+        self.client.login(username='user', password='pass')
+
+    def start(self, size=10):
+        return self.client.post(
+            reverse('task_management:upload_create', args=[self.task.id]),
+            {'file_name': 'big.bin', 'size': size}
+        )
+
+    def put_chunk(self, upload_id, index, data):
+        return self.client.put(
+            reverse('task_management:upload_chunk', args=[upload_id, index]),
+            data, content_type='application/octet-stream'
+        )
+
+    def test_upload(self, send_emails):
+        upload_id = self.start().json()['id']
+
+        self.assertEqual(self.put_chunk(upload_id, 0, b'0123').json()
+                         ['received'], 4)
+        # lost response, chunk is sent again
+        self.assertEqual(self.put_chunk(upload_id, 0, b'0123').json()
+                         ['received'], 4)
+        self.assertEqual(self.put_chunk(upload_id, 2, b'89').status_code,
+                         400)
+        self.assertEqual(self.put_chunk(upload_id, 1, b'45678').status_code,
+                         400)
+        self.assertEqual(self.put_chunk(upload_id, 1, b'45').status_code,
+                         400)
+        self.assertEqual(self.put_chunk(upload_id, 1, b'4567').json()
+                         ['received'], 8)
+
+        finish_url = reverse('task_management:upload_finish',
+                             args=[upload_id])
+        self.assertEqual(self.client.post(finish_url).status_code, 400)
+
+        # resume after connection drop
+        state = self.client.get(
+            reverse('task_management:upload', args=[upload_id])
+        ).json()
+        self.assertEqual(state['received'] // state['chunk_size'], 2)
+        self.put_chunk(upload_id, 2, b'89')
+
+        response = self.client.post(finish_url)
+        self.assertEqual(response.status_code, 201)
+        attachment = TaskAttachment.objects.get(task=self.task)
+        self.assertEqual(attachment.file_name(), 'big.bin')
+        self.assertEqual(attachment.attachment.read(), b'0123456789')
+        self.assertFalse(AttachmentUpload.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'up')), [])
+        # upload is finished once
+        self.assertEqual(self.client.post(finish_url).status_code, 404)
+
+    def test_empty_file(self, send_emails):
+        upload_id = self.start(size=0).json()['id']
+        response = self.client.post(
+            reverse('task_management:upload_finish', args=[upload_id])
+        )
+        self.assertEqual(response.status_code, 201)
+        attachment = TaskAttachment.objects.get(task=self.task)
+        self.assertEqual(attachment.attachment.read(), b'')
+        self.assertFalse(AttachmentUpload.objects.exists())
+
+    def test_limits(self, send_emails):
+        self.assertEqual(self.start(size=21).status_code, 400)
+
+        upload_id = self.start().json()['id']
+        User.objects.create_user('other', password='pass')
+        self.client.login(username='other', password='pass')
+        self.assertEqual(self.put_chunk(upload_id, 0, b'0123').status_code,
+                         404)
+
+    def test_expired(self, send_emails):
+        upload_id = self.start().json()['id']
+        self.put_chunk(upload_id, 0, b'0123')
+        self.assertEqual(delete_expired_uploads(), 0)
+
+        AttachmentUpload.objects.update(
+            time_update=timezone.now() - datetime.timedelta(days=2)
+        )
+        self.assertEqual(delete_expired_uploads(), 1)
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'up')), [])
+
+
+@patch('task_management.helpers.send_emails')
+class SearchTest(TestCase):
+    """ Full text search of tasks tests """
+    def setUp(self):
+        self.user = User.objects.create_user('user', password='pass')
+        self.other = User.objects.create_user('other', password='pass')
+        self.title_task = Task.objects.create(
+            title='Deploy release', description='', creator=self.user
+        )
+        self.description_task = Task.objects.create(
+            title='Prepare', description='deploy scripts', creator=self.user
+        )
+
+    def search(self, query, user=None):
+        return search_tasks(query, get_visible_tasks(user or self.user))
+
+    def test_rank(self, send_emails):
+        self.assertEqual(self.search('deploy'),
+                         [self.title_task, self.description_task])
+        # prefixes and all words
+        self.assertEqual(self.search('dep scri'), [self.description_task])
+        self.assertEqual(self.search('   '), [])
+
+    def test_visibility(self, send_emails):
+        Task.objects.create(title='Deploy other', creator=self.other)
+        self.assertEqual(len(self.search('deploy', self.other)), 1)
+        self.assertEqual(self.search('other'), [])
+
+    def test_update(self, send_emails):
+        TaskComment.objects.create(task=self.description_task,
+                                   author=self.user, message='Rollback plan')
+        self.assertEqual(self.search('rollback'), [self.description_task])
+
+        self.title_task.title = 'Rollback release'
+        self.title_task.save()
+        self.assertEqual(self.search('rollback'),
+                         [self.title_task, self.description_task])
+
+        self.description_task.delete()
+        self.assertEqual(self.search('rollback'), [self.title_task])
+
+        # unchanged fields are not indexed again
+        task = Task.objects.get(pk=self.title_task.pk)
+        with CaptureQueriesContext(connection) as queries:
+            task.save()
+        self.assertFalse([query for query in queries
+                          if 'task_fts' in query['sql']])
+
+    def test_rebuild(self, send_emails):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM task_management_task_fts')
+        self.assertEqual(self.search('deploy'), [])
+
+        call_command('rebuild_search_index', chunk_size=1,
+                     stdout=open(os.devnull, 'w'))
+        self.assertEqual(self.search('deploy'),
+                         [self.title_task, self.description_task])
+
+    def test_term_index(self, send_emails):
+        index = TermSearchIndex()
+        index.update([self.title_task, self.description_task])
+        tasks = get_visible_tasks(self.user)
+        self.assertEqual(index.search(['deploy'], tasks, 10),
+                         [self.title_task.id, self.description_task.id])
+        self.assertEqual(index.search(['deploy', 'scripts'], tasks, 10),
+                         [self.description_task.id])
+
+    def test_view(self, send_emails):
+        self.client.login(username='user', password='pass')
+        response = self.client.get(reverse('task_management:search'),
+                                   {'q': 'deploy'})
+        self.assertEqual(list(response.context['object_list']),
+                         [self.title_task, self.description_task])
+
+
+@patch('task_management.helpers.send_emails')
+class TaskListFilterTest(TestCase):
+    """ Filters and sorting of task list tests """
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('user', password='pass')
+        self.other = User.objects.create_user('other', password='pass')
+        self.urgent = Task.objects.create(
+            title='urgent', creator=self.user, owner=self.other,
+            status=Task.STATUS_WORKING, criticality=Task.CRITICALITY_HIGH,
+            date_due=datetime.date(2020, 1, 10)
+        )
+        self.later = Task.objects.create(
+            title='later', creator=self.user,
+            date_due=datetime.date(2020, 3, 1)
+        )
+        self.subtask = Task.objects.create(
+            title='subtask', creator=self.user, parent=self.urgent,
+            status=Task.STATUS_WORKING, date_due=datetime.date(2020, 2, 1)
+        )
+        self.client.login(username='user', password='pass')
+
+    def get(self, **params):
+        params['format'] = 'json'
+        response = self.client.get(reverse('task_management:list'), params)
+
+        return [task['title'] for task in response.json()['tasks']]
+
+    def test_filter(self, send_emails):
+        self.assertEqual(self.get(status=Task.STATUS_WORKING),
+                         ['urgent', 'subtask'])
+        self.assertEqual(self.get(criticality=Task.CRITICALITY_HIGH),
+                         ['urgent'])
+        self.assertEqual(self.get(owner=self.other.id), ['urgent'])
+        self.assertEqual(self.get(due_since='2020-01-15',
+                                  due_until='2020-02-15'), ['subtask'])
+        self.assertEqual(self.get(sort='-date_due'),
+                         ['later', 'subtask', 'urgent'])
+        # without filters root tasks are listed
+        self.assertEqual(self.get(), ['urgent', 'later'])
+
+        response = self.client.get(reverse('task_management:list'),
+                                   {'status': 100})
+        self.assertEqual(response.status_code, 400)
+
+    def test_html(self, send_emails):
+        response = self.client.get(reverse('task_management:list'),
+                                   {'sort': 'date_due'})
+        self.assertEqual(list(response.context['object_list']),
+                         [self.urgent, self.subtask, self.later])
+        self.assertEqual(response.context['filter_query'], 'sort=date_due')
+
+    def test_query_plan(self, send_emails):
+        filters = [
+            {'status': Task.STATUS_WORKING},
+            {'criticality': Task.CRITICALITY_HIGH},
+            {'owner': self.other.id},
+            {'creator': self.user.id},
+            {'due_since': '2020-01-01'},
+            {'due_until': '2020-01-01'},
+            {'updated_since': '2020-01-01 00:00'},
+        ]
+        sorts = [{'sort': value} for value, _ in TaskFilterForm.SORT_CHOICES]
+        for data in filters + sorts:
+            form = TaskFilterForm(data)
+            self.assertTrue(form.is_valid())
+            sql, params = form.filter_queryset(
+                get_visible_tasks(self.user)
+            ).query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                plan = [row[-1] for row in cursor.fetchall()]
+
+            # task table is read through indexes only
+            task_steps = [step for step in plan
+                          if 'task_management_task ' in step]
+            self.assertTrue(task_steps, msg=plan)
+            for step in task_steps:
+                self.assertIn(' USING ', step,
+                              msg='{0}: {1}'.format(data, plan))
+
+
+class VisibleTasksTest(TestCase):
+    """ get_visible_tasks tests """
+    def setUp(self):
+        self.user = User.objects.create(username='user')
+        self.other = User.objects.create(username='other')
+        self.third = User.objects.create(username='third')
+
+    def test_visible(self):
+        created = Task.objects.create(title='created', creator=self.user)
+        # creator row was repeated for every assignment by owners join
+        TaskAssignedUser.objects.create(task=created, user=self.other)
+        TaskAssignedUser.objects.create(task=created, user=self.third)
+        owned = Task.objects.create(title='owned', creator=self.other)
+        TaskAssignedUser.objects.create(task=owned, user=self.user)
+        Task.objects.create(title='hidden', creator=self.other)
+
+        self.assertEqual(
+            list(get_visible_tasks(self.user).order_by('id')),
+            [created, owned]
+        )
+        self.assertEqual(get_visible_tasks(self.third).get(), created)
+
+    def test_query_plan(self):
+        sql, params = get_visible_tasks(self.user).query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = [row[-1] for row in cursor.fetchall()]
+
+        # tasks by ids from union of assignments and creator index, no scan
+        self.assertIn('COMPOUND QUERY', plan)
+        self.assertTrue(plan[0].startswith('SEARCH task_management_task '),
+                        msg=plan)
+        self.assertFalse([step for step in plan if step.startswith('SCAN')])
+
+
+@skipUnless(BENCHMARK, 'benchmark')
+class VisibleTasksBenchmark(TestCase):
+    """ get_visible_tasks against OR across owners join """
+    def test_visible_tasks(self):
+        user = User.objects.create(username='user')
+        other = User.objects.create(username='other')
+        created = 0
+        for count in (1000, 10000, 50000):
+            last_id = Task.objects.aggregate(Max('id'))['id__max'] or 0
+            bulk_create_forest(other, (count - created) // 10, 10)
+            created = count
+            # user is owner of every tenth task
+            task_ids = Task.objects.filter(id__gt=last_id).order_by('id')\
+                .values_list('id', flat=True)[::10]
+            TaskAssignedUser.objects.bulk_create(
+                TaskAssignedUser(task_id=task_id, user=user, tree_id=task_id,
+                                 lft=1, rght=2, level=0)
+                for task_id in task_ids
+            )
+
+            start = time.time()
+            joined = len(Task.objects.filter(
+                Q(owners=user) | Q(creator=user)
+            ).distinct().values_list('id'))
+            joined_time = time.time() - start
+
+            start = time.time()
+            visible = len(get_visible_tasks(user).values_list('id'))
+            print('\nvisible tasks: {0} of {1} tasks, join {2:.3f}s, '
+                  'union {3:.3f}s'.format(visible, count, joined_time,
+                                          time.time() - start))
+            self.assertEqual(joined, visible)
+
+
+@patch('task_management.helpers.send_emails')
+@override_settings(TASK_LIST_CACHE_TIMEOUT=300)
+class TaskListCacheTest(TransactionTestCase):
+    """ Cache of rendered task list tests """
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('user', password='pass')
+        self.other = User.objects.create_user('other', password='pass')
+        self.root = Task.objects.create(title='root', creator=self.user)
+        self.child = Task.objects.create(title='child', creator=self.user,
+                                         parent=self.root)
+
+    def get(self, username='user', **params):
+        self.client.login(username=username, password='pass')
+
+        return self.client.get(reverse('task_management:list'), params)
+
+    def assertRendered(self, response, rendered=True):
+        self.assertEqual('object_list' in response.context, rendered)
+
+    def test_cached(self, send_emails):
+        self.assertRendered(self.get())
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get()
+        self.assertRendered(response, False)
+        self.assertFalse([query for query in queries
+                          if 'task_management_task' in query['sql']])
+        self.assertContains(response, '<ul class="root">')
+
+        # parameters are cached separately
+        self.assertRendered(self.get(expand='all'))
+        self.assertRendered(self.get(expand='all'), False)
+
+    def test_invalidation(self, send_emails):
+        self.get(expand='all')
+        self.get(username='other')
+
+        self.child.title = 'renamed'
+        self.child.save()
+        self.assertContains(self.get(expand='all'), 'renamed')
+        # list of other user is not changed
+        self.assertRendered(self.get(username='other'), False)
+
+        TaskAssignedUser.objects.create(task=self.child, user=self.other)
+        self.assertRendered(self.get(username='other'))
+
+    def test_rollup_invalidation(self, send_emails):
+        task = Task.objects.create(title='task', creator=self.other)
+        subtask = Task.objects.create(title='subtask', creator=self.user,
+                                      parent=task)
+        self.get(username='other')
+
+        # status of parent is recalculated by update without signals
+        subtask.status = Task.STATUS_ALMOST_DONE
+        subtask.save()
+        response = self.get(username='other')
+        self.assertRendered(response)
+        self.assertEqual(response.context['object_list'][0].status,
+                         Task.STATUS_ALMOST_DONE)
+
+    def test_disabled(self, send_emails):
+        with self.settings(TASK_LIST_CACHE_TIMEOUT=0):
+            self.assertRendered(self.get())
+            self.assertRendered(self.get())
+
+
+@patch('task_management.helpers.send_emails')
+class TaskDetailQueriesTest(TestCase):
+    """ Number of queries of task detail page """
+    def setUp(self):
+        self.user = User.objects.create_user('user', password='pass')
+        parent = Task.objects.create(title='parent', creator=self.user)
+        self.task = Task.objects.create(title='task', creator=self.user,
+                                        parent=parent)
+        self.client.login(username='user', password='pass')
+        self.url = reverse('task_management:detail', args=[self.task.pk])
+        ContentType.objects.get_for_model(Task)
+
+    def add_rows(self, count):
+        """ Extend owners chain, add attachments and comments """
+        for i in range(count):
+            owner = User.objects.create(username='owner {0}'.format(
+                User.objects.count()))
+            last = TaskAssignedUser.objects.filter(task=self.task)\
+                .order_by('time_assign').last()
+            TaskAssignedUser.objects.create(task=self.task, user=owner,
+                                            parent=last, assign_accept=True)
+            TaskAttachment.objects.create(task=self.task,
+                                          attachment='task_attachment/f')
+            TaskComment.objects.create(task=self.task, author=owner,
+                                       message='comment')
+
+    def test_query_budget(self, send_emails):
+        self.add_rows(2)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertContains(response, 'owner 2')
+
+        self.add_rows(10)
+        # session, user, task with parent, creator and owner, owners chain,
+        # attachments, comments
+        with self.assertNumQueries(6):
+            response = self.client.get(self.url)
+        self.assertEqual(len(queries), 6)
+        self.assertEqual(len(response.context['comments']), 12)
+        self.assertContains(response, 'owner 12')
+
+
+@patch('task_management.helpers.send_emails')
+class CurrentAssignmentTest(TestCase):
+    """ Current assignment state of task and acceptance inbox tests """
+    def setUp(self):
+        self.creator = User.objects.create_user('creator', password='pass')
+        self.owner = User.objects.create_user('owner', password='pass')
+        self.other = User.objects.create_user('other', password='pass')
+        self.task = Task.objects.create(title='task', creator=self.creator,
+                                        owner=self.owner)
+
+    def assertCurrent(self, user, assign_accept):
+        task = Task.objects.select_related('current_assignment')\
+            .get(pk=self.task.pk)
+        self.assertEqual(task.current_assignment.user, user)
+        self.assertEqual(task.owner_accept_task(), assign_accept)
+
+    def get_inbox(self, username):
+        self.client.login(username=username, password='pass')
+        response = self.client.get(reverse('task_management:inbox'))
+
+        return list(response.context['object_list'])
+
+    def test_chain(self, send_emails):
+        self.assertCurrent(self.owner, None)
+        self.assertEqual(self.get_inbox('owner'), [self.task])
+
+        assignment = TaskAssignedUser.objects.get(user=self.owner)
+        assignment.assign_accept = True
+        assignment.save()
+        self.assertCurrent(self.owner, True)
+        self.assertEqual(self.get_inbox('owner'), [])
+
+        task = Task.objects.get(pk=self.task.pk)
+        task.owner = self.other
+        task.save()
+        self.assertCurrent(self.other, None)
+        self.assertEqual(TaskAssignedUser.objects.get(user=self.other).parent,
+                         assignment)
+        self.assertEqual(self.get_inbox('other'), [task])
+
+        # answer of not current assignment does not change current state
+        assignment.assign_description = 'done'
+        assignment.save()
+        self.assertCurrent(self.other, None)
+
+        TaskAssignedUser.objects.filter(task=task).delete()
+        task = Task.objects.get(pk=self.task.pk)
+        self.assertIsNone(task.current_assignment)
+        self.assertEqual(self.get_inbox('other'), [])
+
+    def test_save_without_owner_change(self, send_emails):
+        task = Task.objects.get(pk=self.task.pk)
+        task.title = 'renamed'
+        with CaptureQueriesContext(connection) as queries:
+            task.save()
+        self.assertFalse([query for query in queries
+                          if 'taskassigneduser' in query['sql']])
+
+    def test_copies(self, send_emails):
+        copies = create_task_copies(self.task, [self.other], self.creator)
+        self.assertEqual(Task.objects.get(pk=copies[0].pk).current_assignment,
+                         TaskAssignedUser.objects.get(task=copies[0]))
+        self.assertEqual(self.get_inbox('other'), copies)
+
+    def test_inbox_query_plan(self, send_emails):
+        request = RequestFactory().get(reverse('task_management:inbox'))
+        request.user = self.owner
+        sql, params = TaskInboxView(request=request).get_queryset()\
+            .query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = [row[-1] for row in cursor.fetchall()]
+
+        # filter and order by one index, no per-task subqueries
+        self.assertIn('USING INDEX', plan[0])
+        self.assertIn('(owner_id=? AND assign_accept', plan[0])
+        self.assertFalse([step for step in plan
+                          if 'TEMP B-TREE' in step or 'SUBQUERY' in step])
+
+
+@patch('task_management.helpers.send_emails')
+class ForestImportTest(TestCase):
+    """ Export and import of task trees tests """
+    def setUp(self):
+        self.creator = User.objects.create(username='creator')
+        self.owner = User.objects.create(username='owner')
+        self.root = Task.objects.create(title='root', creator=self.creator)
+        self.first = Task.objects.create(title='first', creator=self.creator,
+                                         parent=self.root, owner=self.owner)
+        self.second = Task.objects.create(title='second',
+                                          creator=self.creator,
+                                          parent=self.root)
+        self.leaf = Task.objects.create(title='leaf', creator=self.creator,
+                                        parent=self.first,
+                                        date_due=datetime.date(2020, 1, 2))
+        TaskComment.objects.create(task=self.leaf, author=self.owner,
+                                   message='comment text')
+        TaskAttachment.objects.create(task=self.leaf, attachment='a/b.txt',
+                                      original_name='b.txt')
+        self.path = tempfile.mktemp()
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def export(self, *args):
+        call_command('export_tasks', '--output', self.path, *args)
+        with open(self.path) as data:
+            return [json.loads(line) for line in data]
+
+    def test_round_trip(self, send_emails):
+        records = self.export('--tree-id', str(self.root.tree_id))
+        self.assertEqual([record['title'] for record in records],
+                         ['root', 'first', 'leaf', 'second'])
+        self.assertEqual(records[2]['parent'], self.first.id)
+        self.assertEqual(records[1]['assignments'][0]['user'], 'owner')
+
+        last_id = Task.objects.aggregate(Max('id'))['id__max']
+        notifications = Notification.objects.count()
+        call_command('import_tasks', self.path, '--batch-size', '3',
+                     stdout=open(os.devnull, 'w'))
+        self.assertEqual(Notification.objects.count(), notifications)
+
+        root = Task.objects.get(title='root', id__gt=last_id)
+        tasks = list(root.get_descendants(include_self=True))
+        self.assertEqual([task.title for task in tasks],
+                         ['root', 'first', 'leaf', 'second'])
+        self.assertEqual([task.parent for task in tasks],
+                         [None, root, tasks[1], root])
+        # tree fields are the same as in tree built by mptt
+        self.assertEqual(
+            [(task.lft, task.rght, task.level) for task in tasks],
+            list(Task.objects.filter(tree_id=self.root.tree_id)
+                 .order_by('lft').values_list('lft', 'rght', 'level'))
+        )
+        self.assertEqual(root.status, Task.objects.get(pk=self.root.pk).status)
+
+        first, leaf = tasks[1], tasks[2]
+        self.assertEqual(first.owner, self.owner)
+        self.assertEqual(first.current_assignment.user, self.owner)
+        self.assertIsNone(first.owner_accept_task())
+        self.assertEqual(first.time_create, self.first.time_create)
+        self.assertEqual(leaf.date_due, datetime.date(2020, 1, 2))
+        self.assertEqual(TaskComment.objects.get(task=leaf).author,
+                         self.owner)
+        self.assertEqual(leaf.attachments.get().file_name(), 'b.txt')
+        self.assertEqual(AttachmentBlob.objects.get(name='a/b.txt').ref_count,
+                         2)
+        self.assertEqual(search_tasks('comment', Task.objects.all()),
+                         [self.leaf, leaf])
+
+        # sequence continues after imported ids
+        task = Task.objects.create(title='new', creator=self.creator)
+        self.assertGreater(task.id, leaf.id)
+
+    def test_export_stdout(self, send_emails):
+        records = self.export('--tree-id', str(self.root.tree_id))
+        stdout = StringIO()
+        call_command('export_tasks', '--tree-id', str(self.root.tree_id),
+                     stdout=stdout)
+        self.assertEqual([json.loads(line)
+                          for line in stdout.getvalue().splitlines()],
+                         records)
+
+    def test_lock(self, send_emails):
+        self.export()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('import_tasks', self.path,
+                         stdout=open(os.devnull, 'w'))
+
+        # tables are locked before free ids are read
+        sqls = [query['sql'] for query in queries]
+        first_max = next(index for index, sql in enumerate(sqls)
+                         if 'MAX(' in sql)
+        for model in (Task, TaskAssignedUser):
+            self.assertTrue([
+                sql for sql in sqls[:first_max]
+                if sql.startswith('UPDATE "{0}"'.format(model._meta.db_table))
+            ])
+
+    def test_unsupported_database(self, send_emails):
+        self.export()
+        count = Task.objects.count()
+        with patch.object(connection, 'vendor', 'mysql'):
+            with self.assertRaises(CommandError):
+                call_command('import_tasks', self.path)
+        self.assertEqual(Task.objects.count(), count)
+
+    def test_rollup(self, send_emails):
+        records = self.export()
+        records[2]['status'] = records[3]['status'] = Task.STATUS_APPROVE
+        with open(self.path, 'w') as data:
+            data.writelines(json.dumps(record) + '\n' for record in records)
+
+        last_id = Task.objects.aggregate(Max('id'))['id__max']
+        call_command('import_tasks', self.path, stdout=open(os.devnull, 'w'))
+        statuses = dict(Task.objects.filter(id__gt=last_id)
+                        .values_list('title', 'status'))
+        self.assertEqual(statuses['first'], Task.STATUS_COMPLETE)
+        self.assertEqual(statuses['root'], Task.STATUS_ALMOST_DONE)
+
+    def test_errors(self, send_emails):
+        records = self.export()
+        count = Task.objects.count()
+        for broken in (records[1:], [dict(records[0], creator='nobody')]):
+            with open(self.path, 'w') as data:
+                data.writelines(json.dumps(record) + '\n'
+                                for record in broken)
+            with self.assertRaises(CommandError):
+                call_command('import_tasks', self.path)
+        self.assertEqual(Task.objects.count(), count)
+
+
+@skipUnless(BENCHMARK, 'benchmark')
+class ForestImportBenchmark(TestCase):
+    """ Import of 100k tasks """
+    def test_import(self):
+        user = User.objects.create(username='creator')
+        path = tempfile.mktemp()
+        with open(path, 'w') as data:
+            for i in range(100000):
+                # trees of 10 tasks, every task is child of the previous one
+                data.write(json.dumps({
+                    'id': i, 'parent': i - 1 if i % 10 else None,
+                    'title': 'task {0}'.format(i), 'creator': 'creator',
+                    'owner': 'creator', 'status': Task.STATUS_WORKING,
+                    'assignments': [{'user': 'creator'}],
+                    'comments': [{'author': 'creator', 'message': 'text'}],
+                }) + '\n')
+
+        start = time.time()
+        call_command('import_tasks', path, stdout=open(os.devnull, 'w'))
+        print('\nimport_tasks: 100000 tasks, {0:.3f}s'.format(
+            time.time() - start))
+        os.remove(path)
+        self.assertEqual(Task.objects.filter(creator=user).count(), 100000)
+
+
+@patch('task_management.helpers.send_emails')
+class TaskBatchTest(TestCase):
+    """ Batch accept, reject and status change tests """
+    def setUp(self):
+        self.creator = User.objects.create_user('creator', password='pass')
+        self.owner = User.objects.create_user('owner', password='pass')
+        self.root = Task.objects.create(title='root', creator=self.creator)
+        self.tasks = [
+            Task.objects.create(title='task {0}'.format(i),
+                                creator=self.creator, owner=self.owner,
+                                parent=self.root)
+            for i in range(3)
+        ]
+        self.client.login(username='owner', password='pass')
+
+    def post(self, action, tasks, **data):
+        data.update(action=action, tasks=[task.pk for task in tasks])
+
+        return self.client.post(reverse('task_management:batch'), data)
+
+    def get_statuses(self):
+        return [Task.objects.get(pk=task.pk).status
+                for task in [self.root] + self.tasks]
+
+    def test_accept_and_status(self, send_emails):
+        notifications = Notification.objects.filter(recipient=self.creator)
+        count = notifications.count()
+        response = self.post('accept', self.tasks)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_statuses(), [Task.STATUS_WORKING] * 4)
+        # one notification about all tasks
+        self.assertEqual(notifications.count(), count + 1)
+        self.assertEqual(notifications.latest('id').verb,
+                         'updated 3 tasks, including')
+        self.assertEqual(
+            TaskActionLog.objects.filter(action='accept task').count(), 3
+        )
+
+        with patch('task_management.rollup.StatusRollup.get_ancestors',
+                   autospec=True,
+                   side_effect=StatusRollup.get_ancestors) as ancestors:
+            response = self.post('status', self.tasks[:2],
+                                 status=Task.STATUS_COMPLETE)
+        self.assertEqual(ancestors.call_count, 1)
+        self.assertEqual(
+            [task['status'] for task in json.loads(response.content.decode())
+             ['tasks']],
+            [Task.STATUS_COMPLETE] * 2
+        )
+        # (6 + 6 + 3) / 3
+        self.assertEqual(self.get_statuses()[0], Task.STATUS_ALMOST_DONE)
+
+    def test_reject(self, send_emails):
+        response = self.post('reject', self.tasks[:2],
+                             assign_description='busy')
+        self.assertEqual(response.status_code, 200)
+        task = Task.objects.select_related('current_assignment')\
+            .get(pk=self.tasks[0].pk)
+        self.assertEqual(task.status, Task.STATUS_DECLINE)
+        self.assertIsNone(task.owner)
+        self.assertIs(task.current_assignment.assign_accept, False)
+        self.assertEqual(task.current_assignment.assign_description, 'busy')
+        # logged against assignment, as by RejectTaskView
+        self.assertIn(
+            task.current_assignment,
+            [entry.action_goal for entry in
+             TaskActionLog.objects.filter(action='reject task')]
+        )
+
+    def test_ancestor_in_batch(self, send_emails):
+        child = Task.objects.create(title='child', creator=self.creator,
+                                    owner=self.owner, parent=self.tasks[0])
+        response = self.post('reject', [self.tasks[0], child])
+        self.assertEqual(response.status_code, 200)
+        # status of declined parent is recalculated by declined child
+        self.assertEqual(
+            json.loads(response.content.decode())['tasks'][0],
+            {'id': self.tasks[0].pk, 'status': Task.STATUS_WORKING,
+             'status_display': 'Working On It'}
+        )
+        self.assertEqual(self.get_statuses()[1], Task.STATUS_WORKING)
+
+    def test_errors(self, send_emails):
+        self.assertEqual(self.post('status', self.tasks).status_code, 400)
+
+        # nothing is changed if one task is not permitted
+        response = self.post('accept', self.tasks + [self.root])
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(json.loads(response.content.decode()),
+                         {'forbidden': [self.root.pk]})
+        self.assertEqual(self.get_statuses()[1:],
+                         [Task.STATUS_PENDING] * 3)
+
+        # status is changed after acceptance only
+        response = self.post('status', self.tasks,
+                             status=Task.STATUS_COMPLETE)
+        self.assertEqual(response.status_code, 403)
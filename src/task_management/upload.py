@@ -0,0 +1,137 @@
+import datetime
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+
+from task_management.models import AttachmentUpload, TaskAttachment
+
+READ_SIZE = 64 * 1024
+
+
+def read_chunk(stream, chunk, limit):
+    """ Copy chunk data from stream to file
+    :param stream: file-like object with chunk data, e.g. request
+    :param chunk: file object
+    :param limit: max number of bytes
+    :return: number of read bytes
+    """
+    written = 0
+    while True:
+        data = stream.read(READ_SIZE)
+        if not data:
+            return written
+        written += len(data)
+        if written > limit:
+            raise ValueError('Chunk is too large')
+        chunk.write(data)
+
+
+def append_chunk(upload_id, user, index, stream):
+    """ Append chunk of upload to part file. Chunks must be sent in order,
+    every chunk except the last one has TASK_ATTACHMENT_CHUNK_SIZE bytes.
+    Chunk which was already received is skipped, so client can resend
+    chunk if response was lost.
+
+    Chunk is read from stream to temporary file without lock, then upload
+    is locked only to append the file to part file and count it.
+    :param upload_id: id of AttachmentUpload
+    :param user: User object, owner of upload
+    :param index: number of chunk from 0
+    :param stream: file-like object with chunk data, e.g. request
+    :return: AttachmentUpload object
+    """
+    chunk_size = settings.TASK_ATTACHMENT_CHUNK_SIZE
+    offset = index * chunk_size
+    upload = AttachmentUpload.objects.get(id=upload_id, user=user)
+    if offset < upload.received:
+        return upload
+    if offset > upload.received:
+        raise ValueError('Chunk {0} is expected'.format(
+            upload.received // chunk_size))
+
+    directory = os.path.dirname(upload.get_path())
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.TemporaryFile(dir=directory) as chunk:
+        written = read_chunk(stream, chunk,
+                             min(chunk_size, upload.size - offset))
+        if written < chunk_size and offset + written < upload.size:
+            raise ValueError('Chunk is incomplete')
+
+        with transaction.atomic():
+            upload = AttachmentUpload.objects.select_for_update()\
+                .get(id=upload_id, user=user)
+            if offset != upload.received:
+                # the same chunk was appended by concurrent request
+                return upload
+
+            fd = os.open(upload.get_path(), os.O_WRONLY | os.O_CREAT, 0o600)
+            with os.fdopen(fd, 'wb') as part:
+                # data of failed append is overwritten
+                part.truncate(upload.received)
+                part.seek(upload.received)
+                chunk.seek(0)
+                shutil.copyfileobj(chunk, part)
+
+            upload.received += written
+            upload.save(update_fields=['received', 'time_update'])
+
+    return upload
+
+
+def finish_upload(upload):
+    """ Save received file as attachment of upload task and delete upload.
+    Upload is locked, so concurrent finish of the same upload raises
+    AttachmentUpload.DoesNotExist.
+    :param upload: AttachmentUpload object
+    :return: TaskAttachment object
+    """
+    with transaction.atomic():
+        upload = AttachmentUpload.objects.select_for_update()\
+            .get(pk=upload.pk)
+        if upload.received != upload.size:
+            raise ValueError('Upload is incomplete')
+
+        attachment = TaskAttachment(task=upload.task,
+                                    original_name=upload.file_name)
+        if upload.size:
+            with open(upload.get_path(), 'rb') as part:
+                attachment.attachment.save(upload.file_name, File(part))
+        else:
+            # no chunk is sent for empty file
+            attachment.attachment.save(upload.file_name, ContentFile(b''))
+        delete_upload(upload)
+
+    return attachment
+
+
+def delete_upload(upload):
+    """ Delete upload with received data
+    :param upload: AttachmentUpload object
+    :return:
+    """
+    try:
+        os.remove(upload.get_path())
+    except FileNotFoundError:
+        pass
+    upload.delete()
+
+
+def delete_expired_uploads():
+    """ Delete uploads which were not continued in
+    TASK_ATTACHMENT_UPLOAD_EXPIRE hours
+    :return: number of deleted uploads
+    """
+    border = timezone.now() - datetime.timedelta(
+        hours=settings.TASK_ATTACHMENT_UPLOAD_EXPIRE
+    )
+    uploads = list(AttachmentUpload.objects.filter(time_update__lt=border))
+    for upload in uploads:
+        delete_upload(upload)
+
+    return len(uploads)
@@ -3,13 +3,23 @@ from django.conf.urls import url
 from task_management.views import TaskListView, TaskCreateView, \
     TaskUpdateView, TaskDetailView, TaskDeleteView, SubTaskCreateView, \
     CommentCreateView, AcceptTaskView, RejectTaskView, ApproveTaskView, \
-    DeclineTaskView, ReassignTaskView, ActionLogListView
+    DeclineTaskView, ReassignTaskView, ActionLogListView, TaskChildrenView, \
+    TaskHistoryView, ActorHistoryView, ExportView, AttachmentDownloadView, \
+    AttachmentUploadCreateView, AttachmentUploadView, \
+    AttachmentUploadChunkView, AttachmentUploadFinishView, TaskSearchView, \
+    TaskInboxView, TaskBatchView
 
+UUID = '[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}'
 
 urlpatterns = [
     url(r'^$', TaskListView.as_view(), name='list'),
     url(r'^create/$', TaskCreateView.as_view(), name='create'),
+    url(r'^search/$', TaskSearchView.as_view(), name='search'),
+    url(r'^inbox/$', TaskInboxView.as_view(), name='inbox'),
+    url(r'^batch/$', TaskBatchView.as_view(), name='batch'),
     url(r'^(?P<pk>[0-9]+)/$', TaskDetailView.as_view(), name='detail'),
+    url(r'^(?P<pk>[0-9]+)/children/$', TaskChildrenView.as_view(),
+        name='children'),
     url(r'^(?P<pk>[0-9]+)/update/$', TaskUpdateView.as_view(), name='update'),
     url(r'^(?P<pk>[0-9]+)/delete/$', TaskDeleteView.as_view(), name='delete'),
 
@@ -30,5 +40,27 @@ urlpatterns = [
     url(r'^(?P<pk>[0-9]+)/reassign/$', ReassignTaskView.as_view(),
         name='reassign'),
 
+    url(r'^(?P<pk>[0-9]+)/history/$', TaskHistoryView.as_view(),
+        name='history'),
+
+    url(r'^attachment/(?P<pk>[0-9]+)/$', AttachmentDownloadView.as_view(),
+        name='attachment'),
+
+    url(r'^(?P<pk>[0-9]+)/uploads/$', AttachmentUploadCreateView.as_view(),
+        name='upload_create'),
+    url(r'^uploads/(?P<upload_id>{0})/$'.format(UUID),
+        AttachmentUploadView.as_view(), name='upload'),
+    url(r'^uploads/(?P<upload_id>{0})/chunks/(?P<index>[0-9]+)/$'
+        .format(UUID), AttachmentUploadChunkView.as_view(),
+        name='upload_chunk'),
+    url(r'^uploads/(?P<upload_id>{0})/finish/$'.format(UUID),
+        AttachmentUploadFinishView.as_view(), name='upload_finish'),
+
     url(r'^action_log/$', ActionLogListView.as_view(), name='action_log'),
+    url(r'^action_log/actor/(?P<pk>[0-9]+)/$', ActorHistoryView.as_view(),
+        name='actor_history'),
+
+    url(r'^export/(?P<name>task|comment|assigned_user|action_log)\.'
+        r'(?P<export_format>csv|jsonl)$', ExportView.as_view(),
+        name='export'),
 ]
@@ -1,69 +1,284 @@
+import json
+import mimetypes
+import os
+import re
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.urlresolvers import reverse_lazy, reverse
-from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.auth.decorators import login_required
+from django.contrib.auth.mixins import LoginRequiredMixin, \
+    UserPassesTestMixin
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
 from django.db.models import Q
 from django.forms import model_to_dict
-from django.http import JsonResponse, HttpResponseRedirect
-from django.shortcuts import redirect
+from django.http import JsonResponse, HttpResponseRedirect, HttpResponse, \
+    HttpResponseNotModified, HttpResponseForbidden, Http404, \
+    StreamingHttpResponse
+from django.shortcuts import redirect, get_object_or_404, render
+from django.template.loader import render_to_string
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date, urlquote
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import etag
 from django.views.generic import ListView, CreateView, UpdateView, \
     DetailView, DeleteView, View
 
-from task_management.helpers import send_message, get_recipients_by_task
+from notifications import views as notifications_views
+
+from task_management.batch import ACTION_STATUS, change_tasks, \
+    get_owners_chains
+from task_management.helpers import send_message, get_recipients_by_task, \
+    get_visible_tasks, get_visible_children_count, \
+    get_unread_notifications_state, clear_unread_notifications_state
+from task_management.export import export, FORMATS
+from task_management.list_cache import get_cached_task_list
 from task_management.forms import TaskForm, CommentForm, RejectTaskForm, \
-    DeclineTaskForm, ReassignTaskForm
+    DeclineTaskForm, ReassignTaskForm, ExportFilterForm, \
+    AttachmentUploadForm, TaskFilterForm, TaskBatchForm
 from task_management.models import Task, TaskComment, TaskAssignedUser, \
-    TaskActionLog
+    TaskActionLog, TaskAttachment, AttachmentUpload
+from task_management import identity_map
+from task_management.archive import ActionLogArchive
 from task_management.mixins import TaskChangePermitMixin, \
     TaskViewPermitMixin, TaskDeletePermitMixin, TaskAcceptPermitMixin, \
     TaskApprovePermitMixin, TaskReassignPermitMixin
+from task_management.permissions import get_task_permissions
+from task_management.pubsub import get_pubsub, get_notifications_channel
+from task_management.search import search_tasks
+from task_management.upload import append_chunk, finish_upload, \
+    delete_upload
 
 
 class TaskListView(LoginRequiredMixin, ListView):
-    """ View for display the list of tasks """
+    """ View for display the list of tasks.
+
+    By default only root tasks are displayed, sub tasks are loaded on
+    demand by TaskChildrenView. With ?expand=all whole task trees are
+    displayed.
+    """
     model = Task
+    paginate_by = 25
+    template_name = 'task_management/task_list.html'
+    body_template_name = 'task_management/task_list_body.html'
+
+    def get(self, request, *args, **kwargs):
+        self.filter_form = TaskFilterForm(request.GET)
+        if not self.filter_form.is_valid():
+            return JsonResponse(self.filter_form.errors, status=400)
+
+        if self.is_json():
+            return super(TaskListView, self).get(request, *args, **kwargs)
+
+        # list is rendered only if user tasks are changed
+        body = get_cached_task_list(request.user.pk, request.GET,
+                                    self.render_body)
+
+        return render(request, self.template_name, {
+            'filter_form': self.filter_form,
+            'task_list_body': body,
+        })
+
+    def render_body(self):
+        """ Render list of tasks without page layout
+        :return: string
+        """
+        self.object_list = self.get_queryset()
+
+        return render_to_string(self.body_template_name,
+                                self.get_context_data(),
+                                request=self.request)
+
+    def is_json(self):
+        return self.request.GET.get('format') == 'json'
+
+    def is_filtered(self):
+        return self.filter_form.has_filters()
+
+    def is_expand_all(self):
+        return self.request.GET.get('expand') == 'all' and \
+            not self.is_filtered() and not self.is_json()
+
+    def get_paginate_by(self, queryset):
+        if self.is_expand_all():
+            return None
+
+        return super(TaskListView, self).get_paginate_by(queryset)
 
     def get_queryset(self):
         user = self.request.user
-        queryset = super(TaskListView, self).get_queryset()
-        queryset = queryset.filter(Q(owners=user) | Q(creator=user))
+        queryset = get_visible_tasks(user)
+        if self.is_expand_all():
+            return queryset
+
+        if self.is_filtered():
+            # flat list of all visible tasks which match filters
+            return self.filter_form.filter_queryset(
+                queryset.select_related('owner')
+            )
 
-        return queryset
+        # root tasks: task hasn't parent or user can't view parent
+        return queryset.exclude(
+            parent__in=get_visible_tasks(user).values('id')
+        ).select_related('owner').order_by('tree_id', 'lft')
 
     @staticmethod
     def get_trees(task_queryset):
         """ Create task trees from queryset.
+
+        Tasks are walked once in MPTT order (tree_id, lft), so every parent
+        comes before its children. A task whose parent is not visible in
+        the queryset starts a new tree.
         :param task_queryset: Task model queryset
         :return: list of task trees
         """
-        task_list = task_queryset.order_by('parent')
-        trees = {}
-        task_list_without_parent_node = []
+        task_list = task_queryset.select_related('owner')\
+            .order_by('tree_id', 'lft')
+        trees = []
+        task_tree = {}  # task id -> tree that contains this task
         for t in task_list:
-            if not t.parent:
-                trees[(t.id,)] = (t,)
-            else:
-                task_list_without_parent_node.append(t)
-
-        task_list = task_list_without_parent_node
-        while task_list:
-            t = task_list.pop(0)
-            for k, v in trees.items():
-                if t.parent_id in k:
-                    trees[k+(t.id,)] = trees.pop(k) + (t,)
-                    t = False
-                    break
+            tree = task_tree.get(t.parent_id)
+            if tree is None:
+                # root task or parent not visible: create new tree
+                tree = []
+                trees.append(tree)
 
-            if t:
-                # if parent not fount create new element
-                trees[(t.id,)] = (t,)
+            tree.append(t)
+            task_tree[t.id] = tree
 
-        return [v for k, v in trees.items()]
+        return trees
 
     def get_context_data(self, **kwargs):
         context = super(TaskListView, self).get_context_data(**kwargs)
-        context['task_trees'] = self.get_trees(self.get_queryset())
+        context['expand_all'] = self.is_expand_all()
+        # filters for pagination links
+        query = self.request.GET.copy()
+        query.pop('page', None)
+        context['filter_query'] = query.urlencode()
+        if context['expand_all']:
+            context['task_trees'] = self.get_trees(self.object_list)
+        else:
+            set_children_count(context['object_list'], self.request.user)
 
         return context
 
+    def render_to_response(self, context, **response_kwargs):
+        if self.is_json():
+            page = context['page_obj']
+
+            return JsonResponse({
+                'tasks': [task_to_dict(task)
+                          for task in context['object_list']],
+                'page': page.number,
+                'num_pages': page.paginator.num_pages,
+                'has_next': page.has_next(),
+            })
+
+        return super(TaskListView, self).render_to_response(
+            context, **response_kwargs
+        )
+
+
+def set_children_count(tasks, user):
+    """ Set number of visible children to every task as children_count.
+    :param tasks: Task queryset or list
+    :param user: User object
+    :return:
+    """
+    children_count = get_visible_children_count(tasks, user)
+    for task in tasks:
+        task.children_count = children_count.get(task.id, 0)
+
+
+class TaskSearchView(LoginRequiredMixin, ListView):
+    """ View for full text search of tasks which user can view """
+    model = Task
+    template_name = 'task_management/task_search.html'
+    limit = 50
+
+    def get_query(self):
+        return self.request.GET.get('q', '').strip()
+
+    def get_queryset(self):
+        return search_tasks(self.get_query(),
+                            get_visible_tasks(self.request.user), self.limit)
+
+    def get_context_data(self, **kwargs):
+        kwargs['query'] = self.get_query()
+
+        return super(TaskSearchView, self).get_context_data(**kwargs)
+
+
+def task_to_dict(task):
+    """ Task of list in json, task must have children_count
+    :param task: Task object
+    :return: dict
+    """
+    return {
+        'id': task.id,
+        'title': task.title,
+        'status': task.status,
+        'status_display': task.get_status_display(),
+        'criticality': task.criticality,
+        'date_due': task.date_due,
+        'time_update': task.time_update,
+        'owner': str(task.owner) if task.owner else None,
+        'url': task.get_absolute_url(),
+        'children_count': task.children_count,
+        'children_url': reverse('task_management:children',
+                                kwargs={'pk': task.pk}),
+    }
+
+
+class TaskInboxView(LoginRequiredMixin, ListView):
+    """ View for display tasks which are assigned to user and wait for user
+    acceptance, the most recently assigned first
+    """
+    model = Task
+    paginate_by = 25
+    template_name = 'task_management/task_inbox.html'
+
+    def get_queryset(self):
+        return Task.objects.filter(
+            owner=self.request.user, assign_accept__isnull=True,
+            current_assignment__isnull=False
+        ).select_related('creator').order_by('-current_assignment_id')
+
+
+class TaskChildrenView(TaskViewPermitMixin, DetailView):
+    """ View for display direct children of task which user can view.
+    Returns html fragment of task list, or json with ?format=json
+    """
+    model = Task
+    template_name = 'task_management/task_list_items.html'
+
+    def get_children(self):
+        children = get_visible_tasks(
+            self.request.user, self.object.get_children()
+        ).select_related('owner')
+        set_children_count(children, self.request.user)
+
+        return children
+
+    def get_context_data(self, **kwargs):
+        kwargs['tasks'] = self.get_children()
+
+        return super(TaskChildrenView, self).get_context_data(**kwargs)
+
+    def render_to_response(self, context, **response_kwargs):
+        if self.request.GET.get('format') == 'json':
+            return JsonResponse({
+                'children': [task_to_dict(task)
+                             for task in context['tasks']],
+            })
+
+        return super(TaskChildrenView, self).render_to_response(
+            context, **response_kwargs
+        )
+
 
 class TaskCreateView(LoginRequiredMixin, CreateView):
     """ View for create new task """
@@ -91,7 +306,9 @@ class TaskCreateView(LoginRequiredMixin, CreateView):
 class SubTaskCreateView(TaskChangePermitMixin, TaskCreateView):
     """ View for create sub task """
     def form_valid(self, form):
-        parent_task = Task.objects.get(pk=self.kwargs['pk'])
+        parent_task = identity_map.get_object_or_404(
+            Task, pk=self.kwargs['pk']
+        )
         form.instance.parent = parent_task
         result = super(SubTaskCreateView, self).form_valid(form)
 
@@ -137,16 +354,44 @@ class TaskUpdateView(TaskChangePermitMixin, UpdateView):
 
 
 class TaskDetailView(TaskViewPermitMixin, DetailView):
-    """ View for display task detail """
+    """ View for display task detail. The page is rendered by fixed number
+    of queries: task with parent, creator and owner, owners chain with
+    users, attachments and comments with authors.
+    """
     model = Task
+    owners_chain = None
+
+    def get_queryset(self):
+        return Task.objects.select_related('parent', 'creator', 'owner')
+
+    def get_object(self, queryset=None):
+        if self.task is None:
+            self.task = super(TaskDetailView, self).get_object(
+                self.get_queryset()
+            )
+            identity_map.add_object(self.task)
+
+            # owners chain in tree order for recursetree, permissions are
+            # calculated from the same rows
+            self.owners_chain = list(
+                TaskAssignedUser.objects.filter(task=self.task)
+                .select_related('user').order_by('tree_id', 'lft')
+            )
+            get_task_permissions(self.request, self.task, [
+                (node.user_id, node.assign_accept) for node in
+                sorted(self.owners_chain, key=lambda node: node.time_assign)
+            ])
+
+        return self.task
 
     def get_context_data(self, **kwargs):
         kwargs['comment_form'] = CommentForm()
         kwargs['comments'] = TaskComment.objects.filter(task=self.object)\
-            .prefetch_related('author')
-        kwargs['task_assigned_to'] = TaskAssignedUser.objects.filter(
-            task=self.object
-        )
+            .select_related('author').order_by('id')
+        kwargs['attachments'] = self.object.attachments.all()
+        kwargs['task_assigned_to'] = self.owners_chain
+        kwargs['permissions'] = get_task_permissions(self.request,
+                                                     self.object)
 
         return super(TaskDetailView, self).get_context_data(**kwargs)
 
@@ -172,7 +417,9 @@ class CommentCreateView(LoginRequiredMixin, CreateView):
         return HttpResponseRedirect(self.get_success_url())
 
     def form_valid(self, form):
-        form.instance.task = Task.objects.get(pk=self.kwargs['pk'])
+        form.instance.task = identity_map.get_object_or_404(
+            Task, pk=self.kwargs['pk']
+        )
         form.instance.author = self.request.user
 
         result = super(CommentCreateView, self).form_valid(form)
@@ -189,8 +436,9 @@ class AcceptTaskView(TaskAcceptPermitMixin, View):
     """ View for accept task """
     def get(self, *args, **kwargs):
         task = self.get_task()
-        assign = TaskAssignedUser.objects.get(task=task,
-                                              user=self.request.user)
+        assign = identity_map.get_object_or_404(
+            TaskAssignedUser, task_id=task.pk, user_id=self.request.user.pk
+        )
         assign.assign_accept = True
         assign.save()
 
@@ -207,8 +455,10 @@ class RejectTaskView(TaskAcceptPermitMixin, UpdateView):
     template_name = 'task_management/task_reject_form.html'
 
     def get_object(self, queryset=None):
-        return self.model.objects.get(task=self.get_task(),
-                                      user=self.request.user)
+        return identity_map.get_object_or_404(
+            self.model, task_id=self.get_task().pk,
+            user_id=self.request.user.pk
+        )
 
     def post(self, request, *args, **kwargs):
         result = super(RejectTaskView, self).post(request, *args, **kwargs)
@@ -228,7 +478,9 @@ class ApproveTaskView(TaskApprovePermitMixin, View):
 
     def get_object(self):
         if not self.object:
-            self.object = Task.objects.get(pk=self.kwargs['pk'])
+            self.object = identity_map.get_object_or_404(
+                Task, pk=self.kwargs['pk']
+            )
 
         return self.object
 
@@ -275,19 +527,480 @@ class ReassignTaskView(TaskReassignPermitMixin, UpdateView):
         return result
 
 
+class TaskBatchView(LoginRequiredMixin, View):
+    """ View for accept, reject or status change of several tasks in one
+    transaction. Nothing is changed if user has no permission for any of
+    the tasks.
+    """
+    def post(self, request, *args, **kwargs):
+        with transaction.atomic():
+            form = TaskBatchForm(request.POST)
+            # tasks are not changed by other requests until commit
+            form.fields['tasks'].queryset = \
+                form.fields['tasks'].queryset.select_for_update()
+            if not form.is_valid():
+                return JsonResponse(form.errors, status=400)
+
+            action = form.cleaned_data['action']
+            tasks = list(form.cleaned_data['tasks'])
+            chains = get_owners_chains(tasks)
+            forbidden = []
+            for task in tasks:
+                # the same objects are saved by signals
+                identity_map.add_object(task)
+                if task.current_assignment:
+                    identity_map.add_object(task.current_assignment)
+
+                permissions = get_task_permissions(request, task, [
+                    (node.user_id, node.assign_accept)
+                    for node in chains[task.id]
+                ])
+                if action == ACTION_STATUS:
+                    # as TaskForm, status of leaf task only
+                    allowed = permissions.change and \
+                        task.is_leaf_node() and \
+                        Task.is_status_can_change(task.status)
+                else:
+                    allowed = permissions.accept
+                if not allowed:
+                    forbidden.append(task.pk)
+
+            if forbidden:
+                return JsonResponse({'forbidden': forbidden}, status=403)
+
+            change_tasks(request.user, tasks, action, chains,
+                         form.cleaned_data['status'],
+                         form.cleaned_data['assign_description'])
+
+            # rollup updates statuses of ancestors in the batch after save
+            statuses = dict(Task.objects.filter(pk__in=[
+                task.pk for task in tasks
+            ]).values_list('id', 'status'))
+
+        for task in tasks:
+            task.status = statuses[task.id]
+
+        return JsonResponse({'tasks': [
+            {'id': task.id, 'status': task.status,
+             'status_display': task.get_status_display()}
+            for task in tasks
+        ]})
+
+
+def parse_range_header(header, size):
+    """ Parse HTTP Range header with one byte range
+    :param header: value of Range header
+    :param size: file size
+    :return: tuple (first byte, last byte), None if header is not
+    supported or ValueError if range is not satisfiable
+    """
+    match = re.match(r'^bytes=(\d*)-(\d*)$', header.strip())
+    if not match or match.groups() == ('', ''):
+        # several ranges or other units, whole file is sent
+        return None
+
+    first, last = match.groups()
+    if not first:
+        # suffix range: the last bytes
+        first, last = max(size - int(last), 0), size - 1
+    else:
+        first = int(first)
+        last = min(int(last), size - 1) if last else size - 1
+
+    if first > last or first >= size:
+        raise ValueError('Range is not satisfiable')
+
+    return first, last
+
+
+def read_file_range(file, first, length, chunk_size=64 * 1024):
+    """ Read part of file by chunks
+    :return: generator of bytes
+    """
+    try:
+        file.seek(first)
+        while length > 0:
+            chunk = file.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+class AttachmentDownloadView(TaskViewPermitMixin, View):
+    """ Download of task attachment. The file is sent by front-end server
+    if settings.TASK_ATTACHMENT_SENDFILE is set, otherwise it is streamed
+    by chunks. Single byte range requests and ETag of file content are
+    supported.
+    """
+    attachment = None
+
+    def get_attachment(self):
+        if not self.attachment:
+            self.attachment = get_object_or_404(
+                TaskAttachment.objects.select_related('task'),
+                pk=self.kwargs['pk']
+            )
+
+        return self.attachment
+
+    def get_task(self):
+        return self.get_attachment().task
+
+    @staticmethod
+    def get_etag(attachment, stat):
+        name = os.path.basename(attachment.attachment.name)
+        if re.match(r'^[0-9a-f]{64}$', name):
+            # content addressed file
+            return '"{0}"'.format(name)
+
+        return '"{0:x}-{1:x}"'.format(int(stat.st_mtime), stat.st_size)
+
+    def get(self, request, *args, **kwargs):
+        attachment = self.get_attachment()
+        try:
+            path = attachment.attachment.path
+            stat = os.stat(path)
+        except OSError:
+            raise Http404('File of attachment does not exist')
+
+        file_etag = self.get_etag(attachment, stat)
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+        if if_none_match.strip() == '*' or file_etag in [
+                value.strip() for value in if_none_match.split(',')]:
+            response = HttpResponseNotModified()
+            response['ETag'] = file_etag
+            return response
+
+        response = self.get_file_response(request, path, stat.st_size,
+                                          file_etag)
+        content_type, encoding = mimetypes.guess_type(attachment.file_name())
+        response['Content-Type'] = content_type or 'application/octet-stream'
+        response['Content-Disposition'] = "inline; filename*=UTF-8''{0}"\
+            .format(urlquote(attachment.file_name()))
+        response['ETag'] = file_etag
+        response['Accept-Ranges'] = 'bytes'
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        # permission is checked on every request
+        patch_cache_control(response, private=True, no_cache=True)
+
+        return response
+
+    @staticmethod
+    def get_file_response(request, path, size, file_etag):
+        """ Response with whole file or with requested range of it
+        :return: HttpResponse object
+        """
+        byte_range = None
+        range_header = request.META.get('HTTP_RANGE')
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if range_header and (not if_range or if_range == file_etag):
+            try:
+                byte_range = parse_range_header(range_header, size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = 'bytes */{0}'.format(size)
+                return response
+
+        sendfile = settings.TASK_ATTACHMENT_SENDFILE
+        if sendfile:
+            # front-end server sends the file and handles range itself
+            response = HttpResponse()
+            if sendfile == 'X-Accel-Redirect':
+                response[sendfile] = settings.TASK_ATTACHMENT_ACCEL_PREFIX + \
+                    os.path.relpath(path, settings.MEDIA_ROOT)
+            else:
+                response[sendfile] = path
+            return response
+
+        first, last = byte_range or (0, size - 1)
+        response = StreamingHttpResponse(
+            read_file_range(open(path, 'rb'), first, last - first + 1)
+        )
+        response['Content-Length'] = last - first + 1
+        if byte_range:
+            response.status_code = 206
+            response['Content-Range'] = 'bytes {0}-{1}/{2}'.format(
+                first, last, size)
+
+        return response
+
+
+def upload_to_dict(upload):
+    return {
+        'id': upload.id,
+        'url': reverse('task_management:upload', args=[upload.id]),
+        'file_name': upload.file_name,
+        'size': upload.size,
+        'received': upload.received,
+        'chunk_size': settings.TASK_ATTACHMENT_CHUNK_SIZE,
+    }
+
+
+class AttachmentUploadCreateView(TaskChangePermitMixin, View):
+    """ Start chunked upload of task attachment: POST file_name and size.
+    Chunks are sent to AttachmentUploadChunkView.
+    """
+    model = Task
+
+    def post(self, request, *args, **kwargs):
+        form = AttachmentUploadForm(request.POST)
+        if not form.is_valid():
+            return JsonResponse(form.errors, status=400)
+
+        form.instance.task = self.get_task()
+        form.instance.user = request.user
+        upload = form.save()
+
+        return JsonResponse(upload_to_dict(upload), status=201)
+
+
+class AttachmentUploadMixin(LoginRequiredMixin):
+    """ Mixin for views of upload, only user who started upload can
+    continue it
+    """
+    def get_upload(self):
+        return get_object_or_404(AttachmentUpload, id=self.kwargs['upload_id'],
+                                 user=self.request.user)
+
+
+class AttachmentUploadView(AttachmentUploadMixin, View):
+    """ State of chunked upload for resuming it (GET) and cancel of upload
+    (DELETE)
+    """
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(upload_to_dict(self.get_upload()))
+
+    def delete(self, request, *args, **kwargs):
+        delete_upload(self.get_upload())
+
+        return HttpResponse(status=204)
+
+
+class AttachmentUploadChunkView(AttachmentUploadMixin, View):
+    """ Receive chunk of upload: PUT raw chunk data. Chunk data is written
+    to disk as it is read from request.
+    """
+    def put(self, request, *args, **kwargs):
+        try:
+            upload = append_chunk(self.kwargs['upload_id'], request.user,
+                                  int(self.kwargs['index']), request)
+        except AttachmentUpload.DoesNotExist:
+            raise Http404('Upload does not exist')
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        return JsonResponse(upload_to_dict(upload))
+
+
+class AttachmentUploadFinishView(AttachmentUploadMixin, View):
+    """ Save received file as task attachment """
+    def post(self, request, *args, **kwargs):
+        upload = self.get_upload()
+        if not get_task_permissions(request, upload.task).change:
+            return HttpResponseForbidden()
+
+        try:
+            attachment = finish_upload(upload)
+        except AttachmentUpload.DoesNotExist:
+            raise Http404('Upload does not exist')
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        TaskActionLog.log(request.user, 'add attachments to task',
+                          attachment.task)
+        send_message(request.user, 'add attachments to task',
+                     attachment.task)
+
+        return JsonResponse({
+            'id': attachment.id,
+            'file_name': attachment.file_name(),
+            'url': attachment.get_absolute_url(),
+        }, status=201)
+
+
 class ActionLogListView(LoginRequiredMixin, ListView):
-    """ View for display the list of action logs """
+    """ View for display the list of action logs. Pages are selected by id
+    of the last shown entry (?before=id), so deep pages are not slower than
+    the first one and the log is not counted.
+    """
     model = TaskActionLog
     template_name = 'task_management/action_log_list.html'
-    paginate_by = 25
+    page_size = 25
+    title = 'Action log list'
+
+    def get_log_queryset(self):
+        return TaskActionLog.objects.all()
+
+    def get_before(self):
+        try:
+            return int(self.request.GET['before'])
+        except (KeyError, ValueError):
+            return None
 
     def get_queryset(self):
-        return TaskActionLog.objects.select_related('actor').all()
+        queryset = self.get_log_queryset().order_by('-id')
+        before = self.get_before()
+        if before is not None:
+            queryset = queryset.filter(id__lt=before)
+
+        # one entry more to know if there is the next page, action goals are
+        # loaded by one query for every content type
+        object_list = list(
+            queryset.select_related('actor')
+            .prefetch_related('action_goal')[:self.page_size + 1]
+        )
+        if len(object_list) <= self.page_size:
+            # continue in archive of old entries
+            if object_list:
+                before = object_list[-1].id
+            object_list += self.get_archive_entries(
+                before, self.page_size + 1 - len(object_list)
+            )
+
+        return object_list
 
+    def get_archive_entries(self, before, limit):
+        return ActionLogArchive().get_entries(before, limit)
+
+    def get_context_data(self, **kwargs):
+        object_list = self.object_list[:self.page_size]
+        has_next = len(self.object_list) > self.page_size
+        kwargs.setdefault('title', self.title)
+        kwargs.update({
+            'object_list': object_list,
+            'is_first_page': self.get_before() is None,
+            'next_before': object_list[-1].id if has_next else None,
+        })
+
+        return super(ActionLogListView, self).get_context_data(**kwargs)
+
+
+class TaskHistoryView(TaskViewPermitMixin, ActionLogListView):
+    """ View for display action log of task, its comments and owners chain
+    """
+    def get_task(self):
+        if not self.task:
+            self.task = identity_map.get_object_or_404(
+                Task, pk=self.kwargs['pk']
+            )
+
+        return self.task
+
+    def get_goals(self):
+        """ Action goals of task history: task, its comments and its owners
+        chain. Entries of deleted comments are not shown.
+        :return: list of tuples (model, ids), ids of comments and chain
+        are querysets
+        """
+        task = self.get_task()
+
+        return [
+            (Task, [task.pk]),
+            (TaskComment, TaskComment.objects.filter(task=task)
+             .values_list('id', flat=True)),
+            (TaskAssignedUser, TaskAssignedUser.objects.filter(task=task)
+             .values_list('id', flat=True)),
+        ]
+
+    def get_log_queryset(self):
+        condition = Q()
+        for model, ids in self.get_goals():
+            condition |= Q(
+                content_type=ContentType.objects.get_for_model(model),
+                object_id__in=ids
+            )
+
+        return TaskActionLog.objects.filter(condition)
+
+    def get_archive_entries(self, before, limit):
+        goals = {
+            (ContentType.objects.get_for_model(model).id, object_id)
+            for model, ids in self.get_goals() for object_id in ids
+        }
+
+        return ActionLogArchive().get_entries(
+            before, limit, since=self.get_task().time_create, goals=goals
+        )
 
+    def get_context_data(self, **kwargs):
+        kwargs['title'] = 'History of task {0}'.format(self.get_task())
+
+        return super(TaskHistoryView, self).get_context_data(**kwargs)
+
+
+class ActorHistoryView(ActionLogListView):
+    """ View for display action log of user """
+    def get_log_queryset(self):
+        return TaskActionLog.objects.filter(actor_id=self.kwargs['pk'])
+
+    def get_actor(self):
+        if not hasattr(self, 'actor'):
+            self.actor = get_object_or_404(User, pk=self.kwargs['pk'])
+
+        return self.actor
+
+    def get_archive_entries(self, before, limit):
+        actor = self.get_actor()
+
+        return ActionLogArchive().get_entries(
+            before, limit, since=actor.date_joined, actor_id=actor.id
+        )
+
+    def get_context_data(self, **kwargs):
+        kwargs['title'] = 'Actions of {0}'.format(self.get_actor())
+
+        return super(ActorHistoryView, self).get_context_data(**kwargs)
+
+
+class ExportView(UserPassesTestMixin, View):
+    """ Stream table in CSV or JSONL format to staff users. Filters are
+    query parameters of ExportFilterForm.
+    """
+    raise_exception = True
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request, name, export_format):
+        form = ExportFilterForm(request.GET)
+        if not form.is_valid():
+            return JsonResponse(form.errors, status=400)
+
+        content_type = FORMATS[export_format][1]
+        response = StreamingHttpResponse(
+            export(name, export_format, **form.cleaned_data),
+            content_type=content_type
+        )
+        response['Content-Disposition'] = \
+            'attachment; filename="{0}.{1}"'.format(name, export_format)
+
+        return response
+
+
+def get_notifications_etag(request):
+    """ ETag of unread notifications list, changes with any notification of
+    user
+    :param request:
+    :return: etag string or None
+    """
+    if not request.user.is_authenticated():
+        return None
+
+    state = get_unread_notifications_state(request.user)
+
+    return '{0}-{1}'.format(state['version'], request.GET.get('max', ''))
+
+
+@cache_control(private=True, no_cache=True)
+@etag(get_notifications_etag)
 def live_unread_notification_list(request):
     """ Overriding notifications.views.live_unread_notification_list.
-    Adding target_url in params.
+    Adding target_url in params. Actors and targets are fetched by one query
+    per content type, unread count is cached. If inbox is not changed
+    returns 304.
     :param request:
     :return:
     """
@@ -306,21 +1019,123 @@ def live_unread_notification_list(request):
     except ValueError:
         num_to_fetch = 5  # If casting to an int fails, just make it 5.
 
-    unread_list = []
-
-    for n in request.user.notifications.unread()[0:num_to_fetch]:
-        struct = model_to_dict(n)
-        struct['slug'] = n.slug
-        if n.actor:
-            struct['actor'] = str(n.actor)
-        if n.target:
-            struct['target'] = str(n.target)
-            struct['target_url'] = n.target.get_absolute_url()
-        if n.action_object:
-            struct['action_object'] = str(n.action_object)
-        unread_list.append(struct)
+    notifications = request.user.notifications.unread()\
+        .prefetch_related('actor', 'target', 'action_object')
     data = {
-        'unread_count': request.user.notifications.unread().count(),
-        'unread_list': unread_list,
+        'unread_count': get_unread_notifications_state(request.user)['count'],
+        'unread_list': [notification_to_dict(n)
+                        for n in notifications[0:num_to_fetch]],
     }
     return JsonResponse(data)
+
+
+def notification_to_dict(n):
+    """ Notification data for javascript client.
+    :param n: Notification object
+    :return: dict
+    """
+    struct = model_to_dict(n)
+    struct['slug'] = n.slug
+    if n.actor:
+        struct['actor'] = str(n.actor)
+    if n.target:
+        struct['target'] = str(n.target)
+        struct['target_url'] = n.target.get_absolute_url()
+    if n.action_object:
+        struct['action_object'] = str(n.action_object)
+
+    return struct
+
+
+def get_notifications_delta(user, cursor):
+    """ Get unread notifications newer than cursor.
+    :param user: User object
+    :param cursor: id of the last notification received by client
+    :return: dict with new cursor, unread count and list of notifications
+    """
+    notifications = user.notifications.unread().filter(id__gt=cursor)\
+        .order_by('id').prefetch_related('actor', 'target', 'action_object')
+    notifications = [notification_to_dict(n) for n in notifications[:100]]
+    if notifications:
+        cursor = notifications[-1]['id']
+
+    return {
+        'cursor': cursor,
+        'unread_count': get_unread_notifications_state(user)['count'],
+        'notifications': notifications,
+    }
+
+
+def get_cursor(request):
+    try:
+        # Last-Event-ID is sent by browser when stream reconnects
+        return int(request.META.get('HTTP_LAST_EVENT_ID') or
+                   request.GET.get('cursor') or 0)
+    except ValueError:
+        return 0
+
+
+@login_required
+def live_notification_delta(request):
+    """ Unread notifications newer than ?cursor=<notification id> """
+    return JsonResponse(get_notifications_delta(request.user,
+                                                get_cursor(request)))
+
+
+@login_required
+def live_notification_stream(request):
+    """ Stream of new notifications (Server-Sent Events). Every event
+    contains data of live_notification_delta, event id is cursor.
+    Stream is closed after TASK_NOTIFICATIONS_STREAM_TIMEOUT seconds and
+    client reconnects with Last-Event-ID header.
+    """
+    user = request.user
+
+    def events():
+        cursor = get_cursor(request)
+        subscription = get_pubsub().subscribe(
+            get_notifications_channel(user.pk)
+        )
+        try:
+            yield 'retry: {0}\n\n'.format(
+                settings.TASK_NOTIFICATIONS_STREAM_RETRY * 1000
+            )
+            deadline = time.time() + settings.TASK_NOTIFICATIONS_STREAM_TIMEOUT
+            message = True  # send notifications created before subscription
+            while time.time() < deadline:
+                if not message:
+                    # keep connection alive
+                    yield ': ping\n\n'
+                else:
+                    delta = get_notifications_delta(user, cursor)
+                    if delta['notifications']:
+                        cursor = delta['cursor']
+                        yield 'id: {0}\ndata: {1}\n\n'.format(
+                            cursor, json.dumps(delta, cls=DjangoJSONEncoder)
+                        )
+
+                message = subscription.get(
+                    timeout=settings.TASK_NOTIFICATIONS_STREAM_PING
+                )
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(events(),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+
+    return response
+
+
+@login_required
+def mark_all_as_read(request):
+    """ Overriding notifications.views.mark_all_as_read.
+    Notifications are updated without signals, so clear unread state here.
+    :param request:
+    :return:
+    """
+    response = notifications_views.mark_all_as_read(request)
+    clear_unread_notifications_state([request.user.pk])
+
+    return response